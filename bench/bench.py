@@ -0,0 +1,636 @@
+#!/usr/bin/env python
+'''benchmarks for yel commands
+
+run every command registered by load_commands with inputs of increasing
+size, the cold start of the @name entry points and some typical pipelines,
+save the results as a json baseline and compare them with a previous one
+
+    python bench/bench.py run -o baseline.json
+    python bench/bench.py run -s 10,1000,10000000 -c sort,s.upper
+    python bench/bench.py run -o new.json --baseline baseline.json
+    python bench/bench.py compare baseline.json new.json -t 0.2
+
+compare exits with status 1 if some timing is slower than the baseline by
+more than the threshold'''
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BIN = os.path.join(ROOT, "bin")
+
+sys.path.insert(0, os.path.join(ROOT, "yel"))
+
+import commands
+import columnar
+from command import Result, Stream
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000)
+ALL_SIZES = (10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+DEFAULT_REPEAT = 3
+DEFAULT_BUDGET = 5.0
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_MIN_TIME = 0.001
+DEFAULT_PIPELINE_ROWS = 100000
+COLD_START_RUNS = 10
+
+# stages of the pipelines in the trace files
+TRACE_STAGES = ("from-csv", "groupby", "to-csv")
+
+# pipelines per trace in the trace files
+TRACE_PIPELINES = 10
+
+# file system commands walk a tree with one file per item, bigger trees
+# measure the disk more than the command
+MAX_TREE_SIZE = 10000
+
+WORDS = ("alpha", "beta", "gamma", "delta", "Epsilon", "zeta 42", " eta ",
+        "THETA", "iota-7", "kappa")
+
+def numbers(size):
+    '''return a list of *size* random integers'''
+    return [random.randint(0, size) for _ in xrange(size)]
+
+def strings(size):
+    '''return a list of *size* short strings'''
+    return [u"%s %d" % (random.choice(WORDS), i) for i in xrange(size)]
+
+def booleans(size):
+    '''return a list of *size* booleans'''
+    return [random.random() > 0.1 for _ in xrange(size)]
+
+def nested(size):
+    '''return a list of *size* items where some are lists'''
+    return [[i, [i]] if i % 2 else i for i in xrange(size)]
+
+def objects(size):
+    '''return a list of *size* objects with a few fields'''
+    return [{"id": i, "name": random.choice(WORDS), "g": i % 100,
+        "v": random.random(), "tags": ["a", "b"]} for i in xrange(size)]
+
+def columns(size):
+    '''return *size* objects in columnar form'''
+    return columnar.to_columns(objects(size))
+
+def csv_text(size):
+    '''return csv text with a header and *size* rows'''
+    lines = ["id,name,g,v"]
+    lines.extend("%d,%s,%d,%f" % (i, random.choice(WORDS).strip(), i % 100,
+        random.random()) for i in xrange(size))
+    return "\n".join(lines) + "\n"
+
+def text(size):
+    '''return text with *size* lines'''
+    return "\n".join(strings(size)).encode("utf-8") + "\n"
+
+def nothing(size):
+    '''for commands that don't read input'''
+    return None
+
+INPUTS = {
+    "numbers": numbers,
+    "strings": strings,
+    "booleans": booleans,
+    "nested": nested,
+    "objects": objects,
+    "columns": columns,
+    "csv": csv_text,
+    "text": text,
+    "none": nothing,
+    "tree": nothing,
+    "files": nothing,
+    "trace": nothing
+}
+
+# command name to (input kind, command line args), args can contain
+# {size}, {path}, {index}, {left}, {right} and {trace}, commands not listed
+# get a list of numbers without args
+CASES = {
+    "all": ("booleans", []),
+    "any": ("booleans", []),
+    "not": ("booleans", []),
+    "append": ("numbers", ["1", "2", "3"]),
+    "columns": ("objects", []),
+    "rows": ("columns", []),
+    "difference": ("files", ["-i", "{left}", "{right}"]),
+    "intersect": ("files", ["-i", "{left}", "{right}"]),
+    "union": ("files", ["-i", "{left}", "{right}"]),
+    "hjoin": ("files", ["-l", "{left}", "-r", "{right}", "-o", "id"]),
+    "du": ("tree", ["{path}"]),
+    "dupes": ("tree", ["{path}"]),
+    "fs": ("tree", ["snapshot", "{path}", "-i", "{index}"]),
+    "watch": ("tree", ["{path}", "-t", "0.01"]),
+    "env": ("none", ["get", "HOME"]),
+    "filter": ("objects", ["-t", "number", "string"]),
+    "keep": ("objects", ["-t", "number", "string"]),
+    "flatten": ("nested", []),
+    "from-csv": ("csv", ["-i"]),
+    "from-lines": ("text", []),
+    "to-csv": ("objects", []),
+    "get": ("objects", ["name", "-e"]),
+    "pluck": ("objects", ["name"]),
+    "groupby": ("objects", ["-k", "g", "-a", "count,sum:v,max:id"]),
+    "is": ("numbers", ["-t", "number"]),
+    "item": ("numbers", ["-i", "0"]),
+    "join": ("strings", []),
+    "map": ("strings", ["-c", "s.upper"]),
+    "range": ("none", ["{size}"]),
+    "render": ("none", ["-t", "{{name}}", "-name", "yel"]),
+    "run": ("numbers", ['{{"stages": [{{"id": "s", "command": "sort", '
+        '"input": "$stdin"}}, {{"id": "n", "command": "size", '
+        '"input": "$stdin"}}, '
+        '{{"id": "r", "command": "echo", "from": ["s", "n"]}}]}}']),
+    "s.contains": ("strings", ["-a", "eta"]),
+    "s.endswith": ("strings", ["-a", '"7"']),
+    "s.find": ("strings", ["-a", "eta"]),
+    "s.findall": ("strings", ["-a", "[0-9]+"]),
+    "s.join": ("strings", ["-a", "-"]),
+    "s.lfind": ("strings", ["-a", "eta"]),
+    "s.ljustify": ("strings", ["-a", "20"]),
+    "s.match": ("strings", ["-a", "alpha"]),
+    "s.replace": ("strings", ["-a", "a", "o"]),
+    "s.rfind": ("strings", ["-a", "eta"]),
+    "s.rjustify": ("strings", ["-a", "20"]),
+    "s.search": ("strings", ["-a", "[0-9]+"]),
+    "s.split": ("strings", []),
+    "s.startswith": ("strings", ["-a", "al"]),
+    "s.sub": ("strings", ["-a", "[0-9]+", "N"]),
+    "slice": ("numbers", ["-f", "1", "-t", "-1"]),
+    "trace": ("trace", ["report", "-f", "{trace}"])
+}
+
+STRING_COMMANDS_KIND = "strings"
+
+# @name is replaced by the entry point run with the current interpreter
+PIPELINES = {
+    "csv-groupby-to-csv": ("@from-csv -i < {csv} | "
+        "@groupby -k g -a count,sum:v | @to-csv"),
+    "pluck-upper": "@pluck name < {objects} | @s.upper",
+    "set-sort": "@set < {numbers} | @sort",
+    "columns-rows": "@columns < {objects} | @rows"
+}
+
+ENTRY_POINT = re.compile(r"@([\w.-]+)")
+
+def command_classes(names=None):
+    '''return a list of (name, class) for the registered commands, once per
+    class by its short name'''
+    commands.load_commands()
+    seen = set()
+    result = []
+
+    for name, cls in sorted(commands.COMMANDS.items()):
+        if cls in seen or name != cls.SHORT:
+            continue
+
+        if names is None or name in names:
+            seen.add(cls)
+            result.append((name, cls))
+
+    return result
+
+def case_for(name):
+    '''return the (input kind, args) to benchmark command *name*'''
+    if name in CASES:
+        return CASES[name]
+    elif name.startswith("s."):
+        return (STRING_COMMANDS_KIND, [])
+    else:
+        return ("numbers", [])
+
+class Fixtures(object):
+    '''temporary files for the commands that read paths'''
+
+    def __init__(self):
+        self.root = tempfile.mkdtemp(prefix="yel-bench-")
+        self.trees = {}
+        self.files = {}
+        self.traces = {}
+
+    def tree(self, size):
+        '''return the path to a tree with *size* files'''
+        if size not in self.trees:
+            path = os.path.join(self.root, "tree-%d" % size)
+
+            for i in xrange(size):
+                directory = os.path.join(path, str(i % 32))
+
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+
+                with open(os.path.join(directory, str(i)), "w") as handle:
+                    handle.write("x" * (i % 7) * 1024)
+
+            self.trees[size] = path
+
+        return self.trees[size]
+
+    def json_file(self, name, data):
+        '''write *data* to a json file and return its path'''
+        path = os.path.join(self.root, name)
+
+        with open(path, "w") as handle:
+            json.dump(data, handle)
+
+        return path
+
+    def join_files(self, size):
+        '''return the paths of two json files of objects that half match'''
+        if size not in self.files:
+            left = objects(size)
+            right = [dict(item, id=item["id"] + size // 2) for item in left]
+            self.files[size] = (self.json_file("left-%d.json" % size, left),
+                    self.json_file("right-%d.json" % size, right))
+
+        return self.files[size]
+
+    def trace_file(self, size):
+        '''return the path to a trace file with *size* spans of pipelines
+        connected by pipes'''
+        if size not in self.traces:
+            path = os.path.join(self.root, "trace-%d.jsonl" % size)
+            stages = len(TRACE_STAGES)
+
+            with open(path, "w") as handle:
+                for i in xrange(size):
+                    pipeline, stage = divmod(i, stages)
+                    start = pipeline + stage * 0.1
+                    span = {
+                        "trace_id": "trace-%d" % (pipeline // TRACE_PIPELINES),
+                        "span_id": "span-%d" % i,
+                        "parent_id": None,
+                        "command": TRACE_STAGES[stage],
+                        "pid": i,
+                        "start": start,
+                        "end": start + 0.5,
+                        "duration": 0.5,
+                        "status": Result.OK,
+                        "args_bytes": 10,
+                        "input_bytes": 1024 * (stages - stage),
+                        "output_bytes": 1024 * (stages - stage - 1),
+                        "stdin": "pipe:%d" % i if stage else "/dev/tty",
+                        "stdout": ("pipe:%d" % (i + 1)
+                            if stage < stages - 1 else "/dev/tty")
+                    }
+                    handle.write(json.dumps(span) + "\n")
+
+            self.traces[size] = path
+
+        return self.traces[size]
+
+    def params(self, kind, size):
+        '''return the placeholders for the args of a command'''
+        params = {"size": str(size)}
+
+        if kind == "tree":
+            params["path"] = self.tree(size)
+            params["index"] = os.path.join(self.root, "fs-%d.index" % size)
+        elif kind == "files":
+            params["left"], params["right"] = self.join_files(size)
+        elif kind == "trace":
+            params["trace"] = self.trace_file(size)
+
+        return params
+
+    def close(self):
+        '''remove the temporary files'''
+        shutil.rmtree(self.root, True)
+
+class NullOutput(object):
+    '''file like object that discards what is written'''
+
+    def write(self, data):
+        '''discard *data*'''
+        pass
+
+    def flush(self):
+        '''nothing to flush'''
+        pass
+
+def emit(result, out):
+    '''serialize the command *result* like the entry point does'''
+    if isinstance(result.result, Stream):
+        result.result.write(out)
+    else:
+        out.write(json.dumps(result.result))
+
+def invoke(cls, argv, data):
+    '''invoke *cls* with the command line *argv* and input *data*, return
+    the elapsed seconds including the serialization of the result'''
+    out = NullOutput()
+    params = cls.parse_args(argv)
+    request = dict(name=cls.SHORT, args=params, vars=dict(os.environ))
+
+    if data is not None:
+        request["input"] = data
+
+    start = time.time()
+    result = cls.invoke(request)
+
+    if result.status == Result.OK:
+        emit(result, out)
+
+    elapsed = time.time() - start
+
+    if result.status != Result.OK:
+        raise ValueError("%s failed: %s" % (cls.SHORT, result.reason))
+
+    return elapsed
+
+def median(values):
+    '''return the median of *values*'''
+    values = sorted(values)
+    middle = len(values) // 2
+
+    if len(values) % 2:
+        return values[middle]
+    else:
+        return (values[middle - 1] + values[middle]) / 2.0
+
+def summarize(size, times):
+    '''return the measures for the *times* of a command on *size* items'''
+    mid = median(times)
+
+    return {
+        "size": size,
+        "runs": len(times),
+        "min": min(times),
+        "median": mid,
+        "max": max(times),
+        "throughput": size / mid if mid > 0 else None
+    }
+
+def bench_command(name, cls, sizes, repeat, budget, fixtures):
+    '''return the measures of command *name* for each size'''
+    kind, args = case_for(name)
+    generate = INPUTS[kind]
+    results = {}
+    over_budget = False
+
+    for size in sizes:
+        if kind == "tree" and size > MAX_TREE_SIZE:
+            results[str(size)] = {"size": size, "skipped": "tree size"}
+            continue
+        elif over_budget:
+            results[str(size)] = {"size": size, "skipped": "budget"}
+            continue
+
+        params = fixtures.params(kind, size)
+        argv = [arg.format(**params) for arg in args]
+        times = []
+
+        try:
+            for _ in xrange(repeat):
+                # commands can modify their input, generate it each time
+                times.append(invoke(cls, argv, generate(size)))
+        except Exception as error:
+            results[str(size)] = {"size": size, "error": str(error)}
+            break
+
+        results[str(size)] = summarize(size, times)
+        over_budget = sum(times) > budget
+
+    return results
+
+def run_process(argv, shell=False):
+    '''run a process discarding its output, return the elapsed seconds'''
+    with open(os.devnull, "w") as devnull:
+        start = time.time()
+        status = subprocess.call(argv, stdout=devnull, stderr=devnull,
+                shell=shell)
+        elapsed = time.time() - start
+
+    if status not in (0, Result.OK % 256):
+        raise ValueError("%s exited with status %d" % (argv, status))
+
+    return elapsed
+
+def bench_cold_start(runs=COLD_START_RUNS):
+    '''return the startup time of the interpreter and of an @name entry
+    point'''
+    interpreter = [run_process([sys.executable, "-c", "pass"])
+            for _ in xrange(runs)]
+    entry_point = [run_process([sys.executable, os.path.join(BIN, "@echo"),
+        "1"]) for _ in xrange(runs)]
+
+    return {
+        "interpreter": summarize(1, interpreter),
+        "@echo": summarize(1, entry_point),
+        "overhead": median(entry_point) - median(interpreter)
+    }
+
+def shell_command(pipeline, params):
+    '''return the shell command for *pipeline*'''
+    command = pipeline.format(**params)
+
+    return ENTRY_POINT.sub(lambda match: "%s %s" % (sys.executable,
+        os.path.join(BIN, "@" + match.group(1))), command)
+
+def bench_pipelines(rows, repeat, fixtures):
+    '''return the measures of the PIPELINES on *rows* items'''
+    params = {
+        "csv": os.path.join(fixtures.root, "pipeline.csv"),
+        "objects": fixtures.json_file("pipeline-objects.json",
+            objects(rows)),
+        "numbers": fixtures.json_file("pipeline-numbers.json",
+            numbers(rows))
+    }
+
+    with open(params["csv"], "w") as handle:
+        handle.write(csv_text(rows))
+
+    results = {}
+
+    for name, pipeline in sorted(PIPELINES.items()):
+        command = shell_command(pipeline, params)
+        times = [run_process(command, True) for _ in xrange(repeat)]
+        results[name] = summarize(rows, times)
+
+    return results
+
+def run(options):
+    '''run the benchmarks and return the results'''
+    if options.sizes:
+        sizes = [int(size) for size in options.sizes.split(",")]
+    elif options.all_sizes:
+        sizes = list(ALL_SIZES)
+    else:
+        sizes = list(DEFAULT_SIZES)
+
+    names = options.commands.split(",") if options.commands else None
+    fixtures = Fixtures()
+    random.seed(options.seed)
+
+    results = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": sizes,
+            "repeat": options.repeat
+        },
+        "commands": {}
+    }
+
+    try:
+        for name, cls in command_classes(names):
+            log("%s" % name)
+            results["commands"][name] = bench_command(name, cls, sizes,
+                    options.repeat, options.budget, fixtures)
+
+        if not options.no_cold_start:
+            log("cold start")
+            results["cold_start"] = bench_cold_start()
+
+        if not options.no_pipelines:
+            log("pipelines")
+            results["pipelines"] = bench_pipelines(options.pipeline_rows,
+                    options.repeat, fixtures)
+    finally:
+        fixtures.close()
+
+    return results
+
+def timings(results):
+    '''yield (label, median) for each measure in *results*'''
+    for name, sizes in sorted(results.get("commands", {}).iteritems()):
+        for size, measure in sorted(sizes.iteritems(),
+                key=lambda pair: int(pair[0])):
+            if "median" in measure:
+                yield "%s[%s]" % (name, size), measure["median"]
+
+    for name, measure in sorted(results.get("cold_start", {}).iteritems()):
+        if isinstance(measure, dict):
+            yield "cold_start:%s" % name, measure["median"]
+
+    for name, measure in sorted(results.get("pipelines", {}).iteritems()):
+        yield "pipeline:%s" % name, measure["median"]
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD,
+        min_time=DEFAULT_MIN_TIME):
+    '''return a list of (label, baseline, current, ratio) for the timings in
+    *current* that are slower than in *baseline* by more than *threshold*,
+    timings under *min_time* seconds in both are considered noise'''
+    base = dict(timings(baseline))
+    regressions = []
+
+    for label, value in timings(current):
+        previous = base.get(label)
+
+        if previous is None or max(previous, value) < min_time:
+            continue
+
+        ratio = value / previous if previous > 0 else float("inf")
+
+        if ratio > 1 + threshold:
+            regressions.append((label, previous, value, ratio))
+
+    return regressions
+
+def report(regressions, threshold):
+    '''print the *regressions* and return the exit status'''
+    if not regressions:
+        log("no regressions over %d%%" % (threshold * 100))
+        return 0
+
+    log("%d regressions over %d%%:" % (len(regressions), threshold * 100))
+
+    for label, previous, value, ratio in regressions:
+        log("  %-40s %10.4fs -> %10.4fs (%.2fx)" % (label, previous, value,
+            ratio))
+
+    return 1
+
+def log(message):
+    '''write *message* to stderr'''
+    sys.stderr.write(message + "\n")
+    sys.stderr.flush()
+
+def load(path):
+    '''load a json results file'''
+    with open(path) as handle:
+        return json.load(handle)
+
+def save(results, path):
+    '''save *results* to *path* or to stdout if it's None'''
+    if path is None:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        with open(path, "w") as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+
+def parse_args(argv):
+    '''parse the command line'''
+    parser = argparse.ArgumentParser(description="yel benchmarks")
+    subparsers = parser.add_subparsers(dest="action")
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("-o", "--output", help="results file")
+    run_parser.add_argument("-c", "--commands",
+            help="comma separated command names, default all")
+    run_parser.add_argument("-s", "--sizes",
+            help="comma separated input sizes")
+    run_parser.add_argument("-a", "--all-sizes", action="store_true",
+            help="use sizes from 10 to 10M")
+    run_parser.add_argument("-r", "--repeat", type=int,
+            default=DEFAULT_REPEAT)
+    run_parser.add_argument("-b", "--budget", type=float,
+            default=DEFAULT_BUDGET,
+            help="seconds per size after which bigger sizes are skipped")
+    run_parser.add_argument("-p", "--pipeline-rows", type=int,
+            default=DEFAULT_PIPELINE_ROWS)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--no-cold-start", action="store_true")
+    run_parser.add_argument("--no-pipelines", action="store_true")
+    run_parser.add_argument("--baseline",
+            help="baseline results to compare with")
+    run_parser.add_argument("-t", "--threshold", type=float,
+            default=DEFAULT_THRESHOLD)
+    run_parser.add_argument("-m", "--min-time", type=float,
+            default=DEFAULT_MIN_TIME)
+
+    compare_parser = subparsers.add_parser("compare",
+            help="compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("-t", "--threshold", type=float,
+            default=DEFAULT_THRESHOLD)
+    compare_parser.add_argument("-m", "--min-time", type=float,
+            default=DEFAULT_MIN_TIME)
+
+    return parser.parse_args(argv)
+
+def main(argv):
+    '''benchmarks entry point'''
+    options = parse_args(argv)
+
+    if options.action == "run":
+        results = run(options)
+        save(results, options.output)
+
+        if options.baseline is None:
+            return 0
+
+        baseline = load(options.baseline)
+        current = results
+    else:
+        baseline = load(options.baseline)
+        current = load(options.current)
+
+    regressions = compare(baseline, current, options.threshold,
+            options.min_time)
+
+    return report(regressions, options.threshold)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
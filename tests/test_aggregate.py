@@ -0,0 +1,93 @@
+'''tests for the spilling hash aggregation'''
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "yel"))
+
+import api
+import aggregate
+
+from command import Result
+
+ITEMS = [{"g": i % 7, "h": i % 2, "v": i} for i in xrange(100)]
+
+AGGS = ["count", "sum:v", "min:v", "max:v", "mean:v"]
+
+def group(items, max_groups, keys=("g",), partial=False):
+    '''return the records of grouping *items* sorted by key'''
+    grouper = aggregate.GroupBy(list(keys), AGGS, max_groups)
+
+    for item in items:
+        grouper.add(item)
+
+    return sort_records(grouper.results(partial))
+
+def sort_records(records):
+    '''return *records* sorted so runs can be compared'''
+    return sorted(records, key=lambda record: (record.get("key"),
+        record.get("g"), record.get("h")))
+
+class GroupByTest(unittest.TestCase):
+    '''tests for aggregate.GroupBy'''
+
+    def test_in_memory(self):
+        records = group(ITEMS, 100)
+
+        self.assertEqual(len(records), 7)
+        self.assertEqual(records[0], {"g": 0, "count": 15,
+            "sum:v": sum(range(0, 100, 7)), "min:v": 0, "max:v": 98,
+            "mean:v": sum(range(0, 100, 7)) / 15.0})
+
+    def test_spill_matches_in_memory(self):
+        for keys in (("g",), ("g", "h")):
+            expected = group(ITEMS, 100, keys)
+
+            for max_groups in (1, 2, 5):
+                self.assertEqual(group(ITEMS, max_groups, keys), expected)
+
+    def test_spill_removes_partitions(self):
+        grouper = aggregate.GroupBy(["g"], AGGS, 1)
+
+        for item in ITEMS:
+            grouper.add(item)
+
+        tmp_dir = grouper.tmp_dir
+        self.assertTrue(os.path.isdir(tmp_dir))
+
+        list(grouper.results())
+        self.assertFalse(os.path.exists(tmp_dir))
+
+    def test_merge_partials(self):
+        grouper = aggregate.GroupBy(["g"], AGGS, 2)
+
+        for items in (ITEMS[:30], ITEMS[30:]):
+            for record in group(items, 3, partial=True):
+                grouper.add_partial(record)
+
+        self.assertEqual(sort_records(grouper.results()), group(ITEMS, 100))
+
+    def test_unknown_aggregation(self):
+        self.assertRaises(ValueError, aggregate.GroupBy, ["g"], ["median:v"])
+
+class GroupByCommandTest(unittest.TestCase):
+    '''tests for the groupby command'''
+
+    def test_spill_matches_in_memory(self):
+        args = ["-k", "g", "-a", ",".join(AGGS)]
+        expected = api.run("groupby", args, input=ITEMS)
+        spilled = api.run("groupby", args + ["-m", "2"], input=ITEMS)
+
+        self.assertEqual(expected.status, Result.OK)
+        self.assertEqual(sort_records(spilled.result),
+                sort_records(expected.result))
+
+    def test_unknown_aggregation(self):
+        result = api.run("groupby", ["-k", "g", "-a", "median:v"],
+                input=ITEMS)
+
+        self.assertEqual(result.status, Result.BAD_REQUEST)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+'''tests for running commands as a library'''
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "yel"))
+
+import api
+
+from command import Result
+
+class RunTest(unittest.TestCase):
+    '''tests for api.run'''
+
+    def test_run(self):
+        result = api.run("sort", input=[3, 1, 2])
+
+        self.assertEqual(result.status, Result.OK)
+        self.assertEqual(result.result, [1, 2, 3])
+
+    def test_input_not_modified(self):
+        items = [3, 1, 2]
+
+        for name, args in (("sort", None), ("reverse", None),
+                ("shuffle", None), ("append", ["4"])):
+            result = api.run(name, args, input=items)
+
+            self.assertEqual(result.status, Result.OK, name)
+            self.assertEqual(items, [3, 1, 2], name)
+
+    def test_not_found(self):
+        self.assertEqual(api.run("nope").status, Result.NOT_FOUND)
+
+if __name__ == "__main__":
+    unittest.main()
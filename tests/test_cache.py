@@ -0,0 +1,128 @@
+'''tests for the result cache'''
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from StringIO import StringIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, os.path.join(ROOT, "yel"))
+
+import cache
+
+def run_command(cache_dir, args, input_):
+    '''run the command in *args* with the cache at *cache_dir* in another
+    process with *input_* as stdin, return its output'''
+    env = dict(os.environ, YEL_CACHE=cache_dir)
+    process = subprocess.Popen([sys.executable,
+        os.path.join(ROOT, "bin", "@" + args[0])] + args[1:], env=env,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    out, _ = process.communicate(input_)
+
+    return out
+
+def store(lookup, output):
+    '''store *output* as the output of *lookup*'''
+    entry = lookup.entry()
+    entry.tee(StringIO()).write(output)
+    entry.commit()
+
+class LookupTest(unittest.TestCase):
+    '''tests for cache.Lookup and cache.ResultCache'''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = cache.ResultCache(self.directory, "1m")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def lookup(self, input_, args=None):
+        '''return a Lookup for sort with *args* on *input_*'''
+        return cache.Lookup("sort", args or {}, StringIO(input_), self.cache)
+
+    def test_miss_then_hit(self):
+        lookup = self.lookup("[2, 1]")
+        self.assertEqual(lookup.stream.read(), "[2, 1]")
+        store(lookup, "[1, 2]\n")
+
+        try:
+            self.lookup("[2, 1]").stream.read()
+        except cache.Hit as hit:
+            self.assertEqual(hit.handle.read(), "[1, 2]\n")
+        else:
+            self.fail("expected a hit")
+
+    def test_other_input_or_args_miss(self):
+        store(self.lookup("[2, 1]"), "[1, 2]\n")
+
+        self.assertEqual(self.lookup("[3, 1]").stream.read(), "[3, 1]")
+        self.assertEqual(self.lookup("[2, 1]", {"r": True}).stream.read(),
+                "[2, 1]")
+
+    def test_without_input(self):
+        store(self.lookup("ignored"), "[0, 1]\n")
+
+        self.assertEqual(self.lookup("other").get().read(), "[0, 1]\n")
+
+    def test_no_hit_once_finished(self):
+        store(self.lookup("[2, 1]"), "[1, 2]\n")
+        lookup = self.lookup("[2, 1]")
+        lookup.entry()
+
+        self.assertEqual(lookup.stream.read(), "[2, 1]")
+
+    def test_evict(self):
+        small = cache.ResultCache(self.directory, "10")
+
+        for i in xrange(3):
+            lookup = cache.Lookup("sort", {}, StringIO(str(i)), small)
+            lookup.stream.read()
+            store(lookup, "12345678\n")
+            # entries are evicted by modification time
+            os.utime(small.path(lookup.key()), (i, i))
+
+        self.assertEqual(len(small.entries()), 1)
+
+class CacheCommandTest(unittest.TestCase):
+    '''tests for commands run with YEL_CACHE set'''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def entries(self):
+        '''return the paths of the entries in the cache'''
+        return [path for _, _, path in
+                cache.ResultCache(self.directory).entries()]
+
+    def test_hit(self):
+        self.assertEqual(run_command(self.directory, ["sort"], "[2, 1]"),
+                "[1, 2]\n")
+
+        paths = self.entries()
+        self.assertEqual(len(paths), 1)
+
+        # a hit returns what's stored without running the command
+        with open(paths[0], "w") as handle:
+            handle.write("[42]\n")
+
+        self.assertEqual(run_command(self.directory, ["sort"], "[2, 1]"),
+                "[42]\n")
+        self.assertEqual(run_command(self.directory, ["sort"], "[3, 1]"),
+                "[1, 3]\n")
+        self.assertEqual(len(self.entries()), 2)
+
+    def test_non_deterministic_bypass(self):
+        self.assertEqual(run_command(self.directory, ["shuffle"], "[1]"),
+                "[1]\n")
+        self.assertEqual(self.entries(), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+'''tests for gzip input and output'''
+import os
+import sys
+import gzip
+import zlib
+import unittest
+import subprocess
+
+from StringIO import StringIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, os.path.join(ROOT, "yel"))
+
+import compress
+
+from command import Result
+
+# lines of 20 bytes so blocks of 1000 end at a line
+TEXT = "".join('{"line": %09d}\n' % i for i in xrange(2000))
+
+def gzipped(*parts):
+    '''return *parts* compressed each as a gzip member'''
+    return "".join(compress.compress_block(part, 6) for part in parts)
+
+def gunzip(data):
+    '''return *data* decompressed with the gzip module'''
+    return gzip.GzipFile(fileobj=StringIO(data)).read()
+
+def count_members(data):
+    '''return the number of gzip members in *data*'''
+    members = 0
+
+    while data:
+        decompressor = zlib.decompressobj(compress.GZIP_WBITS)
+        decompressor.decompress(data)
+        data = decompressor.unused_data
+        members += 1
+
+    return members
+
+def run_command(args, input_, **env):
+    '''run the command in *args* in another process with *env* added to the
+    environment, return its exit status and output'''
+    process = subprocess.Popen([sys.executable,
+        os.path.join(ROOT, "bin", "@" + args[0])] + args[1:],
+        env=dict(os.environ, **env), stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, _ = process.communicate(input_)
+
+    return process.returncode, out
+
+class OpenInputTest(unittest.TestCase):
+    '''tests for compress.open_input'''
+
+    def test_plain(self):
+        self.assertEqual(compress.open_input(StringIO(TEXT)).read(), TEXT)
+
+        stream = compress.open_input(StringIO("ab\ncd\n"))
+        self.assertEqual(stream.read(1), "a")
+        self.assertEqual(stream.readline(), "b\n")
+        self.assertEqual(list(stream), ["cd\n"])
+
+    def test_short(self):
+        self.assertEqual(compress.open_input(StringIO("")).read(), "")
+        self.assertEqual(compress.open_input(StringIO("1")).read(), "1")
+        self.assertEqual(compress.open_input(StringIO("\x1f")).read(), "\x1f")
+
+    def test_gzip(self):
+        stream = compress.open_input(StringIO(gzipped(TEXT)))
+
+        self.assertEqual(stream.read(), TEXT)
+
+    def test_multi_member(self):
+        data = gzipped(TEXT[:1000], "", TEXT[1000:])
+
+        self.assertEqual(compress.open_input(StringIO(data)).read(), TEXT)
+        self.assertEqual("".join(compress.decompress_chunks(data[:2],
+            StringIO(data[2:]), 7)), TEXT)
+
+    def test_gzip_lines(self):
+        stream = compress.open_input(StringIO(gzipped(TEXT[:500],
+            TEXT[500:])))
+
+        self.assertEqual(list(stream), TEXT.splitlines(True))
+
+class ParallelGzipWriterTest(unittest.TestCase):
+    '''tests for compress.ParallelGzipWriter'''
+
+    def write(self, chunks, workers, block_size):
+        '''return the output of writing *chunks*'''
+        out = StringIO()
+        writer = compress.ParallelGzipWriter(out, 6, workers, block_size)
+
+        for chunk in chunks:
+            writer.write(chunk)
+            writer.flush()
+
+        writer.close()
+
+        return out.getvalue()
+
+    def test_multi_member(self):
+        chunks = TEXT.splitlines(True)
+
+        for workers in (1, 4):
+            data = self.write(chunks, workers, 1000)
+
+            self.assertEqual(gunzip(data), TEXT)
+            self.assertEqual(compress.open_input(StringIO(data)).read(), TEXT)
+
+            # a member for each block
+            self.assertEqual(count_members(data), len(TEXT) // 1000)
+
+    def test_empty(self):
+        self.assertEqual(gunzip(self.write([], 2, 1000)), "")
+
+    def test_one_block(self):
+        self.assertEqual(gunzip(self.write([TEXT], 2, len(TEXT) * 2)), TEXT)
+
+class CompressCommandTest(unittest.TestCase):
+    '''tests for commands with gzip input and output'''
+
+    def test_gzip_input(self):
+        self.assertEqual(run_command(["sort"], gzipped("[3, 1", ", 2]")),
+                (Result.OK, "[1, 2, 3]\n"))
+
+    def test_gzip_output(self):
+        status, out = run_command(["range", "1000"], "", YEL_COMPRESS="9",
+                YEL_COMPRESS_THREADS="2")
+
+        self.assertEqual(status, Result.OK)
+        self.assertEqual(gunzip(out), "%s\n" % range(1000))
+
+    def test_round_trip(self):
+        _, out = run_command(["range", "5"], "", YEL_COMPRESS="1")
+
+        self.assertEqual(run_command(["reverse"], out),
+                (Result.OK, "[4, 3, 2, 1, 0]\n"))
+
+    def test_invalid_settings(self):
+        for env in (dict(YEL_COMPRESS="10"), dict(YEL_COMPRESS="fast"),
+                dict(YEL_COMPRESS="1", YEL_COMPRESS_THREADS="many")):
+            status, _ = run_command(["echo", "1"], "", **env)
+
+            self.assertEqual(status, Result.BAD_REQUEST % 256, env)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+'''tests for the hash join'''
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "yel"))
+
+import api
+import hashjoin
+
+from command import Result
+
+LEFT = [{"id": i % 10, "l": i} for i in xrange(30)] + [{"l": "no id"}]
+RIGHT = [{"id": i, "r": i * 2} for i in xrange(5, 15)] + [{"id": 7, "r": 0}]
+
+def sort_records(records):
+    '''return *records* sorted so runs can be compared'''
+    return sorted(records, key=lambda record: sorted(record.items()))
+
+class HashJoinTest(unittest.TestCase):
+    '''tests for hashjoin.HashJoin'''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.left_path = self.write("left.json", LEFT)
+        self.right_path = self.write("right.json", RIGHT)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, items):
+        '''write *items* to file *name* in the test directory'''
+        path = os.path.join(self.directory, name)
+
+        with open(path, "w") as handle:
+            json.dump(items, handle)
+
+        return path
+
+    def join(self, how, max_build_size, stream_left=False):
+        '''return the sorted records of joining the test files'''
+        joiner = hashjoin.HashJoin(["id"], how, max_build_size, 4)
+
+        if stream_left:
+            left = hashjoin.Side(stream=StringIO(json.dumps(LEFT)))
+        else:
+            left = hashjoin.Side(self.left_path)
+
+        return sort_records(joiner.join(left, hashjoin.Side(self.right_path)))
+
+    def test_inner(self):
+        records = self.join(hashjoin.INNER, hashjoin.DEFAULT_MAX_BUILD_SIZE)
+
+        # ids 5 to 9 appear 3 times on the left, 7 twice on the right
+        self.assertEqual(len(records), 18)
+        self.assertIn({"id": 7, "l": 17, "r": 0}, records)
+
+    def test_left_and_anti(self):
+        left = self.join(hashjoin.LEFT, hashjoin.DEFAULT_MAX_BUILD_SIZE)
+        anti = self.join(hashjoin.ANTI, hashjoin.DEFAULT_MAX_BUILD_SIZE)
+
+        self.assertEqual(len(left), 18 + 16)
+        self.assertEqual(len(anti), 16)
+        self.assertIn({"l": "no id"}, anti)
+
+    def test_partitioned_matches_in_memory(self):
+        for how in hashjoin.HOWS:
+            for stream_left in (False, True):
+                self.assertEqual(self.join(how, 0, stream_left),
+                        self.join(how, hashjoin.DEFAULT_MAX_BUILD_SIZE,
+                            stream_left), how)
+
+    def test_two_streams(self):
+        joiner = hashjoin.HashJoin(["id"])
+        side = hashjoin.Side(stream=StringIO("[]"))
+
+        self.assertRaises(ValueError, joiner.join, side, side)
+
+class HashJoinCommandTest(unittest.TestCase):
+    '''tests for the hjoin command'''
+
+    def test_invalid_how(self):
+        result = api.run("hjoin", ["-o", "id", "-r", "right.json", "--how",
+            "outer"], input=[])
+
+        self.assertEqual(result.status, Result.BAD_REQUEST)
+
+    def test_invalid_size(self):
+        result = api.run("hjoin", ["-o", "id", "-r", "right.json", "-m",
+            "lots"], input=[])
+
+        self.assertEqual(result.status, Result.BAD_REQUEST)
+
+if __name__ == "__main__":
+    unittest.main()
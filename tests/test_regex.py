@@ -0,0 +1,63 @@
+'''tests for the cached regular expressions'''
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "yel"))
+
+import regex
+
+PATTERNS = ["abc", "ab*c", "ab?", "^ab", "\\Aab", "a|b", "(ab)+", "a.c",
+    "(?i)ab", "ab$", "a\\d+", "[ab]c", "x*ab"]
+
+TEXTS = ["abc", "ac", "xabc", "ab\nab", "AB", "a12", "bc", "", "zzz",
+    u"\xe1abc"]
+
+class LiteralPrefixTest(unittest.TestCase):
+    '''tests for regex.literal_prefix'''
+
+    def test_prefix(self):
+        self.assertEqual(regex.literal_prefix("abc"), "abc")
+        self.assertEqual(regex.literal_prefix("ab*c"), "a")
+        self.assertEqual(regex.literal_prefix("^ab"), "ab")
+        self.assertEqual(regex.literal_prefix("a\\.b"), "a.b")
+        self.assertEqual(regex.literal_prefix(u"\xe1b"), u"\xe1b")
+
+    def test_no_prefix(self):
+        for pattern in ("\\Aab", "a|b", "(ab)+", "[ab]c", ".a", "x*ab",
+                "(?i)ab", "\xe1b"):
+            self.assertEqual(regex.literal_prefix(pattern), "", pattern)
+
+        self.assertEqual(regex.literal_prefix("ab", re.IGNORECASE), "")
+
+class PatternTest(unittest.TestCase):
+    '''tests that a Pattern gives the same results as re'''
+
+    def test_same_as_re(self):
+        for pattern in PATTERNS:
+            for flags in (0, re.MULTILINE):
+                compiled = regex.Pattern(pattern, flags)
+                expected = re.compile(pattern, flags)
+
+                for text in TEXTS:
+                    case = (pattern, flags, text)
+
+                    self.assertEqual(bool(compiled.match(text)),
+                            bool(expected.match(text)), case)
+                    self.assertEqual(bool(compiled.search(text)),
+                            bool(expected.search(text)), case)
+                    self.assertEqual(compiled.sub("-", text),
+                            expected.sub("-", text), case)
+                    self.assertEqual(compiled.findall(text),
+                            expected.findall(text), case)
+
+    def test_compile_is_cached(self):
+        self.assertIs(regex.compile("a+b"), regex.compile("a+b"))
+        self.assertIsNot(regex.compile("a+b"), regex.compile(u"a+b"))
+        self.assertIsNot(regex.compile("a+b"),
+                regex.compile("a+b", re.IGNORECASE))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+'''tests for the set operations'''
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "yel"))
+
+import api
+import setops
+
+from command import Result
+
+OPERATIONS = (setops.UNION, setops.INTERSECT, setops.DIFFERENCE)
+
+def sorted_inputs(count, seed):
+    '''return *count* sorted lists with repeated items'''
+    rand = random.Random(seed)
+
+    return [sorted(rand.randint(0, 30) for _ in xrange(rand.randint(0, 40)))
+            for _ in xrange(count)]
+
+class ApplyTest(unittest.TestCase):
+    '''tests for setops.apply'''
+
+    def test_hashed(self):
+        inputs = [[3, 1, 3, 2], [2, 4, 3]]
+
+        self.assertEqual(list(setops.apply(setops.UNION, inputs)),
+                [3, 1, 2, 4])
+        self.assertEqual(list(setops.apply(setops.INTERSECT, inputs)),
+                [3, 2])
+        self.assertEqual(list(setops.apply(setops.DIFFERENCE, inputs)), [1])
+
+    def test_sorted_matches_hashed(self):
+        for seed in xrange(20):
+            for count in (1, 2, 3):
+                inputs = sorted_inputs(count, seed)
+
+                for operation in OPERATIONS:
+                    hashed = sorted(setops.apply(operation, inputs))
+                    merged = list(setops.apply(operation, inputs, True))
+
+                    self.assertEqual(merged, hashed, (operation, inputs))
+
+    def test_not_sorted(self):
+        for operation in OPERATIONS:
+            result = setops.apply(operation, [[1, 2], [3, 1]], True)
+
+            self.assertRaises(setops.NotSorted, list, result)
+
+class SetCommandTest(unittest.TestCase):
+    '''tests for the set operation commands'''
+
+    def test_sorted(self):
+        result = api.run("intersect", ["--sorted"], input=[[1, 2, 3],
+            [2, 3, 4]])
+
+        self.assertEqual(result.status, Result.OK)
+        self.assertEqual(result.result, [2, 3])
+
+    def test_not_sorted(self):
+        result = api.run("intersect", ["--sorted"], input=[[1, 3, 2],
+            [2, 3]])
+
+        self.assertEqual(result.status, Result.BAD_REQUEST)
+        self.assertEqual(result.reason, "input 0 is not sorted at item: 2")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+'''tests for the shared memory handoff'''
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, os.path.join(ROOT, "yel"))
+
+import shm
+
+from command import Result
+
+def command(name, *args):
+    '''return the args to run command *name* with *args*'''
+    return [sys.executable, os.path.join(ROOT, "bin", "@" + name)] + list(
+            args)
+
+def dead_pid():
+    '''return the pid of a process that already ended'''
+    process = subprocess.Popen(["true"])
+    process.wait()
+
+    return process.pid
+
+def reads_input(args):
+    '''accept every reader'''
+    return True
+
+class ShmTest(unittest.TestCase):
+    '''tests for the shm functions'''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.env = dict(os.environ, YEL_SHM=self.directory, YEL_SHM_MIN="10")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def files(self):
+        '''return the names of the files in the shared memory directory'''
+        return sorted(os.listdir(self.directory))
+
+    def touch(self, name):
+        '''create the empty file *name* in the shared memory directory'''
+        open(os.path.join(self.directory, name), "w").close()
+
+    def test_type_code(self):
+        self.assertEqual(shm.type_code([1, 2]), shm.INT)
+        self.assertEqual(shm.type_code([1.5, 2.0]), shm.FLOAT)
+
+        for items in ([], [1, 2.0], [True], [1, 2 ** 70], ["a"]):
+            self.assertEqual(shm.type_code(items), None, items)
+
+    def test_min_items(self):
+        old = os.environ.get("YEL_SHM_MIN")
+
+        try:
+            os.environ["YEL_SHM_MIN"] = "10"
+            self.assertEqual(shm.min_items(), 10)
+
+            os.environ["YEL_SHM_MIN"] = "abc"
+            self.assertRaises(ValueError, shm.min_items)
+
+            del os.environ["YEL_SHM_MIN"]
+            self.assertEqual(shm.min_items(), shm.DEFAULT_MIN_ITEMS)
+        finally:
+            if old is not None:
+                os.environ["YEL_SHM_MIN"] = old
+
+    def test_not_exported(self):
+        read_fd, write_fd = os.pipe()
+
+        try:
+            # too small, not numbers, no other reader and not a pipe
+            for value, fd in (([1, 2], write_fd), (["a"] * 20, write_fd),
+                    (range(20), write_fd), (range(20), 0)):
+                self.assertEqual(shm.export(value, fd, reads_input, 10,
+                    self.directory), value)
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+        self.assertEqual(self.files(), [])
+
+    def test_round_trip(self):
+        read_fd, write_fd = os.pipe()
+        reader = subprocess.Popen(command("size"), stdin=read_fd,
+                stdout=subprocess.PIPE, env=self.env, close_fds=True)
+        os.close(read_fd)
+
+        values = range(100)
+        descriptor = shm.export(values, write_fd, reads_input, 10,
+                self.directory)
+
+        self.assertTrue(shm.is_descriptor(descriptor))
+        self.assertEqual(len(self.files()), 1)
+        self.assertEqual(shm.file_pids(self.files()[0]),
+                [os.getpid(), reader.pid])
+
+        os.write(write_fd, json.dumps(descriptor))
+        os.close(write_fd)
+
+        self.assertEqual(reader.communicate()[0], "100\n")
+        self.assertEqual(self.files(), [])
+
+    def test_not_exported_to_reader_without_input(self):
+        read_fd, write_fd = os.pipe()
+        reader = subprocess.Popen(command("size"), stdin=read_fd,
+                stdout=subprocess.PIPE, env=self.env, close_fds=True)
+        os.close(read_fd)
+
+        values = range(100)
+        exported = shm.export(values, write_fd, lambda args: False, 10,
+                self.directory)
+
+        os.write(write_fd, json.dumps(exported))
+        os.close(write_fd)
+
+        self.assertEqual(reader.communicate()[0], "100\n")
+
+        self.assertEqual(exported, values)
+        self.assertEqual(self.files(), [])
+
+    def test_attach(self):
+        path = os.path.join(self.directory, "yel-1-2-x")
+
+        with open(path, "wb") as handle:
+            shm.array.array(shm.FLOAT, [1.5, 2.5]).tofile(handle)
+
+        descriptor = {shm.KEY: {"path": path, "type": shm.FLOAT,
+            "length": 2}}
+        old_dir, shm.SHM_DIR = shm.SHM_DIR, self.directory
+
+        try:
+            self.assertEqual(shm.load(descriptor), [1.5, 2.5])
+            self.assertEqual(self.files(), [])
+
+            descriptor[shm.KEY]["path"] = "/tmp/yel-1-2-x"
+            self.assertRaises(ValueError, shm.attach, descriptor)
+        finally:
+            shm.SHM_DIR = old_dir
+
+    def test_sweep(self):
+        dead = dead_pid()
+        own = os.getpid()
+
+        for name in ("yel-%d-%d-a" % (dead, dead), "yel-%d-%d-b" % (dead, own),
+                "yel-%d-c" % own, "yel-cache-d", "other"):
+            self.touch(name)
+
+        shm.sweep(self.directory)
+
+        self.assertEqual(self.files(), sorted(["other",
+            "yel-%d-%d-b" % (dead, own), "yel-%d-c" % own, "yel-cache-d"]))
+
+    def test_release(self):
+        self.touch("yel-1-2-x")
+        descriptor = {shm.KEY: {"path": os.path.join(self.directory,
+            "yel-1-2-x"), "type": shm.INT, "length": 0}}
+
+        shm.release(descriptor)
+        shm.release(descriptor)
+        self.assertEqual(self.files(), [])
+
+    def test_commands(self):
+        for reader, expected in (("size", "100\n"), ("echo", "1\n")):
+            args = command(reader) + (["1"] if reader == "echo" else [])
+            producer = subprocess.Popen(command("range", "100"),
+                    stdout=subprocess.PIPE, env=self.env)
+            consumer = subprocess.Popen(args, stdin=producer.stdout,
+                    stdout=subprocess.PIPE, env=self.env)
+            producer.stdout.close()
+
+            self.assertEqual(consumer.communicate()[0], expected)
+            producer.wait()
+            self.assertEqual(self.files(), [], reader)
+
+    def test_invalid_min_items(self):
+        env = dict(self.env, YEL_SHM_MIN="abc")
+        process = subprocess.Popen(command("echo", "1"), env=env,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        process.communicate()
+
+        self.assertEqual(process.returncode, Result.BAD_REQUEST % 256)
+
+if __name__ == "__main__":
+    unittest.main()
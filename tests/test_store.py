@@ -0,0 +1,107 @@
+'''tests for the persistent variable store'''
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, os.path.join(ROOT, "yel"))
+
+import store
+
+from command import Result
+
+def env_command(store_path, *args):
+    '''run env with *args* and the store at *store_path* in another process,
+    return the exit status and the decoded output'''
+    env = dict(os.environ, YEL_STORE=store_path)
+    process = subprocess.Popen([sys.executable,
+        os.path.join(ROOT, "bin", "@env")] + list(args), env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, _ = process.communicate()
+
+    return process.returncode, json.loads(out)
+
+def exit_status(status):
+    '''return the exit status of a command that ends with *status*'''
+    return status % 256
+
+class StoreTest(unittest.TestCase):
+    '''tests for store.Store'''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "store")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_set_get(self):
+        values = store.Store(self.path)
+        values.set("a", [1, 2])
+
+        self.assertEqual(store.Store(self.path).get("a"), [1, 2])
+        self.assertIs(values.get("b"), store.MISSING)
+        self.assertEqual(values.get("b", 3), 3)
+
+    def test_get_returns_copy(self):
+        values = store.Store(self.path)
+        values.set("a", {"b": [1]})
+        values.get("a")["b"].append(2)
+
+        self.assertEqual(values.get("a"), {"b": [1]})
+
+    def test_sees_other_writers(self):
+        reader = store.Store(self.path)
+        self.assertIs(reader.get("a"), store.MISSING)
+
+        store.Store(self.path).set("a", 1)
+        self.assertEqual(reader.get("a"), 1)
+
+    def test_invalid_file(self):
+        with open(self.path, "wb") as handle:
+            handle.write("not marshal")
+
+        self.assertRaises(ValueError, store.Store(self.path).get, "a")
+
+class EnvCommandTest(unittest.TestCase):
+    '''tests for the env command with a store shared by processes'''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "store")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_set_get_across_processes(self):
+        self.assertEqual(env_command(self.path, "set", "a", '{"b": 1}'),
+                (Result.OK, None))
+        self.assertEqual(env_command(self.path, "get", "a"),
+                (Result.OK, {"b": 1}))
+
+    def test_get_missing(self):
+        self.assertEqual(env_command(self.path, "get", "a", "2"),
+                (Result.OK, 2))
+
+    def test_get_fail(self):
+        self.assertEqual(env_command(self.path, "get", "a", "-f"),
+                (exit_status(Result.NOT_FOUND), None))
+
+        env_command(self.path, "set", "a", "1")
+        self.assertEqual(env_command(self.path, "get", "a", "-f"),
+                (Result.OK, 1))
+
+    def test_invalid_file(self):
+        with open(self.path, "wb") as handle:
+            handle.write("not marshal")
+
+        self.assertEqual(env_command(self.path, "get", "a"),
+                (exit_status(Result.BAD_REQUEST), None))
+
+if __name__ == "__main__":
+    unittest.main()
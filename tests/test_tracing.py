@@ -0,0 +1,103 @@
+'''tests for the pipeline traces'''
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, os.path.join(ROOT, "yel"))
+
+import tracing
+
+def span(span_id, command, start, end, stdin=None, stdout=None,
+        parent_id=None, trace_id="t"):
+    '''return a span record'''
+    return dict(trace_id=trace_id, span_id=span_id, parent_id=parent_id,
+            command=command, start=start, end=end, duration=end - start,
+            status=200, input_bytes=10, output_bytes=20, stdin=stdin,
+            stdout=stdout)
+
+# range | sort | size where sort waits for all its input
+PIPELINE = [
+    span("a", "range", 0.0, 1.0, "/dev/null", "pipe:[1]"),
+    span("b", "sort", 0.1, 3.0, "pipe:[1]", "pipe:[2]"),
+    span("c", "size", 0.2, 3.5, "pipe:[2]", "/dev/tty"),
+    span("d", "echo", 5.0, 6.0, "/dev/tty", "/dev/tty"),
+    span("e", "upper", 2.0, 2.5, parent_id="b")
+]
+
+class TracingTest(unittest.TestCase):
+    '''tests for the trace report'''
+
+    def test_chains(self):
+        chains = tracing.chains(PIPELINE[:4])
+
+        self.assertEqual([[stage["span_id"] for stage in chain]
+            for chain in chains], [["a", "b", "c"], ["d"]])
+
+    def test_critical_path(self):
+        path = tracing.critical_path(PIPELINE[:3])
+
+        self.assertEqual([(stage["span_id"], round(seconds, 6))
+            for stage, seconds in path], [("a", 1.0), ("b", 2.0),
+                ("c", 0.5)])
+
+    def test_report(self):
+        report = tracing.report(PIPELINE)
+
+        self.assertEqual(len(report), 1)
+        pipelines = report[0]["pipelines"]
+        self.assertEqual(len(pipelines), 2)
+
+        first = pipelines[0]
+        self.assertEqual(first["bottleneck"], "sort")
+        self.assertEqual(first["wall"], 3.5)
+        self.assertEqual([stage["nested"] for stage in first["stages"]],
+                [0, 1, 0])
+        self.assertEqual(first["stages"][0]["output_throughput"], 20.0)
+
+    def test_report_trace_id(self):
+        spans = PIPELINE + [span("f", "echo", 0, 1, trace_id="other")]
+
+        self.assertEqual([trace["trace_id"] for trace in
+            tracing.report(spans, "other")], ["other"])
+        self.assertEqual(len(tracing.report(spans)), 2)
+
+class TraceCommandTest(unittest.TestCase):
+    '''tests for tracing a shell pipeline'''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "trace.ndjson")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_pipeline(self):
+        env = dict(os.environ, YEL_TRACE=self.path)
+        bin_dir = os.path.join(ROOT, "bin")
+        command = " | ".join("%s %s" % (sys.executable,
+            os.path.join(bin_dir, "@" + name)) for name in
+            ("range 1000", "sort", "size"))
+        process = subprocess.Popen(command, shell=True, env=env,
+                stdout=subprocess.PIPE)
+
+        self.assertEqual(process.communicate()[0], "1000\n")
+
+        spans = tracing.load(self.path)
+        self.assertEqual(len(spans), 3)
+
+        report = tracing.report(spans)
+        self.assertEqual(len(report), 1)
+
+        stages = report[0]["pipelines"][0]["stages"]
+        self.assertEqual([stage["command"] for stage in stages],
+                ["range", "sort", "size"])
+        self.assertEqual(stages[0]["output_bytes"],
+                stages[1]["input_bytes"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+'''tests for the shared helpers'''
+import os
+import sys
+import unittest
+import threading
+
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "yel"))
+
+import util
+
+def json_items(text, read_size=2):
+    '''return the list of items JsonItems decodes from *text*, a small
+    *read_size* makes values cross the reads'''
+    return list(util.JsonItems(StringIO(text), read_size))
+
+class JsonItemsTest(unittest.TestCase):
+    '''tests for util.JsonItems'''
+
+    def test_list(self):
+        self.assertEqual(json_items('[1, "two", [3], {"a": 4}]'),
+                [1, "two", [3], {"a": 4}])
+        self.assertEqual(json_items("[]"), [])
+        self.assertEqual(json_items(" [ 12345 , 6 ] "), [12345, 6])
+
+    def test_values(self):
+        self.assertEqual(json_items('1\n"a"\n{"b": 2}\n'), [1, "a", {"b": 2}])
+        self.assertEqual(json_items("[1] [2, 3]"), [1, 2, 3])
+        self.assertEqual(json_items(""), [])
+
+    def test_missing_comma(self):
+        self.assertRaises(ValueError, json_items, "[1 2]")
+        self.assertRaises(ValueError, json_items, '[{"a": 1} {"a": 2}]')
+
+    def test_misplaced_comma(self):
+        self.assertRaises(ValueError, json_items, "[1,]")
+        self.assertRaises(ValueError, json_items, "[,1]")
+        self.assertRaises(ValueError, json_items, "[1,,2]")
+
+    def test_unterminated(self):
+        self.assertRaises(ValueError, json_items, "[1, 2")
+        self.assertRaises(ValueError, json_items, "[1, 2,")
+        self.assertRaises(ValueError, json_items, '[1, "ab')
+
+    def test_items_before_error(self):
+        items = iter(util.JsonItems(StringIO("[1, 2 3]")))
+
+        self.assertEqual(next(items), 1)
+        self.assertEqual(next(items), 2)
+        self.assertRaises(ValueError, next, items)
+
+class LruCacheTest(unittest.TestCase):
+    '''tests for util.LruCache'''
+
+    def test_evicts_least_recently_used(self):
+        cache = util.LruCache(2)
+        cache.get("a", lambda: 1)
+        cache.get("b", lambda: 2)
+        cache.get("a", lambda: None)
+        cache.get("c", lambda: 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("a", lambda: None), 1)
+        self.assertEqual(cache.get("b", lambda: 4), 4)
+
+    def test_threads(self):
+        cache = util.LruCache(8)
+        errors = []
+
+        def use(offset):
+            '''get keys from the cache checking their values'''
+            try:
+                for i in xrange(2000):
+                    key = (i + offset) % 12
+
+                    if cache.get(key, lambda: key * 10) != key * 10:
+                        errors.append(key)
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=use, args=(offset,))
+                for offset in xrange(8)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(cache), 8)
+
+if __name__ == "__main__":
+    unittest.main()
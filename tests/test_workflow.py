@@ -0,0 +1,145 @@
+'''tests for running workflows'''
+import os
+import sys
+import json
+import unittest
+
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "yel"))
+
+import api
+import commands
+import workflow
+
+from command import Result
+
+def run(stages, output=None, input_=None):
+    '''run a workflow with *stages*, *input_* is the raw workflow input'''
+    if not commands.COMMANDS:
+        commands.load_commands()
+
+    data = dict(stages=stages)
+
+    if output is not None:
+        data["output"] = output
+
+    flow = workflow.Workflow(data, commands.COMMANDS.get)
+
+    if input_ is None:
+        return flow.run(no_input)
+    else:
+        return flow.run(lambda: StringIO(input_))
+
+def no_input():
+    '''fail if a workflow that doesn't read its input opens it'''
+    raise AssertionError("the workflow input was opened")
+
+def stage(stage_id, command, args=None, **kwargs):
+    '''return the definition of a stage'''
+    kwargs.update(id=stage_id, command=command)
+
+    if args is not None:
+        kwargs["args"] = args
+
+    # from is a keyword
+    if "from_" in kwargs:
+        kwargs["from"] = kwargs.pop("from_")
+
+    return kwargs
+
+class WorkflowTest(unittest.TestCase):
+    '''tests for workflow.Workflow'''
+
+    def test_fan_out_fan_in(self):
+        result = run([stage("r", "range", ["5"]),
+            stage("s", "size", from_="r"),
+            stage("v", "reverse", from_="r"),
+            stage("out", "echo", from_=["r", "s", "v"])])
+
+        self.assertEqual(result.status, Result.OK)
+        self.assertEqual(result.result, [[0, 1, 2, 3, 4], 5,
+            [4, 3, 2, 1, 0]])
+
+    def test_batches(self):
+        result = run([stage("r", "range", ["10000"]),
+            stage("a", "size", from_="r"),
+            stage("b", "max", from_="r")], ["a", "b"])
+
+        self.assertEqual(result.result, {"a": 10000, "b": 9999})
+
+    def test_input_value(self):
+        result = run([stage("s", "sort", input=[3, 1, 2])])
+
+        self.assertEqual(result.result, [1, 2, 3])
+
+    def test_stdin_fan_out(self):
+        result = run([stage("s", "sort", input="$stdin"),
+            stage("n", "size", input="$stdin"),
+            stage("out", "echo", from_=["s", "n"])],
+            input_=json.dumps(range(10000, 0, -1)))
+
+        self.assertEqual(result.status, Result.OK)
+        self.assertEqual(result.result, [range(1, 10001), 10000])
+
+    def test_source_without_input(self):
+        self.assertEqual(run([stage("r", "range", ["3"])]).result, [0, 1, 2])
+
+        # an empty input, like an empty stdin
+        result = run([stage("e", "echo")])
+
+        self.assertEqual(result.status, Result.ERROR)
+        self.assertEqual(result.reason,
+                "stage e: No JSON object could be decoded")
+
+    def test_stdin_not_read(self):
+        # opened only when a stage reads it, which range doesn't
+        result = run([stage("r", "range", ["3"], input="$stdin")])
+
+        self.assertEqual(result.result, [0, 1, 2])
+
+    def test_stage_error(self):
+        result = run([stage("r", "range", ["5"]),
+            stage("g", "groupby", from_="r"),
+            stage("s", "size", from_="r")])
+
+        self.assertEqual(result.status, Result.BAD_REQUEST)
+        self.assertEqual(result.reason, "stage g: key parameter required")
+
+    def test_input_error(self):
+        result = run([stage("s", "sort", input="$stdin")], input_="[1, ")
+
+        self.assertNotEqual(result.status, Result.OK)
+        self.assertTrue(result.reason.startswith("stage s: "))
+
+    def test_invalid(self):
+        for stages, output in (
+                ([stage("a", "nope")], None),
+                ([stage("a", "echo"), stage("a", "echo")], None),
+                ([stage("a", "echo", from_="b")], None),
+                ([stage("a", "echo", from_="b"),
+                    stage("b", "echo", from_="a")], None),
+                ([stage("a", "echo")], "b"),
+                ([{"command": "echo"}], None)):
+            self.assertRaises(ValueError, run, stages, output)
+
+class RunCommandTest(unittest.TestCase):
+    '''tests for the run command'''
+
+    def test_run(self):
+        flow = dict(stages=[stage("r", "range", ["3"]),
+            stage("s", "size", from_="r")])
+        result = api.run("run", [json.dumps(flow)])
+
+        self.assertEqual(result.status, Result.OK)
+        self.assertEqual(result.result, 3)
+
+    def test_invalid(self):
+        flow = dict(stages=[stage("a", "echo", from_="a")])
+        result = api.run("run", [json.dumps(flow)])
+
+        self.assertEqual(result.status, Result.BAD_REQUEST)
+
+if __name__ == "__main__":
+    unittest.main()
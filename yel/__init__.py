@@ -0,0 +1,8 @@
+'''yel commands as a library
+
+    import yel
+    result = yel.run("sort", input=[3, 1, 2])
+    result.status, result.result
+    results = yel.run_batch([("s.upper", [], "a"), ("size", [], [1, 2])])'''
+from api import run, run_batch
+from command import Result
@@ -0,0 +1,257 @@
+'''single pass hash aggregation that spills to disk'''
+import os
+import json
+import shutil
+import tempfile
+
+import util
+import jsonpath
+
+DEFAULT_MAX_GROUPS = 100000
+PARTITIONS = 64
+
+AGGREGATIONS = ("count", "sum", "min", "max", "mean")
+
+def is_number(value):
+    '''return True if value is a number'''
+    return isinstance(value, (int, long, float)) and not isinstance(value,
+            bool)
+
+class Aggregation(object):
+    '''an aggregation function over a field, its state is a json value so
+    partial results can be stored and merged'''
+
+    def __init__(self, spec):
+        if ":" in spec:
+            self.kind, self.field = spec.split(":", 1)
+        else:
+            self.kind, self.field = spec, None
+
+        if self.kind not in AGGREGATIONS:
+            raise ValueError("unknown aggregation %s, expected one of %s" % (
+                self.kind, ", ".join(AGGREGATIONS)))
+
+        if self.kind != "count" and self.field is None:
+            raise ValueError("aggregation %s requires a field" % self.kind)
+
+        self.label = spec
+        self.get = jsonpath.field_getter(self.field)
+
+    def initial(self):
+        '''return the state before any item'''
+        if self.kind == "count":
+            return 0
+        elif self.kind == "sum":
+            return 0
+        elif self.kind == "mean":
+            return [0, 0]
+        else:
+            return None
+
+    def update(self, state, item):
+        '''return *state* updated with *item*'''
+        kind = self.kind
+
+        if kind == "count":
+            if self.field is None or self.get(item) is not None:
+                return state + 1
+            else:
+                return state
+
+        value = self.get(item)
+
+        if value is None:
+            return state
+        elif kind == "sum":
+            return state + value if is_number(value) else state
+        elif kind == "mean":
+            if is_number(value):
+                state[0] += value
+                state[1] += 1
+
+            return state
+        elif kind == "min":
+            return value if state is None or value < state else state
+        else:
+            return value if state is None or value > state else state
+
+    def merge(self, state, other):
+        '''return the merge of two states'''
+        kind = self.kind
+
+        if kind == "count" or kind == "sum":
+            return state + other
+        elif kind == "mean":
+            return [state[0] + other[0], state[1] + other[1]]
+        elif other is None:
+            return state
+        elif state is None:
+            return other
+        elif kind == "min":
+            return min(state, other)
+        else:
+            return max(state, other)
+
+    def final(self, state):
+        '''return the result from a state'''
+        if self.kind == "mean":
+            if state[1] == 0:
+                return None
+
+            return float(state[0]) / state[1]
+        else:
+            return state
+
+class GroupBy(object):
+    '''group items by the value of some fields and aggregate the groups
+
+    when there are more than max_groups groups in memory their partial states
+    are written to partition files on disk, at the end each partition is
+    merged on its own'''
+
+    def __init__(self, keys, aggs, max_groups=DEFAULT_MAX_GROUPS,
+            partitions=PARTITIONS):
+        self.keys = keys
+        self.getters = [jsonpath.field_getter(key) for key in keys]
+        self.aggs = [Aggregation(agg) for agg in aggs]
+        self.max_groups = max(1, max_groups)
+        self.partitions = partitions
+
+        self.groups = {}
+        self.tmp_dir = None
+        self.spilled = False
+
+    def key_of(self, values):
+        '''return the hashable key for the key *values* of an item'''
+        return tuple(util.hashable(value) for value in values)
+
+    def add(self, item):
+        '''aggregate *item* into its group'''
+        values = [getter(item) for getter in self.getters]
+        key = self.key_of(values)
+        group = self.groups.get(key)
+
+        if group is None:
+            group = self.new_group(key, values)
+
+        states = group[1]
+        for i, agg in enumerate(self.aggs):
+            states[i] = agg.update(states[i], item)
+
+    def add_partial(self, record):
+        '''merge a partial record as returned by results(partial=True)'''
+        values = record["key"]
+        partial = record["partial"]
+
+        if len(partial) != len(self.aggs):
+            raise ValueError("expected %d partial states, got: %s" % (
+                len(self.aggs), str(partial)))
+
+        key = self.key_of(values)
+        group = self.groups.get(key)
+
+        if group is None:
+            group = self.new_group(key, values)
+
+        self.merge_states(group[1], partial)
+
+    def merge_states(self, states, other):
+        '''merge the *other* states into *states*'''
+        for i, agg in enumerate(self.aggs):
+            states[i] = agg.merge(states[i], other[i])
+
+    def new_group(self, key, values):
+        '''create the group for a new key, spill if there are too many'''
+        if len(self.groups) >= self.max_groups:
+            self.spill()
+
+        states = [agg.initial() for agg in self.aggs]
+        group = self.groups[key] = [values, states]
+
+        return group
+
+    def partition_path(self, index):
+        '''return the path of partition file *index*'''
+        return os.path.join(self.tmp_dir, "%d.ndjson" % index)
+
+    def spill(self):
+        '''append the groups in memory to the partition files and clear them'''
+        if self.tmp_dir is None:
+            self.tmp_dir = tempfile.mkdtemp(prefix="yel-groupby-")
+
+        self.spilled = True
+        handles = {}
+
+        try:
+            for key, group in self.groups.iteritems():
+                index = hash(key) % self.partitions
+                handle = handles.get(index)
+
+                if handle is None:
+                    handle = handles[index] = open(self.partition_path(index),
+                            "a")
+
+                handle.write(json.dumps(group))
+                handle.write("\n")
+        finally:
+            for handle in handles.itervalues():
+                handle.close()
+
+        self.groups = {}
+
+    def results(self, partial=False):
+        '''yield a record per group, if *partial* is True the records hold the
+        aggregation states so they can be merged later with add_partial'''
+        try:
+            if not self.spilled:
+                for record in self.records(self.groups, partial):
+                    yield record
+
+                return
+
+            self.spill()
+
+            for index in xrange(self.partitions):
+                path = self.partition_path(index)
+
+                if not os.path.exists(path):
+                    continue
+
+                groups = {}
+
+                with open(path) as handle:
+                    for line in handle:
+                        values, states = json.loads(line)
+                        key = self.key_of(values)
+                        current = groups.get(key)
+
+                        if current is None:
+                            groups[key] = [values, states]
+                        else:
+                            self.merge_states(current[1], states)
+
+                os.remove(path)
+
+                for record in self.records(groups, partial):
+                    yield record
+        finally:
+            self.close()
+
+    def records(self, groups, partial):
+        '''yield the records for the groups in *groups*'''
+        for values, states in groups.itervalues():
+            if partial:
+                yield dict(key=values, partial=states)
+            else:
+                record = dict(zip(self.keys, values))
+
+                for agg, state in zip(self.aggs, states):
+                    record[agg.label] = agg.final(state)
+
+                yield record
+
+    def close(self):
+        '''remove the spilled partitions'''
+        if self.tmp_dir is not None:
+            shutil.rmtree(self.tmp_dir, True)
+            self.tmp_dir = None
@@ -0,0 +1,165 @@
+'''Aho-Corasick automaton to search many needles in a single pass'''
+import os
+import json
+import hashlib
+import cPickle as pickle
+
+from collections import deque
+
+CACHE_DIR = os.environ.get("YEL_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".cache", "yel"))
+
+class Automaton(object):
+    '''automaton that finds every occurrence of a set of needles in a text
+    scanning it only once'''
+
+    def __init__(self, needles):
+        self.needles = []
+        self.has_empty = False
+
+        # state 0 is the root, each state has its transitions, the state to
+        # go on failure and the index of the needles that end there
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+
+        seen = set()
+
+        for needle in needles:
+            if needle in seen:
+                continue
+
+            seen.add(needle)
+
+            if needle:
+                self.add(needle)
+            else:
+                self.has_empty = True
+
+        self.build()
+
+    def get_state(self):
+        '''return the automaton tables as builtin types'''
+        return (self.needles, self.has_empty, self.goto, self.fail,
+                self.outputs)
+
+    @classmethod
+    def from_state(cls, state):
+        '''build an automaton from the tables returned by get_state'''
+        automaton = cls([])
+        (automaton.needles, automaton.has_empty, automaton.goto,
+                automaton.fail, automaton.outputs) = state
+
+        return automaton
+
+    def add(self, needle):
+        '''add *needle* to the trie'''
+        state = 0
+
+        for char in needle:
+            next_state = self.goto[state].get(char)
+
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+
+            state = next_state
+
+        self.outputs[state].append(len(self.needles))
+        self.needles.append(needle)
+
+    def build(self):
+        '''compute the failure links breadth first'''
+        queue = deque(self.goto[0].itervalues())
+
+        while queue:
+            state = queue.popleft()
+
+            for char, next_state in self.goto[state].iteritems():
+                queue.append(next_state)
+
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_state] = fail
+                self.outputs[next_state] = (self.outputs[next_state] +
+                        self.outputs[fail])
+
+    def iter_matches(self, text):
+        '''yield (end position, needle index) for every match in *text*'''
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+        state = 0
+
+        for pos, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+
+            state = goto[state].get(char, 0)
+
+            for index in outputs[state]:
+                yield pos + 1, index
+
+    def contains_any(self, text):
+        '''return True if any needle is in *text*'''
+        if self.has_empty:
+            return True
+
+        for _ in self.iter_matches(text):
+            return True
+
+        return False
+
+    def find_all(self, text):
+        '''return a list of [position, needle] for every match in *text*
+        ordered by position'''
+        needles = self.needles
+        result = [[end - len(needles[index]), needles[index]]
+                for end, index in self.iter_matches(text)]
+        result.sort()
+
+        return result
+
+def needles_key(needles):
+    '''return a hash that identifies the list of *needles*'''
+    data = json.dumps(sorted(set(needles)), ensure_ascii=True)
+    return hashlib.sha1(data).hexdigest()
+
+def load(needles, cache_dir=None):
+    '''return an automaton for *needles*, loading it from the disk cache if it
+    was built before and storing it there otherwise'''
+    if cache_dir is None:
+        cache_dir = os.path.join(CACHE_DIR, "aho")
+
+    path = os.path.join(cache_dir, needles_key(needles) + ".pickle")
+
+    try:
+        with open(path, "rb") as handle:
+            return Automaton.from_state(pickle.load(handle))
+    except (IOError, OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+
+    automaton = Automaton(needles)
+
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+
+        with open(tmp_path, "wb") as handle:
+            pickle.dump(automaton.get_state(), handle,
+                    pickle.HIGHEST_PROTOCOL)
+
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        # the cache is an optimization, not being able to write it is fine
+        pass
+
+    return automaton
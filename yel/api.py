@@ -0,0 +1,100 @@
+'''run yel commands as a library, without reading stdin, writing stdout or
+exiting the process'''
+import os
+import copy
+import multiprocessing
+import multiprocessing.pool
+
+import commands
+
+from command import Result, Stream, TextStream
+
+def get_command(name):
+    '''return the class of command *name*, None if it doesn't exist'''
+    if not commands.COMMANDS:
+        commands.load_commands()
+
+    return commands.COMMANDS.get(name)
+
+def materialize(result):
+    '''consume a lazy result, streams become a list and text streams a
+    string'''
+    if isinstance(result.result, TextStream):
+        result.result = "".join(result.result)
+    elif isinstance(result.result, Stream):
+        result.result = list(result.result)
+
+    return result
+
+def run(name, args=None, input=None, vars_=None, lazy=False):
+    '''run command *name* and return its Result
+
+    args can be a list of command line arguments like ["-k", "name"] or
+    the dict parse_args returns, input is the value the command gets instead
+    of stdin and vars_ the environment, os.environ by default, commands
+    that modify their input get a shallow copy of it
+
+    if lazy is True streamed results are returned as they are, otherwise
+    they are consumed so the result is a plain value'''
+    cls = get_command(name)
+
+    if cls is None:
+        return Result.not_found("command %s not found" % name)
+
+    if args is None:
+        args = {}
+    elif isinstance(args, (list, tuple)):
+        try:
+            args = cls.parse_args([unicode(arg) if not isinstance(arg, str)
+                else arg for arg in args])
+        except ValueError as error:
+            return Result.bad_request(str(error))
+    else:
+        args = dict(args)
+
+    if vars_ is None:
+        vars_ = dict(os.environ)
+
+    # the caller's value is left as it was
+    if cls.MUTATES_INPUT:
+        input = copy.copy(input)
+
+    result = cls.invoke(dict(name=name, args=args, vars=vars_, input=input))
+
+    if lazy:
+        return result
+
+    try:
+        return materialize(result)
+    except Exception as error:
+        return Result.from_exception(error)
+
+def run_invocation(invocation):
+    '''run an invocation, a dict with name, args, input and vars keys or a
+    (name, args, input) tuple'''
+    if isinstance(invocation, dict):
+        return run(invocation["name"], invocation.get("args"),
+                invocation.get("input"), invocation.get("vars"))
+    else:
+        return run(*invocation)
+
+def run_batch(invocations, workers=None, processes=False):
+    '''run a list of *invocations* and return the list of their Results in
+    the same order
+
+    if workers is set they run on a pool of that many threads, or processes
+    if processes is True, which also needs the invocations and results to be
+    picklable'''
+    if not workers:
+        return [run_invocation(invocation) for invocation in invocations]
+
+    if processes:
+        pool = multiprocessing.Pool(workers)
+    else:
+        pool = multiprocessing.pool.ThreadPool(workers)
+
+    try:
+        return pool.map(run_invocation, invocations)
+    finally:
+        pool.close()
+        pool.join()
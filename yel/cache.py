@@ -0,0 +1,284 @@
+'''content addressed cache of the output of deterministic commands
+
+enabled setting YEL_CACHE to a directory, YEL_CACHE_SIZE sets the maximum
+size of the entries (k, m and g suffixes allowed, default 1g), the least
+recently used entries are removed when it's exceeded
+
+the key of an entry is the hash of the command name, its parsed args, the
+input bytes and the code of yel, the input is spooled to a temporary file
+while it's hashed so it can be read again by the command
+
+the input is only spooled when the command reads it, so a command that takes
+everything from its args doesn't wait for stdin to end, its output is stored
+with a key without input that is looked up before running the command'''
+import os
+import copy
+import errno
+import hashlib
+import thread
+import tempfile
+
+import util
+
+CACHE_DIR = os.environ.get("YEL_CACHE")
+ENABLED = bool(CACHE_DIR)
+
+DEFAULT_MAX_SIZE = "1g"
+
+CHUNK_SIZE = 64 * 1024
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# input digest of the runs that don't read their input
+NO_INPUT = "no-input"
+
+# hits are only raised to the thread that runs main
+MAIN_THREAD = thread.get_ident()
+
+def code_version():
+    '''return a hash of the name, size and modification time of the yel
+    modules, so entries of older code are not used'''
+    digest = hashlib.sha1()
+
+    for name in sorted(os.listdir(CODE_DIR)):
+        if name.endswith(".py"):
+            stat = os.stat(os.path.join(CODE_DIR, name))
+            digest.update("%s:%d:%d;" % (name, stat.st_size, stat.st_mtime))
+
+    return digest.hexdigest()
+
+def iter_chunks(handle, size=CHUNK_SIZE):
+    '''yield the content of the file like object *handle* in chunks'''
+    while True:
+        chunk = handle.read(size)
+
+        if not chunk:
+            return
+
+        yield chunk
+
+class Hit(BaseException):
+    '''raised when the input a command opens has a cached output, it isn't
+    an Exception so the command doesn't handle it as an error'''
+
+    def __init__(self, handle):
+        BaseException.__init__(self)
+        self.handle = handle
+
+class Entry(object):
+    '''an entry being written, the output goes to a temporary file that is
+    moved to its place on commit, the key is taken from *lookup* then since
+    the command may read its input while its output is written'''
+
+    def __init__(self, lookup):
+        self.cache = lookup.cache
+        self.lookup = lookup
+        fd, self.tmp_path = tempfile.mkstemp(prefix=".tmp-",
+                dir=self.cache.root)
+        self.handle = os.fdopen(fd, "wb")
+
+    def tee(self, out):
+        '''return a file like object that writes to *out* and the entry'''
+        return Tee(out, self.handle)
+
+    def commit(self):
+        '''store the entry and evict old ones if the cache is too big'''
+        self.handle.close()
+        path = self.cache.path(self.lookup.key())
+
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+
+        os.rename(self.tmp_path, path)
+        self.cache.evict()
+
+    def discard(self):
+        '''remove the entry, for results that must not be cached'''
+        self.handle.close()
+
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+class Tee(object):
+    '''file like object that writes to two others'''
+
+    def __init__(self, out, copy):
+        self.out = out
+        self.copy = copy
+
+    def write(self, data):
+        '''write *data* to both'''
+        self.out.write(data)
+        self.copy.write(data)
+
+    def flush(self):
+        '''flush the output'''
+        self.out.flush()
+
+class ResultCache(object):
+    '''directory of command outputs by key'''
+
+    def __init__(self, root=CACHE_DIR, max_size=None):
+        self.root = os.path.expanduser(root)
+
+        if max_size is None:
+            max_size = os.environ.get("YEL_CACHE_SIZE", DEFAULT_MAX_SIZE)
+
+        self.max_size = util.parse_size(max_size)
+
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+
+    @staticmethod
+    def spool(stream):
+        '''copy *stream* to a temporary file hashing it, return the hex
+        digest and the file positioned at the start'''
+        digest = hashlib.sha1()
+        spooled = tempfile.TemporaryFile(prefix="yel-cache-")
+
+        for chunk in iter_chunks(stream):
+            digest.update(chunk)
+            spooled.write(chunk)
+
+        spooled.seek(0)
+
+        return digest.hexdigest(), spooled
+
+    @staticmethod
+    def key(name, args, input_digest):
+        '''return the key for command *name* with *args* on an input with
+        hash *input_digest*'''
+        digest = hashlib.sha1()
+        digest.update(code_version())
+        digest.update(name.encode("utf-8"))
+        digest.update(util.canonical(args))
+        digest.update(input_digest)
+
+        return digest.hexdigest()
+
+    def path(self, key):
+        '''return the path of the entry for *key*'''
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        '''return the open file of the entry for *key* marking it as
+        recently used, None if there is no entry'''
+        path = self.path(key)
+
+        try:
+            handle = open(path, "rb")
+        except IOError:
+            return None
+
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return handle
+
+    def entries(self):
+        '''return a list of (last use, size, path) of the entries'''
+        result = []
+
+        for directory, _names, files in os.walk(self.root):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+
+                path = os.path.join(directory, name)
+
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                result.append((stat.st_mtime, stat.st_size, path))
+
+        return result
+
+    def evict(self):
+        '''remove the least recently used entries until the cache fits in
+        max_size'''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+            total -= size
+
+class LazyInput(object):
+    '''file like object that spools the input of *lookup* the first time
+    it's read'''
+
+    def __init__(self, lookup):
+        self.lookup = lookup
+
+    def read(self, size=-1):
+        '''read up to *size* bytes'''
+        return self.lookup.open().read(size)
+
+    def readline(self, size=-1):
+        '''read a line'''
+        return self.lookup.open().readline(size)
+
+    def __iter__(self):
+        return iter(self.lookup.open())
+
+class Lookup(object):
+    '''the cached output of command *name* with *args* on the input read
+    from *stream*, stream is the input to give to the command'''
+
+    def __init__(self, name, args, stream, cache=None):
+        self.cache = ResultCache() if cache is None else cache
+        self.name = name
+        # the command removes its defaults from the args it gets
+        self.args = copy.deepcopy(args)
+        self.source = stream
+        self.input_digest = NO_INPUT
+        self.spooled = None
+        # a hit found once the output is being written can't be used
+        self.running = True
+        self.stream = LazyInput(self)
+
+    def key(self):
+        '''return the key for the input read so far'''
+        return self.cache.key(self.name, self.args, self.input_digest)
+
+    def get(self):
+        '''return the open cached output for the input read so far, None
+        if there is none'''
+        return self.cache.get(self.key())
+
+    def open(self):
+        '''spool and hash the input the first time, raise Hit if there is
+        an output for it and the command is still running, return the
+        spooled input'''
+        if self.spooled is None:
+            self.input_digest, self.spooled = self.cache.spool(self.source)
+
+            if self.running and thread.get_ident() == MAIN_THREAD:
+                hit = self.get()
+
+                if hit is not None:
+                    raise Hit(hit)
+
+        return self.spooled
+
+    def entry(self):
+        '''mark that the command finished running and return an Entry to
+        store its output'''
+        self.running = False
+        return Entry(self)
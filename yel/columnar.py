@@ -0,0 +1,81 @@
+'''conversion between lists of objects (rows) and objects of lists
+(columns)
+
+a columnar value stores each key once with the list of values for all the
+rows, missing fields are null'''
+from collections import OrderedDict
+
+def to_columns(rows):
+    '''return an object with a list of values per key of the objects in the
+    *rows* iterable, keys are in order of appearance'''
+    columns = OrderedDict()
+    count = 0
+
+    for row in rows:
+        if not isinstance(row, dict):
+            raise ValueError("expected object for row %d, got: %s" % (count,
+                row))
+
+        for key in row:
+            if key not in columns:
+                columns[key] = [None] * count
+
+        for key, values in columns.iteritems():
+            values.append(row.get(key))
+
+        count += 1
+
+    return columns
+
+def size(columns):
+    '''return the number of rows in *columns*, raise ValueError if the
+    columns aren't lists of the same length'''
+    lengths = set()
+
+    for key, values in columns.iteritems():
+        if not isinstance(values, list):
+            raise ValueError("expected list for column %s, got: %s" % (key,
+                values))
+
+        lengths.add(len(values))
+
+    if len(lengths) > 1:
+        raise ValueError("expected columns of the same length, got: %s" %
+                ", ".join(str(length) for length in sorted(lengths)))
+
+    return lengths.pop() if lengths else 0
+
+def iter_rows(columns):
+    '''yield an object per row of *columns*'''
+    keys = columns.keys()
+    values = [columns[key] for key in keys]
+
+    for i in xrange(size(columns)):
+        yield dict((key, column[i]) for key, column in zip(keys, values))
+
+def column(data, name):
+    '''return the list of values of field *name* from columnar *data* or from
+    a list of objects'''
+    if isinstance(data, dict):
+        if name not in data:
+            raise ValueError("column not found: %s" % name)
+
+        return data[name]
+    elif isinstance(data, list):
+        return [row.get(name) if isinstance(row, dict) else None
+                for row in data]
+    else:
+        raise ValueError("expected object or list, got: %s" % data)
+
+def sort_by(data, name):
+    '''return columnar *data* with the rows sorted by column *name*, or the
+    list of objects *data* sorted by field *name*'''
+    if isinstance(data, list):
+        return sorted(data, key=lambda row: column([row], name)[0])
+
+    size(data)
+    values = column(data, name)
+    order = sorted(xrange(len(values)), key=values.__getitem__)
+
+    return OrderedDict((key, [items[i] for i in order])
+            for key, items in data.iteritems())
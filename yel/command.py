@@ -3,11 +3,23 @@ import os
 import sys
 import json
 
+from cStringIO import StringIO
+
+import shm
 import util
+import compress
+import store
+import tracing
+import instrument
 
 DEBUG = os.environ.get("YEL_DEBUG", False)
 STRICT_MODE = os.environ.get("YEL_STRICT", False)
 
+class BadRequest(ValueError):
+    '''raised for invalid input or state found while the command runs or
+    its streamed result is written, it ends the command with a bad request
+    status'''
+
 class JsonSerializable(object):
     '''class that can be serialized to/from json'''
 
@@ -76,8 +88,76 @@ class Result(JsonSerializable):
     @classmethod
     def from_exception(cls, ex):
         '''return a result from an exception'''
+        if isinstance(ex, MemoryError):
+            return cls(None, cls.ERROR, instrument.memory_error_reason())
+        elif isinstance(ex, BadRequest):
+            return cls.bad_request(str(ex))
+
         return cls(None, cls.ERROR, str(ex))
 
+class Stream(object):
+    '''command result that is produced lazily, items are written as they are
+    generated instead of building the whole result in memory
+
+    if ndjson is True every item is written as a json document on its own line
+    and flushed, otherwise the items are written as a json list in chunks of
+    CHUNK_SIZE items'''
+
+    CHUNK_SIZE = 1024
+
+    def __init__(self, items, ndjson=False):
+        self.items = items
+        self.ndjson = ndjson
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def write(self, out):
+        '''write the items to the file like object *out*'''
+        if self.ndjson:
+            for item in self.items:
+                out.write(json.dumps(item))
+                out.write('\n')
+                out.flush()
+        else:
+            # encoding a list of items is a single call to the C encoder
+            chunk = []
+            empty = True
+            out.write('[')
+
+            for item in self.items:
+                chunk.append(item)
+
+                if len(chunk) >= self.CHUNK_SIZE:
+                    empty = self.write_chunk(out, chunk, empty)
+
+            self.write_chunk(out, chunk, empty)
+            out.write(']\n')
+
+    @staticmethod
+    def write_chunk(out, chunk, empty):
+        '''write the items in *chunk* without the list brackets and clear it,
+        return if the output is still empty'''
+        if not chunk:
+            return empty
+
+        if not empty:
+            out.write(', ')
+
+        out.write(json.dumps(chunk)[1:-1])
+        del chunk[:]
+
+        return False
+
+class TextStream(Stream):
+    '''command result that is a lazy sequence of chunks of text that are
+    written as they are, for commands that output other formats than json'''
+
+    def write(self, out):
+        '''write the chunks to the file like object *out*'''
+        for chunk in self.items:
+            out.write(chunk)
+
 class Command(JsonSerializable):
     '''base command'''
 
@@ -86,14 +166,40 @@ class Command(JsonSerializable):
 
     EXPAND_SHORT_OPTIONS = {}
 
+    # long options that take no value, the args after them are defaults
+    BOOLEAN_OPTIONS = ()
+
+    # True to keep the defaults as the strings given instead of decoding
+    # them as json, for commands that take paths or expressions
+    RAW_DEFS = False
+
     DEFS = "__defaults__"
 
+    # False for commands whose result doesn't depend only on their args and
+    # input, they are never cached
+    DETERMINISTIC = True
+
+    # True for commands that modify their input in place, they get a copy
+    # when the input is shared with other commands
+    MUTATES_INPUT = False
+
+    # True for commands that read their input as text instead of json, they
+    # don't load shared memory descriptors
+    RAW_INPUT = False
+
+    # marks that the input wasn't given on invoke and must be read from stdin
+    NO_INPUT = object()
+
     def __init__(self, name, args, vars_):
         JsonSerializable.__init__(self)
 
         self.name = name
         self.args = args
         self.vars = vars_
+        self.input = Command.NO_INPUT
+        self.stream = None
+        # the raw input once opened, it can only be opened once
+        self.opened_stream = None
 
         self.defs = self.args.get(Command.DEFS, None)
 
@@ -105,11 +211,21 @@ class Command(JsonSerializable):
         return Result("")
 
     def get(self, name, default=None):
-        '''return var name from vars if set, otherwise return default'''
-        var = self.vars.get(name, default)
+        '''return var name from the store or vars if set, otherwise return
+        default'''
+        if store.ENABLED:
+            try:
+                value = store.default_store().get(name)
+            except ValueError as error:
+                raise BadRequest(str(error))
+
+            if value is not store.MISSING:
+                return value
+
+        var = self.vars.get(name)
 
         if var is None:
-            return var
+            return default
 
         try:
             return json.loads(var)
@@ -120,24 +236,138 @@ class Command(JsonSerializable):
                 return var
 
     def set(self, name, value):
-        '''set var name to vars'''
+        '''set var name to vars and to the store if enabled'''
+        if store.ENABLED:
+            try:
+                store.default_store().set(name, value)
+            except ValueError as error:
+                raise BadRequest(str(error))
+
         self.vars[name] = json.dumps(value)
 
     @classmethod
     def invoke(cls, data):
-        '''invoke the command with *data* as input'''
+        '''invoke the command with *data* as input
+
+        data can contain name, args, vars, input and stream, if input is set
+        the command uses it instead of reading stdin, if stream is set the
+        input is read from it instead of stdin
+
+        if tracing, span can be a tracing.Span for the run that the caller
+        ends, otherwise a span is created and ended here'''
         args = data.get("args", {})
         vars_ = data.get("vars", os.environ)
+        span = data.get("span")
+
+        if span is None and tracing.ENABLED:
+            owned = span = tracing.Span(cls.SHORT, vars_, args)
+        else:
+            owned = None
+
+        if span is not None:
+            vars_ = span.propagate(vars_)
 
         instance = cls(args, vars_)
 
+        if "input" in data:
+            instance.input = data["input"]
+
+        instance.stream = data.get("stream")
+
         try:
-            return instance.run()
+            result = instance.run()
         except Exception as ex:
             if DEBUG:
                 raise
             else:
-                return Result.from_exception(ex)
+                result = Result.from_exception(ex)
+
+        if owned is not None:
+            owned.end(result.status)
+
+        return result
+
+    def input_stream(self):
+        '''return the file like object to read the raw input from, for input
+        given on invoke a stream with it encoded as json, strings as they
+        are, gzip input is decompressed while it's read'''
+        if self.input is not Command.NO_INPUT:
+            if util.is_iterator(self.input):
+                self.input = list(self.input)
+
+            if isinstance(self.input, unicode):
+                return StringIO(self.input.encode("utf-8"))
+            elif isinstance(self.input, str):
+                return StringIO(self.input)
+            else:
+                return StringIO(json.dumps(self.input))
+
+        if self.opened_stream is None:
+            stream = sys.stdin if self.stream is None else self.stream
+
+            if tracing.ENABLED:
+                stream = tracing.stdin(stream)
+
+            self.opened_stream = compress.open_input(stream)
+
+        return self.opened_stream
+
+    def read_input(self):
+        '''return the input given on invoke, if none was given decode it from
+        stdin, an iterator given on invoke is consumed into a list and a
+        shared memory descriptor is replaced by its list'''
+        if self.input is not Command.NO_INPUT:
+            if util.is_iterator(self.input):
+                self.input = list(self.input)
+
+            return self.input
+
+        profile = instrument.ACTIVE
+
+        if profile is None:
+            return shm.load(json.load(self.input_stream()))
+        else:
+            return shm.load(profile.measure("input", json.load,
+                self.input_stream()))
+
+    def iter_input(self):
+        '''return an iterator over the input items, the items of a list given
+        on invoke or decoded one at a time from stdin, or the items of a
+        shared memory descriptor'''
+        if util.is_iterator(self.input):
+            return self.input
+        elif self.input is not Command.NO_INPUT:
+            return iter(util.listify(self.input))
+
+        return shm.expand(self.measure_input(
+            util.iter_json(self.input_stream())))
+
+    @staticmethod
+    def measure_input(items):
+        '''return *items* counting the time to get them as input if
+        profiling'''
+        profile = instrument.ACTIVE
+
+        if profile is None:
+            return items
+        else:
+            return profile.measure_iter("input", items)
+
+    def iter_input_lines(self):
+        '''return an iterator over the raw input lines, the lines of a string
+        or the items of a list given on invoke or the lines of stdin'''
+        if self.input is Command.NO_INPUT:
+            return self.measure_input(self.input_stream())
+
+        if isinstance(self.input, basestring):
+            lines = self.input.splitlines(True)
+        elif util.is_iterator(self.input):
+            lines = self.input
+        else:
+            lines = util.listify(self.input)
+
+        return (line.encode("utf-8") if isinstance(line, unicode) else line
+                for line in lines)
 
     def get_args(self):
         '''get args if there are some otherwise get them from stdin
@@ -149,7 +379,7 @@ class Command(JsonSerializable):
         elif len(self.args):
             return self.args
         else:
-            return json.load(sys.stdin)
+            return self.read_input()
 
     def get_default_args(self):
         '''get the default arguments from vars if set if not get them from
@@ -158,7 +388,7 @@ class Command(JsonSerializable):
         if self.defs is not None:
             return self.defs
         else:
-            return json.load(sys.stdin)
+            return self.read_input()
 
     def get_args_list(self, listify_item=False,
             return_single_flag=False, use_defaults_if_available=True):
@@ -173,7 +403,7 @@ class Command(JsonSerializable):
         if use_defaults_if_available and self.defs is not None:
             defs = self.defs
         else:
-            defs = json.load(sys.stdin)
+            defs = self.read_input()
 
         if listify_item:
             msg = "expected list or single item, got: %s"
@@ -196,6 +426,12 @@ class Command(JsonSerializable):
 
         return result
 
+    @classmethod
+    def reads_input(cls, params):
+        '''return True if the command run with the options in *params* reads
+        its input as json, by default if it has no positional args'''
+        return not cls.RAW_INPUT and Command.DEFS not in params
+
     @classmethod
     def parse_args(cls, args):
         '''parse command line args and return a dict object with the options'''
@@ -209,7 +445,9 @@ class Command(JsonSerializable):
             arg can be a string or a list of strings
             '''
 
-            if (val.isalnum() and val[0].isalpha() and
+            if arg == Command.DEFS and cls.RAW_DEFS:
+                value = val
+            elif (val.isalnum() and val[0].isalpha() and
                     not val in ("true", "false", "null")):
                 value = val
             else:
@@ -243,7 +481,12 @@ class Command(JsonSerializable):
                 last_arg = Command.DEFS
             elif arg.startswith("--"):
                 last_arg = arg[2:]
-                vals[last_arg] = []
+
+                if last_arg in cls.BOOLEAN_OPTIONS:
+                    vals[last_arg] = True
+                    last_arg = Command.DEFS
+                else:
+                    vals[last_arg] = []
 
             elif arg.startswith("-"):
 
@@ -259,6 +502,10 @@ class Command(JsonSerializable):
                         last_arg.append(long_option)
                         vals[long_option] = True
 
+                    if all(option in cls.BOOLEAN_OPTIONS
+                            for option in last_arg):
+                        last_arg = Command.DEFS
+
             else:
                 add_option(last_arg, arg)
 
@@ -274,6 +521,17 @@ class Command(JsonSerializable):
 
         return result
 
+    @classmethod
+    def is_deterministic(cls, args):
+        '''return True if the result of a run with *args* depends only on
+        args and the input, so it can be cached'''
+        return cls.DETERMINISTIC
+
+    def get_flag(self, key):
+        '''return True if the option *key* was given and not set to false,
+        a long option without value is parsed as an empty list'''
+        return self.args.get(key, False) is not False
+
     def get_arg_type(self, key, type_, default=None, name=None):
         '''try to get self.args[key], check if it's type *type_* if not raise
         ValueError if not found return default'''
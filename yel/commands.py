@@ -1,15 +1,34 @@
 #!/usr/bin/env python
 '''command repository'''
 import os
+import re
 import sys
 import json
+import errno
+import heapq
+import shlex
 import random
 
 import pystache
 
+import aho
 import util
-
-from command import Command, Result
+import cache
+import instrument
+import regex
+import shm
+import store
+import common
+import compress
+import columnar
+import convert
+import fsindex
+import jsonpath
+import setops
+import strops
+import tracing
+
+from command import Command, Result, Stream, TextStream, BadRequest, DEBUG
 
 COMMANDS = {}
 
@@ -19,12 +38,16 @@ class Environment(Command):
     SHORT = "env"
     LONG = "environemnt"
 
+    DETERMINISTIC = False
+
     USAGE = '''env get foo; env get foo "default"; env set foo "value"'''
 
     EXPAND_SHORT_OPTIONS = {
         "f": "fail"
     }
 
+    BOOLEAN_OPTIONS = ("fail",)
+
     def __init__(self, args, vars_):
         Command.__init__(self, self.SHORT, args, vars_)
 
@@ -42,8 +65,13 @@ class Environment(Command):
             return Result.bad_request("expected 2 or 3 args")
 
         if action == "get":
-            fail = self.args.get("fail", False)
-            result = self.get(name, value, fail)
+            result = self.get(name, store.MISSING)
+
+            if result is store.MISSING:
+                if self.get_flag("fail"):
+                    return Result.not_found("var %s not set" % name)
+
+                result = value
         elif action == "set":
             result = self.set(name, value)
         else:
@@ -52,11 +80,22 @@ class Environment(Command):
         return Result.ok(result)
 
 class MultiTypeCommand(Command):
-    '''base command that modifies arguments dependent on type'''
+    '''base command that modifies arguments dependent on type
+
+    if COLUMNAR is True the -c/--column option processes a single column of
+    columnar data or a single field of a list of objects'''
+
+    COLUMNAR = False
 
     def __init__(self, args, vars_):
         Command.__init__(self, self.SHORT, args, vars_)
 
+    @classmethod
+    def reads_input(cls, params):
+        '''the options are processed instead of the input if there are
+        any besides the column'''
+        return all(cls.COLUMNAR and key == "column" for key in params)
+
     def process_list(self, items):
         '''do the process on items'''
         return items
@@ -69,11 +108,22 @@ class MultiTypeCommand(Command):
         '''do the process on single value'''
         return item
 
+    def process_column(self, data, name):
+        '''do the process on column *name* of *data*'''
+        return self.process_list(columnar.column(data, name))
+
     def run(self):
         '''run the command and return result'''
+        # remove it so it's not taken as the arguments to process
+        column = self.args.pop("column", None) if self.COLUMNAR else None
         args = self.get_args()
 
-        if isinstance(args, list):
+        if column is not None:
+            if not isinstance(column, basestring):
+                return Result.bad_request("expected a column name")
+
+            return Result.ok(self.process_column(args, column))
+        elif isinstance(args, list):
             return Result.ok(self.process_list(args))
         elif isinstance(args, dict):
             # if it's a dict and there are default arguments remove them
@@ -98,6 +148,12 @@ class Size(MultiTypeCommand):
     SHORT = "size"
     LONG = "size"
 
+    COLUMNAR = True
+
+    EXPAND_SHORT_OPTIONS = {
+        "c": "column"
+    }
+
     def __init__(self, args, vars_):
         MultiTypeCommand.__init__(self, args, vars_)
 
@@ -306,6 +362,8 @@ class Reverse(MultiTypeCommand):
     SHORT = "reverse"
     LONG = "reverse"
 
+    MUTATES_INPUT = True
+
     def __init__(self, args, vars_):
         MultiTypeCommand.__init__(self, args, vars_)
 
@@ -320,6 +378,14 @@ class Sort(MultiTypeCommand):
     SHORT = "sort"
     LONG = "sort"
 
+    MUTATES_INPUT = True
+
+    COLUMNAR = True
+
+    EXPAND_SHORT_OPTIONS = {
+        "c": "column"
+    }
+
     def __init__(self, args, vars_):
         MultiTypeCommand.__init__(self, args, vars_)
 
@@ -328,11 +394,19 @@ class Sort(MultiTypeCommand):
         items.sort()
         return items
 
+    def process_column(self, data, name):
+        '''sort the rows by column *name*'''
+        return columnar.sort_by(data, name)
+
 class Shuffle(MultiTypeCommand):
     '''command to shuffle the content of the arguments if is a list'''
     SHORT = "shuffle"
     LONG = "shuffle"
 
+    DETERMINISTIC = False
+
+    MUTATES_INPUT = True
+
     def __init__(self, args, vars_):
         MultiTypeCommand.__init__(self, args, vars_)
 
@@ -346,6 +420,12 @@ class Min(MultiTypeCommand):
     SHORT = "min"
     LONG = "minimum"
 
+    COLUMNAR = True
+
+    EXPAND_SHORT_OPTIONS = {
+        "c": "column"
+    }
+
     def __init__(self, args, vars_):
         MultiTypeCommand.__init__(self, args, vars_)
 
@@ -359,6 +439,12 @@ class Max(MultiTypeCommand):
     SHORT = "max"
     LONG = "maximum"
 
+    COLUMNAR = True
+
+    EXPAND_SHORT_OPTIONS = {
+        "c": "column"
+    }
+
     def __init__(self, args, vars_):
         MultiTypeCommand.__init__(self, args, vars_)
 
@@ -460,7 +546,7 @@ class Filter(Command):
         items = self.args.get(Command.DEFS, None)
 
         if items is None:
-            items = json.load(sys.stdin)
+            items = self.read_input()
 
         filter_names = self.args.get("type", None)
 
@@ -506,10 +592,19 @@ class StrCommand(MultiTypeCommand):
 
     ARG_PROCESS = None
 
+    # option with the needles or the path to a json file with them
+    NEEDLES_OPTION = None
+
     def __init__(self, args, vars_):
         Command.__init__(self, self.SHORT, args, vars_)
         self.ignore_other_types = True
 
+    @classmethod
+    def is_deterministic(cls, args):
+        '''the needles file can change between runs'''
+        return (cls.DETERMINISTIC and
+                not isinstance(args.get(cls.NEEDLES_OPTION), basestring))
+
     def process_list(self, items, args=None):
         '''do the process on items'''
 
@@ -521,17 +616,7 @@ class StrCommand(MultiTypeCommand):
         if callable(process):
             args = [process(arg) for arg in args]
 
-        result = []
-        for item in items:
-            if isinstance(item, basestring):
-                if self.EXPAND_ARGS:
-                    result.append(getattr(item, self.OP)(*args))
-                else:
-                    result.append(getattr(item, self.OP)(args))
-            else:
-                result.append(item)
-
-        return result
+        return strops.apply(self.OP, items, args, self.EXPAND_ARGS)
 
     def process_object(self, items):
         '''do the process on items'''
@@ -551,6 +636,37 @@ class StrCommand(MultiTypeCommand):
         '''do the process on single value'''
         return self.process_list([item], args)[0]
 
+    def get_needles(self, option, args):
+        '''return the list of needles set in *option*, if the option is a
+        string it's the path to a json file with the needles, if it's a flag
+        the needles are the command args, return None if option isn't set'''
+        value = self.args.get(option, None)
+
+        if value is None or value is False:
+            return None
+        elif value is True or value == []:
+            needles = util.listify(args)
+        elif isinstance(value, basestring):
+            with open(value) as handle:
+                needles = json.load(handle)
+        else:
+            needles = util.listify(value)
+
+        return util.expect_list_of(basestring, needles, option)
+
+    def process_needles(self, items, option, args, method):
+        '''apply *method* of an automaton built from the needles in *option*
+        to all the strings in items, return None if option isn't set'''
+        needles = self.get_needles(option, args)
+
+        if needles is None:
+            return None
+
+        operation = getattr(aho.load(needles), method)
+
+        return [operation(item) if isinstance(item, basestring) else item
+                for item in items]
+
 class StrUpper(StrCommand):
     '''make string uppercase'''
 
@@ -599,6 +715,19 @@ class StrContains(StrCommand):
 
     OP = "__contains__"
 
+    NEEDLES_OPTION = "any"
+
+    def process_list(self, items, args=None):
+        '''do the process on items, with --any check all the needles in a
+        single pass'''
+        result = self.process_needles(items, self.NEEDLES_OPTION, args,
+                "contains_any")
+
+        if result is None:
+            return StrCommand.process_list(self, items, args)
+        else:
+            return result
+
 class StrFind(StrCommand):
     '''find needle in string'''
 
@@ -607,6 +736,19 @@ class StrFind(StrCommand):
 
     OP = "find"
 
+    NEEDLES_OPTION = "all"
+
+    def process_list(self, items, args=None):
+        '''do the process on items, with --all return the position of every
+        needle found in a single pass'''
+        result = self.process_needles(items, self.NEEDLES_OPTION, args,
+                "find_all")
+
+        if result is None:
+            return StrCommand.process_list(self, items, args)
+        else:
+            return result
+
 class StrIsAlnum(StrCommand):
     '''check if string is alnum'''
 
@@ -697,7 +839,7 @@ class StrLeftJustify(StrCommand):
     SHORT = "s.ljustify"
     LONG  = "s.left.justify"
 
-    OP = "ljustify"
+    OP = "ljust"
 
 class StrLeftFind(StrCommand):
     '''apply left find to a string'''
@@ -705,7 +847,7 @@ class StrLeftFind(StrCommand):
     SHORT = "s.lfind"
     LONG  = "s.left.find"
 
-    OP = "lfind"
+    OP = "find"
 
 class StrRightTrim(StrCommand):
     '''apply right strip to a string'''
@@ -721,7 +863,7 @@ class StrRightJustify(StrCommand):
     SHORT = "s.rjustify"
     LONG  = "s.right.justify"
 
-    OP = "rjustify"
+    OP = "rjust"
 
 class StrRightFind(StrCommand):
     '''apply right find to a string'''
@@ -747,6 +889,111 @@ class StrStrip(StrCommand):
 
     OP = "strip"
 
+class StrRegexCommand(StrCommand):
+    '''base command for commands that apply a regular expression to strings,
+    the first argument is the pattern'''
+
+    EXPAND_SHORT_OPTIONS = {
+        "a": "args",
+        "i": "ignorecase"
+    }
+
+    BOOLEAN_OPTIONS = ("ignorecase",)
+
+    def run(self):
+        '''run the command and return result'''
+        try:
+            return StrCommand.run(self)
+        except re.error as error:
+            return Result.bad_request("invalid pattern: %s" % error)
+
+    def process_list(self, items, args=None):
+        '''do the process on items'''
+
+        args = util.listify(args or [])
+
+        if len(args) == 0:
+            raise ValueError("pattern argument required")
+
+        flags = 0
+        if self.get_flag("ignorecase"):
+            flags |= re.IGNORECASE
+
+        pattern = regex.compile(self.to_string(args[0]), flags)
+
+        return [self.apply(pattern, item, args[1:])
+                if isinstance(item, basestring) else item for item in items]
+
+    @staticmethod
+    def to_string(value):
+        '''return *value* as a string'''
+        if isinstance(value, basestring):
+            return value
+        else:
+            return str(value)
+
+    @staticmethod
+    def match_value(match):
+        '''return the matched string if the pattern has no groups, the list of
+        groups otherwise and None if there was no match'''
+        if match is None:
+            return None
+        elif match.re.groups:
+            return list(match.groups())
+        else:
+            return match.group(0)
+
+    def apply(self, pattern, item, args):
+        '''apply the compiled *pattern* to *item*'''
+        return item
+
+class StrMatch(StrRegexCommand):
+    '''match a regular expression at the beginning of a string'''
+
+    SHORT = "s.match"
+    LONG  = "s.match"
+
+    def apply(self, pattern, item, args):
+        '''apply the compiled *pattern* to *item*'''
+        return self.match_value(pattern.match(item))
+
+class StrSearch(StrRegexCommand):
+    '''search a regular expression anywhere in a string'''
+
+    SHORT = "s.search"
+    LONG  = "s.search"
+
+    def apply(self, pattern, item, args):
+        '''apply the compiled *pattern* to *item*'''
+        return self.match_value(pattern.search(item))
+
+class StrSub(StrRegexCommand):
+    '''replace the matches of a regular expression in a string'''
+
+    SHORT = "s.sub"
+    LONG  = "s.substitute"
+
+    def apply(self, pattern, item, args):
+        '''apply the compiled *pattern* to *item*'''
+        if len(args) == 0:
+            raise ValueError("replacement argument required")
+
+        count = 0
+        if len(args) > 1:
+            count = util.expect_int(args[1], "count")
+
+        return pattern.sub(self.to_string(args[0]), item, count)
+
+class StrFindAll(StrRegexCommand):
+    '''find all the matches of a regular expression in a string'''
+
+    SHORT = "s.findall"
+    LONG  = "s.find.all"
+
+    def apply(self, pattern, item, args):
+        '''apply the compiled *pattern* to *item*'''
+        return pattern.findall(item)
+
 class DefaultIterator(MultiTypeCommand):
     '''base class for commands that iterate over default args'''
 
@@ -915,6 +1162,8 @@ class Append(MultiTypeCommand):
     SHORT = "append"
     LOND  = "append"
 
+    MUTATES_INPUT = True
+
     EXPAND_SHORT_OPTIONS = {
         "i": "items"
     }
@@ -942,6 +1191,911 @@ class Append(MultiTypeCommand):
         '''do the process on single value'''
         return self.process_list([item])
 
+class FileSystem(Command):
+    '''command to snapshot filesystem metadata and query it without touching
+    the filesystem'''
+
+    SHORT = "fs"
+    LONG = "filesystem"
+
+    DETERMINISTIC = False
+
+    USAGE = '''fs snapshot PATH...; fs refresh [--full]; fs query [-t d]
+    [-u user] [-g group] [--min-size N] [--max-size N] [--newer T] [--older T]
+    [-p PATH]'''
+
+    DEFAULT_INDEX = "~/.yel/fs.index"
+
+    EXPAND_SHORT_OPTIONS = {
+        "i": "index",
+        "t": "type",
+        "u": "user",
+        "g": "group",
+        "p": "path"
+    }
+
+    BOOLEAN_OPTIONS = ("full",)
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    def run(self):
+        '''run the command and return result'''
+
+        args = util.listify(self.get_default_args())
+
+        if len(args) == 0:
+            return Result.bad_request("expected an action")
+
+        action = args[0]
+        index_path = os.path.expanduser(str(self.args.get("index",
+            self.DEFAULT_INDEX)))
+        index = fsindex.FsIndex.load(index_path)
+
+        if action == "snapshot":
+            paths = args[1:]
+
+            if len(paths) == 0:
+                return Result.bad_request("expected at least one path")
+
+            count = sum(index.snapshot(str(path)) for path in paths)
+            index.save()
+
+            return Result.ok(dict(index=index_path, entries=count,
+                roots=index.roots))
+        elif action == "refresh":
+            result = index.refresh(self.get_flag("full"))
+            index.save()
+            result["entries"] = len(index.entries)
+
+            return Result.ok(result)
+        elif action == "query":
+            files = index.query(self.args.get("type", None),
+                    self.args.get("user", None),
+                    self.args.get("group", None),
+                    self.get_arg_type("min-size", int, None),
+                    self.get_arg_type("max-size", int, None),
+                    self.args.get("newer", None),
+                    self.args.get("older", None),
+                    self.args.get("path", None))
+
+            return Result.ok([file_.to_json() for file_ in files])
+        else:
+            return Result.bad_request(
+                    "expected valid action snapshot, refresh or query")
+
+class Watch(Command):
+    '''command to stream the changes below a path as File records, one json
+    document per line'''
+
+    SHORT = "watch"
+    LONG = "watch"
+
+    DETERMINISTIC = False
+
+    USAGE = '''watch PATH [-d seconds] [-c count] [-t seconds] [--flat]'''
+
+    EXPAND_SHORT_OPTIONS = {
+        "d": "debounce",
+        "c": "count",
+        "t": "timeout"
+    }
+
+    BOOLEAN_OPTIONS = ("flat",)
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    def run(self):
+        '''run the command and return result'''
+
+        paths = util.listify(self.get_default_args())
+
+        if len(paths) != 1 or not isinstance(paths[0], basestring):
+            return Result.bad_request("expected one path")
+
+        debounce = self.get_arg_type("debounce", (int, float), 0.2)
+        count = self.get_arg_type("count", int, None)
+        timeout = self.get_arg_type("timeout", (int, float), None)
+        recursive = not self.get_flag("flat")
+
+        import inotify
+
+        try:
+            watcher = inotify.Watcher(str(paths[0]), recursive, debounce)
+        except OSError as error:
+            if error.errno == errno.ENOENT:
+                return Result.not_found("path not found: %s" % paths[0])
+
+            return Result.bad_request("can't watch %s: %s" % (paths[0],
+                error.strerror))
+
+        return Result.ok(Stream(self.records(watcher, count, timeout), True))
+
+    def records(self, watcher, count, timeout):
+        '''yield a record for each change reported by *watcher*'''
+        emitted = 0
+
+        try:
+            for batch in watcher.batches(timeout):
+                for event, path in batch:
+                    yield self.record(event, path)
+                    emitted += 1
+
+                    if count is not None and emitted >= count:
+                        return
+        except KeyboardInterrupt:
+            return
+        finally:
+            watcher.close()
+
+    @staticmethod
+    def record(event, path):
+        '''return the File record for *path* with the *event* that changed
+        it'''
+        import inotify
+
+        if event != inotify.DELETE:
+            try:
+                result = common.File.from_stat(path, os.lstat(path)).to_json()
+                result["event"] = event
+                return result
+            except OSError:
+                event = inotify.DELETE
+
+        return dict(event=event, name=os.path.basename(path), path=path)
+
+class DiskUsage(Command):
+    '''command to sum sizes per directory, user or group across a tree'''
+
+    SHORT = "du"
+    LONG = "disk-usage"
+
+    DETERMINISTIC = False
+
+    USAGE = '''du PATH [-b dir|user|group] [-n top] [-d depth] [-w workers]
+    [-a] [-P]'''
+
+    EXPAND_SHORT_OPTIONS = {
+        "b": "by",
+        "n": "top",
+        "d": "depth",
+        "w": "workers",
+        "a": "apparent",
+        "P": "processes"
+    }
+
+    BOOLEAN_OPTIONS = ("apparent", "processes")
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    def run(self):
+        '''run the command and return result'''
+
+        paths = util.listify(self.get_default_args())
+
+        if len(paths) != 1 or not isinstance(paths[0], basestring):
+            return Result.bad_request("expected one path")
+
+        by = self.args.get("by", "dir")
+        top = self.get_arg_type("top", int, None)
+        depth = self.get_arg_type("depth", int, None)
+
+        import fstools
+
+        usage = fstools.DiskUsage(str(paths[0]),
+                self.get_flag("apparent"),
+                self.get_arg_type("workers", int, None),
+                self.get_flag("processes"))
+
+        if by == "dir":
+            records = self.dir_records(usage, depth)
+
+            if top is None:
+                return Result.ok(Stream(records, True))
+            else:
+                return Result.ok(heapq.nlargest(top, records,
+                    key=lambda record: record["size"]))
+        elif by == "user" or by == "group":
+            for _ in usage.directories():
+                pass
+
+            if by == "user":
+                sums, get_name = usage.users, common.user_name
+            else:
+                sums, get_name = usage.groups, common.group_name
+
+            records = [{by: get_name(id_), "id": id_, "size": size}
+                    for id_, size in sums.iteritems()]
+            records.sort(key=lambda record: record["size"], reverse=True)
+
+            return Result.ok(records[:top])
+        else:
+            return Result.bad_request("expected by to be dir, user or group")
+
+    @staticmethod
+    def dir_records(usage, depth):
+        '''yield a record for each directory up to *depth* levels below the
+        root'''
+        for path, size in usage.directories():
+            if (depth is None or
+                    path[len(usage.root):].count(os.sep) <= depth):
+                yield dict(path=path, size=size)
+
+class Duplicates(Command):
+    '''command to find groups of files with the same content'''
+
+    SHORT = "dupes"
+    LONG = "duplicates"
+
+    DETERMINISTIC = False
+
+    USAGE = '''dupes PATH... [-m min-size] [-w workers]'''
+
+    EXPAND_SHORT_OPTIONS = {
+        "m": "min-size",
+        "w": "workers"
+    }
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    def run(self):
+        '''run the command and return result'''
+
+        paths = util.listify(self.get_default_args())
+
+        if (len(paths) == 0 or
+                not all(isinstance(path, basestring) for path in paths)):
+            return Result.bad_request("expected one or more paths")
+
+        import fstools
+
+        dupes = fstools.Duplicates([str(path) for path in paths],
+                self.get_arg_type("min-size", int, 1),
+                self.get_arg_type("workers", int, None))
+
+        return Result.ok(Stream(dupes.groups()))
+
+class Map(Command):
+    '''command to apply another command to every item of a list'''
+
+    SHORT = "map"
+    LONG = "map"
+
+    DETERMINISTIC = False
+
+    USAGE = '''map -c s.upper -- a b; map -c 'render -t {{value}}' [-w workers]
+    [-s chunk-size]'''
+
+    EXPAND_SHORT_OPTIONS = {
+        "c": "command",
+        "w": "workers",
+        "s": "chunk-size"
+    }
+
+    # don't start a pool for less items than this
+    MIN_PARALLEL_ITEMS = 256
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    def run(self):
+        '''run the command and return result'''
+
+        command = self.args.get("command", None)
+
+        if not isinstance(command, basestring):
+            return Result.bad_request("command parameter required")
+
+        parts = shlex.split(str(command))
+
+        if len(parts) == 0:
+            return Result.bad_request("command parameter required")
+
+        name = parts[0].lstrip("@")
+
+        if name not in COMMANDS:
+            return Result.not_found("command %s not found" % name)
+
+        params = COMMANDS[name].parse_args(parts[1:])
+        items, single = self.get_args_list(True, True)
+
+        import multiprocessing
+
+        workers = self.get_arg_type("workers", int, None)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+
+        chunk_size = self.get_arg_type("chunk-size", int, None)
+        if chunk_size is None:
+            chunk_size = max(1, len(items) // (workers * 4))
+
+        chunks = [items[i:i + chunk_size]
+                for i in xrange(0, len(items), chunk_size)]
+        jobs = [(name, params, dict(self.vars), chunk) for chunk in chunks]
+
+        if workers <= 1 or len(items) < self.MIN_PARALLEL_ITEMS:
+            outputs = [map_chunk(job) for job in jobs]
+        else:
+            pool = multiprocessing.Pool(workers)
+
+            try:
+                outputs = pool.map(map_chunk, jobs)
+            finally:
+                pool.close()
+                pool.join()
+
+        result = []
+
+        for output in outputs:
+            for status, reason, value in output:
+                if status != Result.OK:
+                    return Result(None, status, reason)
+
+                result.append(value)
+
+        if single:
+            return Result.ok(result[0])
+        else:
+            return Result.ok(result)
+
+def map_chunk(job):
+    '''invoke command *name* once per item of chunk, return a list of
+    (status, reason, result) tuples'''
+    name, params, vars_, chunk = job
+
+    if not COMMANDS:
+        load_commands()
+
+    cls = COMMANDS[name]
+    output = []
+
+    for item in chunk:
+        result = cls.invoke(dict(name=name, args=dict(params), vars=vars_,
+            input=item))
+        value = result.result
+
+        if isinstance(value, Stream):
+            value = list(value)
+
+        output.append((result.status, result.reason, value))
+
+        if result.status != Result.OK:
+            break
+
+    return output
+
+class GroupBy(Command):
+    '''command to group items by some fields and aggregate each group in a
+    single pass over the input'''
+
+    SHORT = "groupby"
+    LONG = "group-by"
+
+    USAGE = '''groupby -k field... -a count,sum:field,min:field,max:field,
+    mean:field [-m max-groups] [--partial] [--merge]'''
+
+    EXPAND_SHORT_OPTIONS = {
+        "k": "key",
+        "a": "agg",
+        "m": "max-groups"
+    }
+
+    BOOLEAN_OPTIONS = ("merge", "partial")
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    def run(self):
+        '''run the command and return result'''
+
+        keys = util.listify(self.args.get("key", []))
+
+        if len(keys) == 0:
+            return Result.bad_request("key parameter required")
+
+        aggs = []
+        for spec in util.listify(self.args.get("agg", "count")):
+            aggs.extend(part for part in str(spec).split(",") if part)
+
+        import aggregate
+
+        max_groups = self.get_arg_type("max-groups", int,
+                aggregate.DEFAULT_MAX_GROUPS)
+
+        # unknown aggregations and invalid paths are rejected here
+        try:
+            grouper = aggregate.GroupBy([str(key) for key in keys], aggs,
+                    max_groups)
+        except ValueError as error:
+            return Result.bad_request(str(error))
+
+        if self.defs is not None:
+            items = util.listify(self.defs)
+        else:
+            items = self.iter_input()
+
+        try:
+            if self.get_flag("merge"):
+                for item in items:
+                    grouper.add_partial(item)
+            else:
+                for item in items:
+                    grouper.add(item)
+        except:
+            grouper.close()
+            raise
+
+        partial = self.get_flag("partial")
+
+        return Result.ok(Stream(grouper.results(partial)))
+
+class HashJoin(Command):
+    '''command to join two json datasets on some fields, the smaller input
+    is loaded in a hash table if its file is at most max-build-size bytes (k,
+    m and g suffixes allowed, default 256m), otherwise both inputs are
+    partitioned on disk'''
+
+    SHORT = "hjoin"
+    LONG = "hash-join"
+
+    DETERMINISTIC = False
+
+    # the input side is streamed as it is
+    RAW_INPUT = True
+
+    USAGE = '''hjoin -l left.json -r right.json -o field...
+    [--how inner|left|anti] [-m max-build-size]'''
+
+    EXPAND_SHORT_OPTIONS = {
+        "l": "left",
+        "r": "right",
+        "o": "on",
+        "m": "max-build-size"
+    }
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    def run(self):
+        '''run the command and return result'''
+
+        on = util.listify(self.args.get("on", []))
+
+        if len(on) == 0:
+            return Result.bad_request("on parameter required")
+
+        left = self.get_side("left")
+        right = self.get_side("right")
+
+        if left.path is None and right.path is None:
+            return Result.bad_request("left or right parameter required")
+
+        import hashjoin
+
+        how = self.args.get("how", hashjoin.INNER)
+
+        if how not in hashjoin.HOWS:
+            return Result.bad_request("expected how to be one of %s, got: %s"
+                    % (", ".join(hashjoin.HOWS), how))
+
+        try:
+            max_build_size = util.parse_size(self.args.get("max-build-size",
+                hashjoin.DEFAULT_MAX_BUILD_SIZE))
+        except ValueError:
+            return Result.bad_request("expected a size for max-build-size")
+
+        joiner = hashjoin.HashJoin([str(field) for field in on], how,
+                max_build_size)
+
+        return Result.ok(Stream(joiner.join(left, right)))
+
+    def get_side(self, name):
+        '''return the join side set in option *name*, stdin if not set'''
+        import hashjoin
+
+        path = self.args.get(name, None)
+
+        if path is None or path == "-":
+            return hashjoin.Side(stream=self.input_stream())
+        elif isinstance(path, basestring):
+            return hashjoin.Side(path)
+        else:
+            raise ValueError("expected a path for %s, got: %s" % (name,
+                str(path)))
+
+class SetOperation(Command):
+    '''base command for set operations between two or more lists'''
+
+    DETERMINISTIC = False
+
+    OPERATION = setops.UNION
+
+    EXPAND_SHORT_OPTIONS = {
+        "i": "inputs",
+        "s": "sorted"
+    }
+
+    BOOLEAN_OPTIONS = ("sorted",)
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    @classmethod
+    def reads_input(cls, params):
+        '''the inputs are read from files with -i'''
+        return Command.DEFS not in params and "inputs" not in params
+
+    def run(self):
+        '''run the command and return result'''
+
+        paths = self.args.get("inputs", None)
+
+        if paths is not None:
+            paths = util.expect_list_of(basestring, util.listify(paths),
+                    "inputs")
+            inputs = [util.iter_json_file(path) for path in paths]
+        else:
+            inputs = self.get_default_args()
+            util.expect_list_of(list, inputs, "inputs")
+
+        if len(inputs) < 2:
+            return Result.bad_request("expected two or more inputs")
+
+        is_sorted = self.get_flag("sorted")
+
+        return Result.ok(Stream(self.items(setops.apply(self.OPERATION,
+            inputs, is_sorted))))
+
+    @staticmethod
+    def items(result):
+        '''yield the items of *result*, unsorted input with --sorted is a
+        bad request'''
+        try:
+            for item in result:
+                yield item
+        except setops.NotSorted as error:
+            raise BadRequest(str(error))
+
+class Union(SetOperation):
+    '''return the unique items that are in any of the lists'''
+
+    SHORT = "union"
+    LONG = "union"
+
+    OPERATION = setops.UNION
+
+class Intersect(SetOperation):
+    '''return the unique items that are in all of the lists'''
+
+    SHORT = "intersect"
+    LONG = "intersection"
+
+    OPERATION = setops.INTERSECT
+
+class Difference(SetOperation):
+    '''return the unique items of the first list that are in none of the
+    others'''
+
+    SHORT = "difference"
+    LONG = "difference"
+
+    OPERATION = setops.DIFFERENCE
+
+class Get(Command):
+    '''command to get the values at some paths like a.b[3].c from the input,
+    with -e from each item of the input'''
+
+    SHORT = "get"
+    LONG = "get"
+
+    USAGE = '''get a.b[3].c; get -e name; get -e name address.city'''
+
+    EXPAND_SHORT_OPTIONS = {
+        "e": "each"
+    }
+
+    BOOLEAN_OPTIONS = ("each",)
+
+    RAW_DEFS = True
+
+    EACH = False
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    def run(self):
+        '''run the command and return result'''
+
+        expressions = util.listify(self.defs if self.defs is not None else [])
+
+        if len(expressions) == 0:
+            return Result.bad_request("expected one or more paths")
+
+        try:
+            paths = [jsonpath.compile(expression)
+                    for expression in expressions]
+        except ValueError as error:
+            return Result.bad_request(str(error))
+
+        if len(paths) == 1:
+            path = paths[0]
+            accessor = path.get
+        else:
+            accessor = lambda item: [path.get(item) for path in paths]
+
+        if self.EACH or self.get_flag("each"):
+            return Result.ok(Stream(accessor(item)
+                for item in self.iter_input()))
+        else:
+            return Result.ok(accessor(self.read_input()))
+
+class Pluck(Get):
+    '''command to get the values at some paths from each item of the
+    input'''
+
+    SHORT = "pluck"
+    LONG = "pluck"
+
+    USAGE = '''pluck name; pluck name address.city'''
+
+    EACH = True
+
+class CsvCommand(Command):
+    '''base class for commands that read or write csv'''
+
+    def get_delimiter(self):
+        '''return the delimiter from the delimiter and tsv options'''
+        if self.get_flag("tsv"):
+            return "\t"
+
+        delimiter = str(self.args.get("delimiter", ","))
+
+        if delimiter == "\\t":
+            return "\t"
+        elif len(delimiter) != 1:
+            raise ValueError("expected a one character delimiter, got: %s" %
+                    delimiter)
+
+        return delimiter
+
+class FromCsv(CsvCommand):
+    '''command to convert csv rows from the input to json lists or objects'''
+
+    SHORT = "from-csv"
+    LONG = "from-csv"
+
+    USAGE = '''from-csv [-f objects|arrays] [-d delimiter] [-t] [-n] [-i]
+    [-s sample]'''
+
+    EXPAND_SHORT_OPTIONS = {
+        "f": "format",
+        "d": "delimiter",
+        "t": "tsv",
+        "n": "no-header",
+        "i": "infer",
+        "s": "sample"
+    }
+
+    BOOLEAN_OPTIONS = ("tsv", "no-header", "infer")
+
+    RAW_INPUT = True
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    def run(self):
+        '''run the command and return result'''
+
+        format_ = self.args.get("format", convert.OBJECTS)
+        header = not self.get_flag("no-header")
+
+        if format_ not in convert.FORMATS:
+            return Result.bad_request("expected format to be one of %s" %
+                    ", ".join(convert.FORMATS))
+        elif format_ == convert.OBJECTS and not header:
+            return Result.bad_request("objects format requires a header")
+
+        rows = convert.read_csv(self.iter_input_lines(), self.get_delimiter(),
+                header, format_, self.get_flag("infer"),
+                self.get_arg_type("sample", int, convert.DEFAULT_SAMPLE))
+
+        return Result.ok(Stream(rows))
+
+class ToCsv(CsvCommand):
+    '''command to convert the json lists or objects from the input to csv
+    rows'''
+
+    SHORT = "to-csv"
+    LONG = "to-csv"
+
+    USAGE = '''to-csv [-c column...] [-d delimiter] [-t] [-n]'''
+
+    EXPAND_SHORT_OPTIONS = {
+        "c": "columns",
+        "d": "delimiter",
+        "t": "tsv",
+        "n": "no-header"
+    }
+
+    BOOLEAN_OPTIONS = ("tsv", "no-header")
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    def run(self):
+        '''run the command and return result'''
+
+        columns = self.args.get("columns", None)
+
+        if columns is not None:
+            columns = util.listify(columns)
+
+        chunks = convert.write_csv(self.iter_input(), self.get_delimiter(),
+                not self.get_flag("no-header"), columns)
+
+        return Result.ok(TextStream(chunks))
+
+class FromLines(Command):
+    '''command to convert the lines of the input to a list of strings'''
+
+    SHORT = "from-lines"
+    LONG = "from-lines"
+
+    USAGE = '''from-lines [-e]'''
+
+    EXPAND_SHORT_OPTIONS = {
+        "e": "skip-empty"
+    }
+
+    BOOLEAN_OPTIONS = ("skip-empty",)
+
+    RAW_INPUT = True
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    def run(self):
+        '''run the command and return result'''
+
+        return Result.ok(Stream(convert.read_lines(self.iter_input_lines(),
+            self.get_flag("skip-empty"))))
+
+class Columns(Command):
+    '''command to convert a list of objects to an object with the list of
+    values of each field'''
+
+    SHORT = "columns"
+    LONG = "columns"
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    def run(self):
+        '''run the command and return result'''
+        return Result.ok(columnar.to_columns(self.iter_input()))
+
+class Rows(Command):
+    '''command to convert an object with lists of values per field to a list
+    of objects'''
+
+    SHORT = "rows"
+    LONG = "rows"
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    def run(self):
+        '''run the command and return result'''
+        data = self.read_input()
+
+        if not isinstance(data, dict):
+            return Result.bad_request("expected object with column lists")
+
+        columnar.size(data)
+
+        return Result.ok(Stream(columnar.iter_rows(data)))
+
+class Trace(Command):
+    '''command to report the pipelines recorded in a YEL_TRACE file with
+    the throughput of each stage and the critical path'''
+
+    SHORT = "trace"
+    LONG = "trace"
+
+    DETERMINISTIC = False
+
+    USAGE = '''trace report [-f path] [-t trace-id]'''
+
+    EXPAND_SHORT_OPTIONS = {
+        "f": "file",
+        "t": "trace-id"
+    }
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    @classmethod
+    def reads_input(cls, params):
+        '''the spans are read from the trace file'''
+        return False
+
+    def run(self):
+        '''run the command and return result'''
+
+        action = self.defs
+
+        if action != "report":
+            return Result.bad_request("expected action report")
+
+        path = self.args.get("file", self.vars.get("YEL_TRACE"))
+
+        if not path:
+            return Result.bad_request("expected -f path or YEL_TRACE set")
+
+        trace_id = self.args.get("trace-id", None)
+
+        if trace_id is not None:
+            trace_id = str(trace_id)
+
+        spans = [span for span in tracing.load(os.path.expanduser(str(path)))
+                if span["command"] != self.SHORT]
+
+        return Result.ok(tracing.report(spans, trace_id))
+
+class Run(Command):
+    '''command to run a workflow, a DAG of commands described in a json
+    file, see the workflow module for the format'''
+
+    SHORT = "run"
+    LONG = "run"
+
+    # the result depends on the content of the workflow file
+    DETERMINISTIC = False
+
+    # the input is passed as it is to the stages bound to $stdin
+    RAW_INPUT = True
+
+    USAGE = '''run workflow.json [-q queue-size]'''
+
+    EXPAND_SHORT_OPTIONS = {
+        "q": "queue-size"
+    }
+
+    def __init__(self, args, vars_):
+        Command.__init__(self, self.SHORT, args, vars_)
+
+    def run(self):
+        '''run the command and return result'''
+
+        defs = self.defs
+
+        if isinstance(defs, basestring):
+            with open(os.path.expanduser(defs)) as handle:
+                defs = json.load(handle)
+        elif not isinstance(defs, dict):
+            return Result.bad_request("expected workflow path as argument")
+
+        import workflow
+
+        queue_size = self.get_arg_type("queue-size", int,
+                workflow.DEFAULT_QUEUE_SIZE)
+
+        if queue_size <= 0:
+            return Result.bad_request("queue-size must be positive")
+
+        if not COMMANDS:
+            load_commands()
+
+        try:
+            flow = workflow.Workflow(defs, COMMANDS.get, self.vars, queue_size)
+        except ValueError as error:
+            return Result.bad_request(str(error))
+
+        return flow.run(self.input_stream)
+
 def load_commands():
     '''load available commands'''
     for attr in globals().values():
@@ -951,35 +2105,230 @@ def load_commands():
             COMMANDS[attr.SHORT] = attr
             COMMANDS[attr.LONG] = attr
 
-def main(args):
-    '''generic command entry point'''
-
-    name = os.path.basename(args[0])
+def command_name(path):
+    '''return the name of the command of the entry point in *path*'''
+    name = os.path.basename(path)
 
     if name.startswith("@"):
         name = name[1:]
 
+    return name
+
+def reads_input(args):
+    '''return True if the command run with *args*, starting with the entry
+    point, reads its input'''
+    cls = COMMANDS.get(command_name(args[0]))
+
+    if cls is None:
+        return False
+
+    try:
+        return cls.reads_input(cls.parse_args(args[1:]))
+    except Exception:
+        return False
+
+def main(args):
+    '''generic command entry point'''
+
+    name = command_name(args[0])
+
     if name not in COMMANDS:
         finish(Result.not_found("command %s not found" % name))
 
     cls = COMMANDS[name]
 
-    params = cls.parse_args(args[1:])
+    if instrument.MAX_MEMORY:
+        try:
+            instrument.limit_memory(instrument.MAX_MEMORY)
+        except ValueError as error:
+            finish(Result.bad_request("invalid YEL_MAX_MEMORY: %s" % error))
+
+    if compress.ENABLED:
+        try:
+            compress.level()
+        except ValueError as error:
+            compress.ENABLED = False
+            finish(Result.bad_request("invalid YEL_COMPRESS: %s" % error))
+
+        try:
+            compress.threads()
+        except ValueError as error:
+            compress.ENABLED = False
+            finish(Result.bad_request("invalid YEL_COMPRESS_THREADS: %s" %
+                error))
+
+    if shm.ENABLED:
+        try:
+            shm.min_items()
+        except ValueError as error:
+            shm.ENABLED = False
+            finish(Result.bad_request("invalid YEL_SHM_MIN: %s" % error))
+
+    if instrument.SAMPLE_DIR:
+        try:
+            instrument.sample_interval()
+        except ValueError as error:
+            finish(Result.bad_request("invalid YEL_PROFILE_INTERVAL: %s" %
+                error))
+
+    if instrument.ENABLED:
+        profile = instrument.start(name, args[1:])
+        params = profile.measure("parse_args", cls.parse_args, args[1:])
+    else:
+        profile = None
+        params = cls.parse_args(args[1:])
+
+    if tracing.ENABLED:
+        span = tracing.Span(name, os.environ, params, True)
+    else:
+        span = None
+
+    data = dict(name=name, args=params, vars=os.environ, span=span)
+    lookup = entry = None
+
+    # with a terminal as input there's nothing to hash
+    if (cache.ENABLED and cls.is_deterministic(params) and
+            not sys.stdin.isatty()):
+        lookup = cache.Lookup(name, params, sys.stdin)
+        # the output of a run that didn't read its input
+        hit = lookup.get()
+
+        if hit is not None:
+            finish(Result.ok(TextStream(cache.iter_chunks(hit))), span)
+
+        data["stream"] = lookup.stream
+
+    try:
+        if profile is None:
+            result = cls.invoke(data)
+        else:
+            result = profile.measure("run", cls.invoke, data)
+    except cache.Hit as hit:
+        finish(Result.ok(TextStream(cache.iter_chunks(hit.handle))), span)
+
+    if lookup is not None:
+        entry = lookup.entry()
 
-    result = cls.invoke(dict(name=name, args=params, vars=os.environ))
-    finish(result)
+    finish(result, span, entry)
 
-def finish(result):
-    '''finish the program'''
+def finish(result, span=None, entry=None):
+    '''finish the program, if *span* is not None end it with the input and
+    output sizes, if *entry* is not None store the output in it if the
+    result is ok'''
     if result.status != Result.OK and result.reason:
         sys.stderr.write(result.reason)
         sys.stderr.write('\n')
         sys.stderr.flush()
 
-    sys.stdout.write(json.dumps(result.result))
-    sys.stdout.write('\n')
-    sys.stdout.flush()
-    sys.exit(result.status)
+    profile = instrument.ACTIVE
+    out = sys.stdout
+
+    exported = None
+
+    # a cached descriptor would point to memory the consumer removed
+    if shm.ENABLED and entry is None:
+        result.result = shm.export(result.result, sys.stdout.fileno(),
+                reads_input)
+
+        if shm.is_descriptor(result.result):
+            exported = result.result
+
+    # the span counts the bytes written to stdout and the cache stores the
+    # uncompressed output
+    counter = compressor = None
+
+    if span is not None:
+        out = counter = tracing.CountingWriter(out)
+
+    if compress.ENABLED and not sys.stdout.isatty():
+        out = compressor = compress.writer(out)
+
+    if entry is not None:
+        out = entry.tee(out)
+
+    status = Result.ERROR
+
+    try:
+        if profile is None:
+            status = write_output(result, out, compressor)
+        else:
+            status = profile.measure("output", write_output, result, out,
+                    compressor)
+            profile.write(status)
+    finally:
+        if counter is not None:
+            span.end(status, tracing.input_bytes(), counter.count)
+
+        # no reader got the descriptor to remove it
+        if exported is not None and status != Result.OK:
+            shm.release(exported)
+
+        if entry is None:
+            pass
+        elif status == Result.OK:
+            entry.commit()
+        else:
+            entry.discard()
+
+    sys.exit(status)
+
+def write_output(result, out, compressor=None):
+    '''write the result to *out* and close *compressor* if not None, return
+    the exit status'''
+    status = write_result(result, out)
+
+    if compressor is not None:
+        try:
+            compressor.close()
+        except IOError as error:
+            if not is_broken_pipe(error):
+                raise
+
+            discard_stdout()
+            status = Result.ERROR
+
+    return status
+
+def is_broken_pipe(error):
+    '''return True if *error* is from writing to a pipe without reader'''
+    return isinstance(error, IOError) and error.errno == errno.EPIPE
+
+def discard_stdout():
+    '''send stdout to /dev/null, when the reader is gone the rest of the
+    output and the flush at exit go nowhere instead of failing again'''
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    os.close(devnull)
+
+def write_result(result, out):
+    '''write the result to *out*, return the exit status'''
+    status = result.status
+
+    try:
+        if isinstance(result.result, Stream):
+            result.result.write(out)
+        else:
+            out.write(json.dumps(result.result))
+            out.write('\n')
+
+        out.flush()
+    except Exception as ex:
+        if is_broken_pipe(ex):
+            discard_stdout()
+            return Result.ERROR
+
+        if DEBUG:
+            raise
+
+        error = Result.from_exception(ex)
+        out.write('\n')
+        sys.stderr.write(error.reason)
+        sys.stderr.write('\n')
+        sys.stderr.flush()
+        status = error.status
+        out.flush()
+
+    return status
 
 if __name__ == "__main__":
     load_commands()
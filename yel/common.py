@@ -1,14 +1,46 @@
 import os
 import grp
 import pwd
+import stat as stat_
+
+USER_NAMES = {}
+GROUP_NAMES = {}
+
+def user_name(uid):
+    '''return the name of user *uid*, the uid as string if it has no name'''
+    if uid not in USER_NAMES:
+        try:
+            USER_NAMES[uid] = pwd.getpwuid(uid).pw_name
+        except KeyError:
+            USER_NAMES[uid] = str(uid)
+
+    return USER_NAMES[uid]
+
+def group_name(gid):
+    '''return the name of group *gid*, the gid as string if it has no name'''
+    if gid not in GROUP_NAMES:
+        try:
+            GROUP_NAMES[gid] = grp.getgrgid(gid).gr_name
+        except KeyError:
+            GROUP_NAMES[gid] = str(gid)
+
+    return GROUP_NAMES[gid]
 
 class MetaData(object):
-    '''base metadata class'''
-    pass
+    '''base metadata class, subclasses declare their fields in __slots__ so
+    millions of instances can be held without a __dict__ each'''
+
+    __slots__ = ()
+
+    def to_json(self):
+        '''return json representation'''
+        return dict((name, getattr(self, name)) for name in self.__slots__)
 
 class User(MetaData):
     '''user metadata'''
 
+    __slots__ = ("name", "id")
+
     def __init__(self, name, id_):
         self.name = name
         self.id = id_
@@ -20,12 +52,18 @@ class User(MetaData):
     @classmethod
     def from_stat(cls, stat):
         uid = stat.st_uid
-        name = pwd.getpwuid(uid).pw_name
-        return cls(uid, name)
+        return cls(user_name(uid), uid)
+
+    @classmethod
+    def from_json(cls, data):
+        '''build a User object from its json representation'''
+        return cls(data["name"], data["id"])
 
 class Group(MetaData):
     '''group metadata'''
 
+    __slots__ = ("name", "id")
+
     def __init__(self, name, id_):
         self.name = name
         self.id = id_
@@ -37,12 +75,18 @@ class Group(MetaData):
     @classmethod
     def from_stat(cls, stat):
         gid = stat.st_gid
-        name = grp.getgrgid(gid).gr_name
-        return cls(gid, name)
+        return cls(group_name(gid), gid)
+
+    @classmethod
+    def from_json(cls, data):
+        '''build a Group object from its json representation'''
+        return cls(data["name"], data["id"])
 
 class FileTime(MetaData):
     '''file time metadata'''
 
+    __slots__ = ("accessed", "modified", "ctime")
+
     def __init__(self, accessed, modified, ctime):
         self.accessed = accessed
         self.modified = modified
@@ -56,11 +100,21 @@ class FileTime(MetaData):
     def from_stat(cls, stat):
         return cls(stat.st_atime, stat.st_mtime, stat.st_ctime)
 
+    @classmethod
+    def from_json(cls, data):
+        '''build a FileTime object from its json representation'''
+        return cls(data["accessed"], data["modified"], data["ctime"])
+
 class File(MetaData):
     '''file metadata'''
 
+    __slots__ = ("name", "path", "user", "group", "time", "size", "type",
+            "childs")
+
     FILE = "f"
     DIR  = "d"
+    LINK = "l"
+    OTHER = "?"
 
     def __init__(self, name, path, user, group, time, size, type_=FILE,
             childs=None):
@@ -71,43 +125,109 @@ class File(MetaData):
         self.time = time
         self.size = size
         self.type = type_
-        self.childs = None
+        self.childs = childs
 
     @classmethod
     def from_path(cls, path, recursive=False):
         '''build a File object from a path'''
         path = os.path.abspath(path)
-        name = os.path.basename(path)
-        size = os.path.getsize(path)
+        stat = os.stat(path)
+
+        return cls.from_stat(path, stat, cls.type_from_path(path))
+
+    @classmethod
+    def from_stat(cls, path, stat, type_=None):
+        '''build a File object from an absolute path and its stat result'''
+        if type_ is None:
+            type_ = cls.type_from_mode(stat.st_mode)
+
+        return cls(os.path.basename(path) or path, path,
+                User.from_stat(stat), Group.from_stat(stat),
+                FileTime.from_stat(stat), stat.st_size, type_)
+
+    @classmethod
+    def from_json(cls, data):
+        '''build a File object from its json representation'''
+        childs = data.get("childs", None)
+
+        if childs is not None:
+            childs = [cls.from_json(child) for child in childs]
+
+        return cls(data["name"], data["path"], User.from_json(data["user"]),
+                Group.from_json(data["group"]),
+                FileTime.from_json(data["time"]), data["size"], data["type"],
+                childs)
+
+    @classmethod
+    def walk(cls, path):
+        '''yield a File object for path and every entry below it, symbolic
+        links are not followed'''
+        path = os.path.abspath(path)
+        pending = [path]
+
+        while pending:
+            current = pending.pop()
 
-        type_ = cls.type_from_path(path)
+            try:
+                stat = os.lstat(current)
+            except OSError:
+                continue
 
-        stat  = os.stat(path)
-        user  = User.from_stat(stat)
-        group = Group.from_stat(stat)
-        time  = FileTime.from_stat(stat)
-        size  = stat.st_size
+            file_ = cls.from_stat(current, stat)
+            yield file_
 
-        return cls(name, path, user, group, time, size, type_)
+            if file_.is_dir:
+                try:
+                    names = os.listdir(current)
+                except OSError:
+                    continue
+
+                names.sort(reverse=True)
+                pending.extend(os.path.join(current, name) for name in names)
 
     @classmethod
     def type_from_path(cls, path):
         '''return file type from file path'''
         if os.path.isdir(path):
-            type_ = "d"
+            type_ = cls.DIR
         elif os.path.isfile(path):
-            type_ = "f"
+            type_ = cls.FILE
         else:
-            type_ = "?"
+            type_ = cls.OTHER
 
         return type_
 
+    @classmethod
+    def type_from_mode(cls, mode):
+        '''return file type from a stat mode without following links'''
+        if stat_.S_ISDIR(mode):
+            type_ = cls.DIR
+        elif stat_.S_ISREG(mode):
+            type_ = cls.FILE
+        elif stat_.S_ISLNK(mode):
+            type_ = cls.LINK
+        else:
+            type_ = cls.OTHER
+
+        return type_
+
+    def to_json(self):
+        '''return json representation'''
+        result = dict(name=self.name, path=self.path,
+                user=self.user.to_json(), group=self.group.to_json(),
+                time=self.time.to_json(), size=self.size, type=self.type)
+
+        if self.childs is not None:
+            result["childs"] = [child.to_json() for child in self.childs]
+
+        return result
+
     @property
     def is_dir(self):
         '''return True if it's a directory'''
-        return self.type == "d"
+        return self.type == self.DIR
 
     @property
     def is_file(self):
         '''return True if it's a file'''
-        return self.type == "f"
+        return self.type == self.FILE
@@ -0,0 +1,215 @@
+'''transparent gzip input and parallel gzip output
+
+gzip input is detected by its magic bytes and decompressed while it's read,
+concatenated gzip members are read as a single stream
+
+output is compressed setting YEL_COMPRESS to 1 or to a compression level
+(1 to 9, default 6), YEL_COMPRESS_THREADS sets the number of threads (the
+number of cpus by default), the output is split in blocks of BLOCK_SIZE
+bytes that are compressed at the same time and written in order as the
+members of a standard multi member gzip stream, output to a terminal is
+never compressed'''
+import os
+import zlib
+import itertools
+
+from collections import deque
+
+import util
+
+MAGIC = "\x1f\x8b"
+
+COMPRESS = os.environ.get("YEL_COMPRESS")
+ENABLED = bool(COMPRESS)
+
+DEFAULT_LEVEL = 6
+
+BLOCK_SIZE = 1024 * 1024
+
+# window bits to read and write gzip headers and trailers
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+def level():
+    '''return the compression level from YEL_COMPRESS'''
+    if COMPRESS in (None, "", "1"):
+        return DEFAULT_LEVEL
+
+    try:
+        value = int(COMPRESS)
+    except ValueError:
+        value = None
+
+    if value is None or not 1 <= value <= 9:
+        raise ValueError("expected level from 1 to 9, got: %s" % COMPRESS)
+
+    return value
+
+def threads():
+    '''return the number of compression threads'''
+    count = os.environ.get("YEL_COMPRESS_THREADS")
+
+    if count:
+        try:
+            return max(1, int(count))
+        except ValueError:
+            raise ValueError("expected a number of threads, got: %s" % count)
+
+    import multiprocessing
+
+    return multiprocessing.cpu_count()
+
+def decompress_chunks(first, stream, read_size=util.READ_SIZE):
+    '''yield the decompressed content of the gzip data in *first* followed
+    by the rest of *stream*'''
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    data = first
+
+    while True:
+        if not data:
+            data = stream.read(read_size)
+
+            if not data:
+                break
+
+        chunk = decompressor.decompress(data)
+
+        if chunk:
+            yield chunk
+
+        data = decompressor.unused_data
+
+        # start of the next member
+        if data:
+            decompressor = zlib.decompressobj(GZIP_WBITS)
+
+    chunk = decompressor.flush()
+
+    if chunk:
+        yield chunk
+
+class PrefixReader(object):
+    '''file like object that reads *prefix* and then from *stream*'''
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1):
+        '''read up to *size* bytes, all of them if size is negative'''
+        if size < 0:
+            prefix, self.prefix = self.prefix, ""
+            return prefix + self.stream.read()
+        elif size <= len(self.prefix):
+            data, self.prefix = self.prefix[:size], self.prefix[size:]
+            return data
+
+        prefix, self.prefix = self.prefix, ""
+        return prefix + self.stream.read(size - len(prefix))
+
+    def readline(self):
+        '''read a line including the new line'''
+        end = self.prefix.find("\n") + 1
+
+        if end:
+            line, self.prefix = self.prefix[:end], self.prefix[end:]
+            return line
+
+        prefix, self.prefix = self.prefix, ""
+        return prefix + self.stream.readline()
+
+    def __iter__(self):
+        lines = []
+
+        while self.prefix:
+            lines.append(self.readline())
+
+        # iterate the stream itself after the prefix
+        return itertools.chain(lines, self.stream)
+
+def open_input(stream):
+    '''return a file like object with the content of *stream*, decompressed
+    if it starts with the gzip magic bytes'''
+    prefix = stream.read(len(MAGIC))
+
+    if prefix == MAGIC:
+        return util.ChunkReader(decompress_chunks(prefix, stream))
+
+    return PrefixReader(prefix, stream)
+
+def compress_block(block, level_):
+    '''return *block* compressed as a gzip member'''
+    compressor = zlib.compressobj(level_, zlib.DEFLATED, GZIP_WBITS)
+
+    return compressor.compress(block) + compressor.flush()
+
+class ParallelGzipWriter(object):
+    '''file like object that compresses what is written to it in blocks on
+    a pool of threads and writes them in order to *out*'''
+
+    def __init__(self, out, level_=DEFAULT_LEVEL, workers=1,
+            block_size=BLOCK_SIZE):
+        self.out = out
+        self.level = level_
+        self.block_size = block_size
+        self.chunks = []
+        self.size = 0
+        self.written = False
+        # blocks being compressed, at most two per thread are kept in memory
+        self.pending = deque()
+        self.max_pending = workers * 2
+
+        import multiprocessing.pool
+
+        self.pool = multiprocessing.pool.ThreadPool(workers)
+
+    def write(self, data):
+        '''add *data* to the current block'''
+        self.chunks.append(data)
+        self.size += len(data)
+
+        if self.size >= self.block_size:
+            self.submit()
+
+    def submit(self):
+        '''start compressing the current block'''
+        block = "".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+
+        self.pending.append(self.pool.apply_async(compress_block,
+            (block, self.level)))
+
+        while len(self.pending) >= self.max_pending:
+            self.write_next()
+
+    def write_next(self):
+        '''wait for the oldest block and write it'''
+        self.out.write(self.pending.popleft().get())
+        self.written = True
+
+    def flush(self):
+        '''write the blocks already compressed, the current block is kept to
+        compress it whole'''
+        while self.pending and self.pending[0].ready():
+            self.write_next()
+
+        self.out.flush()
+
+    def close(self):
+        '''compress the rest, write all and stop the threads, the output is
+        a valid gzip stream even if nothing was written'''
+        try:
+            if self.chunks or not (self.pending or self.written):
+                self.submit()
+
+            while self.pending:
+                self.write_next()
+
+            self.out.flush()
+        finally:
+            self.pool.terminate()
+
+def writer(out):
+    '''return a ParallelGzipWriter to *out* configured from the
+    environment'''
+    return ParallelGzipWriter(out, level(), threads())
@@ -0,0 +1,209 @@
+'''streaming conversion between csv or text lines and json values'''
+import csv
+import sys
+import json
+import math
+import itertools
+
+from cStringIO import StringIO
+
+ARRAYS = "arrays"
+OBJECTS = "objects"
+
+FORMATS = (ARRAYS, OBJECTS)
+
+DEFAULT_SAMPLE = 100
+
+# rows written to the csv buffer before it's handed to the output
+CHUNK_ROWS = 1024
+
+NULLS = ("", "null", "NULL")
+BOOLEANS = {"true": True, "false": False, "True": True, "False": False}
+
+csv.field_size_limit(sys.maxsize)
+
+def to_int(value):
+    '''return *value* as an int, raise ValueError if it's not one'''
+    return int(value)
+
+def to_float(value):
+    '''return *value* as a float, raise ValueError if it's not one or if
+    it's nan or infinite, they aren't valid json'''
+    result = float(value)
+
+    if math.isnan(result) or math.isinf(result):
+        raise ValueError("not a finite float: %s" % value)
+
+    return result
+
+def to_bool(value):
+    '''return *value* as a boolean, raise ValueError if it's not one'''
+    try:
+        return BOOLEANS[value]
+    except KeyError:
+        raise ValueError("not a boolean: %s" % value)
+
+# from the most to the least specific
+CONVERTERS = (to_int, to_float, to_bool)
+
+def infer_converter(values):
+    '''return the most specific converter that accepts all the non null
+    *values*, None if they must be kept as strings'''
+    values = [value for value in values if value not in NULLS]
+
+    if not values:
+        return None
+
+    for converter in CONVERTERS:
+        try:
+            for value in values:
+                converter(value)
+        except ValueError:
+            continue
+
+        return converter
+
+    return None
+
+def infer_converters(rows):
+    '''return a list with the converter for each column of *rows*'''
+    columns = max(len(row) for row in rows) if rows else 0
+
+    return [infer_converter([row[i] for row in rows if i < len(row)])
+            for i in xrange(columns)]
+
+def convert(value, converter):
+    '''convert the string *value* with *converter*, values that don't match
+    the inferred type are kept as strings'''
+    if converter is None:
+        return value
+    elif value in NULLS:
+        return None
+
+    try:
+        return converter(value)
+    except ValueError:
+        return value
+
+def decode(value):
+    '''return the utf-8 *value* as unicode'''
+    return value.decode("utf-8", "replace")
+
+def decode_row(row):
+    '''return the utf-8 values of *row* as unicode decoding them at once, the
+    csv reader doesn't allow NUL so it's safe as separator'''
+    return "\0".join(row).decode("utf-8", "replace").split(u"\0")
+
+def read_csv(stream, delimiter=",", header=True, format_=OBJECTS,
+        infer=False, sample=DEFAULT_SAMPLE):
+    '''yield the rows of the csv file like object *stream* as lists or as
+    objects keyed by the header fields
+
+    if infer is True the type of each column is inferred from the first
+    *sample* rows, only those rows are kept in memory'''
+    if format_ not in FORMATS:
+        raise ValueError("expected format to be one of %s, got: %s" % (
+            ", ".join(FORMATS), format_))
+
+    rows = csv.reader(stream, delimiter=delimiter)
+
+    if header:
+        fields = [decode(field) for field in next(rows, [])]
+    elif format_ == OBJECTS:
+        raise ValueError("objects format requires a header")
+    else:
+        fields = None
+
+    if infer:
+        prefix = list(itertools.islice(rows, sample))
+        converters = infer_converters(prefix)
+        rows = itertools.chain(prefix, rows)
+    else:
+        converters = []
+
+    for row in rows:
+        values = decode_row(row) if row else []
+
+        if converters:
+            values = [convert(value, converter) for value, converter in
+                    itertools.izip_longest(values, converters[:len(values)])]
+
+        if format_ == OBJECTS:
+            yield dict(itertools.izip(fields, values))
+        else:
+            yield values
+
+def read_lines(stream, skip_empty=False):
+    '''yield the lines of the file like object *stream* without the line
+    ending'''
+    for line in stream:
+        line = decode(line.rstrip("\r\n"))
+
+        if skip_empty and not line:
+            continue
+
+        yield line
+
+def encode_unicode(value):
+    '''return *value* as utf-8'''
+    return value.encode("utf-8")
+
+def encode_bool(value):
+    '''return *value* as a json boolean'''
+    return "true" if value else "false"
+
+ENCODERS = {
+    str: lambda value: value,
+    unicode: encode_unicode,
+    int: str,
+    long: str,
+    float: repr,
+    bool: encode_bool,
+    type(None): lambda value: "",
+    list: json.dumps,
+    dict: json.dumps
+}
+
+def encode(value):
+    '''return *value* as a utf-8 csv cell, objects and lists as json'''
+    return ENCODERS.get(type(value), str)(value)
+
+def write_csv(items, delimiter=",", header=True, columns=None):
+    '''yield chunks of csv text for *items*, objects are written in the
+    order of *columns* or of the sorted keys of the first object, lists are
+    written as they are'''
+    buf = StringIO()
+    writer = csv.writer(buf, delimiter=delimiter, lineterminator="\n")
+    pending = 0
+
+    for item in items:
+        if isinstance(item, dict):
+            if columns is None:
+                columns = sorted(item.keys())
+
+            if header:
+                writer.writerow([encode(column) for column in columns])
+                header = False
+
+            row = [item.get(column) for column in columns]
+        elif isinstance(item, list):
+            if header and columns is not None:
+                writer.writerow([encode(column) for column in columns])
+
+            header = False
+            row = item
+        else:
+            header = False
+            row = [item]
+
+        writer.writerow(map(encode, row))
+        pending += 1
+
+        if pending >= CHUNK_ROWS:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            pending = 0
+
+    if pending:
+        yield buf.getvalue()
@@ -0,0 +1,281 @@
+'''persistent filesystem metadata index'''
+import os
+import time
+import cPickle as pickle
+
+import common
+
+from common import File, User, Group, FileTime
+
+class FsIndex(object):
+    '''on disk index of File metadata
+
+    entries are stored as tuples keyed by absolute path, directories also keep
+    the list of names they contained the last time they were listed so that a
+    refresh only needs to list the directories whose mtime changed'''
+
+    VERSION = 1
+
+    TYPE, SIZE, UID, GID, ATIME, MTIME, CTIME = range(7)
+
+    def __init__(self, path):
+        self.path = path
+        self.roots = []
+        self.entries = {}
+        self.childs = {}
+        self.users = {}
+        self.groups = {}
+        self.updated = None
+
+    @classmethod
+    def load(cls, path):
+        '''load the index stored at *path*, return an empty one if it doesn't
+        exist'''
+        index = cls(path)
+
+        if not os.path.exists(path):
+            return index
+
+        with open(path, "rb") as handle:
+            data = pickle.load(handle)
+
+        if data.get("version") != cls.VERSION:
+            raise ValueError("unsupported index version in %s: %s" % (path,
+                data.get("version")))
+
+        index.roots = data["roots"]
+        index.entries = data["entries"]
+        index.childs = data["childs"]
+        index.users = data["users"]
+        index.groups = data["groups"]
+        index.updated = data["updated"]
+
+        return index
+
+    def save(self):
+        '''write the index to disk atomically'''
+        self.updated = time.time()
+
+        data = dict(version=self.VERSION, roots=self.roots,
+                entries=self.entries, childs=self.childs, users=self.users,
+                groups=self.groups, updated=self.updated)
+
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+
+        with open(tmp_path, "wb") as handle:
+            pickle.dump(data, handle, pickle.HIGHEST_PROTOCOL)
+
+        os.rename(tmp_path, self.path)
+
+    def add_stat(self, path, stat):
+        '''add or replace the entry for *path* from its lstat result'''
+        uid = stat.st_uid
+        gid = stat.st_gid
+
+        if uid not in self.users:
+            self.users[uid] = common.user_name(uid)
+
+        if gid not in self.groups:
+            self.groups[gid] = common.group_name(gid)
+
+        type_ = File.type_from_mode(stat.st_mode)
+        self.entries[path] = (type_, stat.st_size, uid, gid, stat.st_atime,
+                stat.st_mtime, stat.st_ctime)
+
+        return type_
+
+    def remove(self, path):
+        '''remove *path* and everything below it from the index'''
+        pending = [path]
+        removed = 0
+
+        while pending:
+            current = pending.pop()
+
+            if self.entries.pop(current, None) is not None:
+                removed += 1
+
+            for name in self.childs.pop(current, ()):
+                pending.append(os.path.join(current, name))
+
+        return removed
+
+    def scan(self, path):
+        '''stat *path* and everything below it adding them to the index,
+        return the number of entries added'''
+        pending = [path]
+        count = 0
+
+        while pending:
+            current = pending.pop()
+
+            try:
+                stat = os.lstat(current)
+            except OSError:
+                continue
+
+            count += 1
+
+            if self.add_stat(current, stat) == File.DIR:
+                try:
+                    names = sorted(os.listdir(current))
+                except OSError:
+                    names = []
+
+                self.childs[current] = names
+                pending.extend(os.path.join(current, name) for name in names)
+
+        return count
+
+    def snapshot(self, path):
+        '''replace whatever the index has below *path* with a fresh walk'''
+        path = os.path.abspath(path)
+
+        self.remove(path)
+        count = self.scan(path)
+
+        if path not in self.roots:
+            self.roots.append(path)
+
+        return count
+
+    def refresh(self, full=False):
+        '''re-list only the directories whose mtime changed since they were
+        indexed, if *full* is True also re-stat the entries of unchanged
+        directories, return a dict with counts of what was done'''
+        stats = dict(listed=0, added=0, removed=0, restated=0)
+
+        for dirname in sorted(self.childs):
+            if dirname not in self.childs:
+                # removed while refreshing a parent
+                continue
+
+            try:
+                stat = os.lstat(dirname)
+            except OSError:
+                stats["removed"] += self.remove(dirname)
+                continue
+
+            old_mtime = self.entries[dirname][self.MTIME]
+
+            if self.add_stat(dirname, stat) != File.DIR:
+                stats["removed"] += self.remove(dirname) - 1
+                self.add_stat(dirname, stat)
+                continue
+
+            old_names = self.childs[dirname]
+
+            if stat.st_mtime == old_mtime:
+                if full:
+                    stats["restated"] += self._restat(dirname, old_names)
+
+                continue
+
+            try:
+                names = sorted(os.listdir(dirname))
+            except OSError:
+                names = []
+
+            stats["listed"] += 1
+            new_names = set(names)
+
+            for name in old_names:
+                if name not in new_names:
+                    stats["removed"] += self.remove(os.path.join(dirname,
+                        name))
+
+            self.childs[dirname] = names
+            old_names = set(old_names)
+
+            for name in names:
+                child = os.path.join(dirname, name)
+
+                if name in old_names:
+                    stats["restated"] += self._restat(dirname, [name])
+                else:
+                    stats["added"] += self.scan(child)
+
+        return stats
+
+    def _restat(self, dirname, names):
+        '''re-stat the *names* entries of *dirname* without listing them'''
+        count = 0
+
+        for name in names:
+            path = os.path.join(dirname, name)
+
+            try:
+                stat = os.lstat(path)
+            except OSError:
+                continue
+
+            # directories are handled by refresh with their own mtime check
+            if path in self.childs:
+                continue
+
+            if self.add_stat(path, stat) == File.DIR:
+                count += self.scan(path)
+            else:
+                count += 1
+
+        return count
+
+    def query(self, type_=None, user=None, group=None, min_size=None,
+            max_size=None, newer=None, older=None, prefix=None):
+        '''yield the File objects in the index matching all the filters,
+        *user* and *group* can be names or ids, *newer* and *older* are
+        modification timestamps'''
+
+        uid = self._resolve_id(user, self.users)
+        gid = self._resolve_id(group, self.groups)
+
+        if prefix is not None:
+            prefix = os.path.abspath(prefix)
+            dir_prefix = prefix.rstrip(os.sep) + os.sep
+
+        for path in sorted(self.entries):
+            entry = self.entries[path]
+
+            if ((type_ is not None and entry[self.TYPE] != type_) or
+                    (uid is not None and entry[self.UID] != uid) or
+                    (gid is not None and entry[self.GID] != gid) or
+                    (min_size is not None and entry[self.SIZE] < min_size) or
+                    (max_size is not None and entry[self.SIZE] > max_size) or
+                    (newer is not None and entry[self.MTIME] <= newer) or
+                    (older is not None and entry[self.MTIME] >= older) or
+                    (prefix is not None and path != prefix and
+                        not path.startswith(dir_prefix))):
+                continue
+
+            yield self.to_file(path, entry)
+
+    def to_file(self, path, entry):
+        '''build a File object from an index entry'''
+        uid = entry[self.UID]
+        gid = entry[self.GID]
+
+        return File(os.path.basename(path) or path, path,
+                User(self.users[uid], uid), Group(self.groups[gid], gid),
+                FileTime(entry[self.ATIME], entry[self.MTIME],
+                    entry[self.CTIME]),
+                entry[self.SIZE], entry[self.TYPE])
+
+    @staticmethod
+    def _resolve_id(value, names):
+        '''return the numeric id for *value* that can be a name or an id,
+        None if value is None and -1 if the name is unknown'''
+        if value is None or isinstance(value, int):
+            return value
+
+        for id_, name in names.iteritems():
+            if name == value:
+                return id_
+
+        if str(value).isdigit():
+            return int(value)
+
+        return -1
@@ -0,0 +1,381 @@
+'''tools that aggregate File metadata over whole trees'''
+import os
+import mmap
+import hashlib
+import stat as stat_
+import multiprocessing
+
+from multiprocessing.pool import ThreadPool
+
+UNITS_PER_WORKER = 4
+
+EDGE_SIZE = 4 * 1024
+
+def entry_size(stat, apparent):
+    '''return the size an entry uses, the disk usage unless *apparent*'''
+    if apparent:
+        return stat.st_size
+    else:
+        return stat.st_blocks * 512
+
+def add_to(sums, key, value):
+    '''add *value* to sums[key]'''
+    sums[key] = sums.get(key, 0) + value
+
+def merge_sums(sums, other):
+    '''add all the values in *other* to *sums*'''
+    for key, value in other.iteritems():
+        sums[key] = sums.get(key, 0) + value
+
+def first_link(seen, stat):
+    '''return True if the entry with *stat* is the first link seen to its
+    inode, setdefault is atomic so *seen* can be shared by threads'''
+    if stat.st_nlink < 2 or stat_.S_ISDIR(stat.st_mode):
+        return True
+
+    marker = object()
+
+    return seen.setdefault((stat.st_dev, stat.st_ino), marker) is marker
+
+def walk_sizes(args):
+    '''walk the tree at root and return a tuple with a dict of every
+    directory to its total size, the size per uid, the size per gid and the
+    number of entries
+
+    hard links are only counted once among the walks that share the *seen*
+    dict, a new one is used if it's None'''
+    root, apparent, seen = args
+    own = {}
+    users = {}
+    groups = {}
+
+    if seen is None:
+        seen = {}
+
+    order = []
+    count = 0
+    pending = [root]
+
+    while pending:
+        current = pending.pop()
+
+        try:
+            stat = os.lstat(current)
+        except OSError:
+            continue
+
+        count += 1
+        is_dir = stat_.S_ISDIR(stat.st_mode)
+        size = entry_size(stat, apparent) if first_link(seen, stat) else 0
+
+        add_to(users, stat.st_uid, size)
+        add_to(groups, stat.st_gid, size)
+
+        if is_dir:
+            add_to(own, current, size)
+            order.append(current)
+
+            try:
+                names = os.listdir(current)
+            except OSError:
+                continue
+
+            pending.extend(os.path.join(current, name) for name in names)
+        else:
+            add_to(own, os.path.dirname(current), size)
+
+    # order is a pre-order so children are always summed before parents
+    for path in reversed(order[1:]):
+        own[os.path.dirname(path)] += own[path]
+
+    return own, users, groups, count
+
+class DiskUsage(object):
+    '''sum sizes per directory, user and group across a tree splitting the
+    stat work in a pool of threads or processes
+
+    hard links are counted once in the whole tree with threads, with
+    processes each work unit has its own set of seen inodes so a file linked
+    from two units is counted in both'''
+
+    def __init__(self, root, apparent=False, workers=None, processes=False):
+        self.root = os.path.abspath(root)
+        self.apparent = apparent
+
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+
+        self.workers = max(1, workers)
+        self.processes = processes
+
+        self.users = {}
+        self.groups = {}
+        self.count = 0
+        # (device, inode) of the hard linked files already counted
+        self.seen = {}
+
+    def split(self):
+        '''expand the top levels of the tree until there are enough
+        directories to keep the workers busy
+
+        return the sizes of the expanded directories (their own size and the
+        size of the files directly inside them), their children directories
+        and the list of directories to hand to the workers'''
+        own = {}
+        childs = {}
+        level = [self.root]
+        wanted = self.workers * UNITS_PER_WORKER
+
+        stat = os.lstat(self.root)
+
+        if not stat_.S_ISDIR(stat.st_mode):
+            raise ValueError("expected a directory, got: %s" % self.root)
+
+        while level and len(level) < wanted:
+            next_level = []
+
+            for dirname in level:
+                try:
+                    stat = os.lstat(dirname)
+                    names = os.listdir(dirname)
+                except OSError:
+                    continue
+
+                self.account(stat, own, dirname)
+                childs[dirname] = []
+
+                for name in names:
+                    path = os.path.join(dirname, name)
+
+                    try:
+                        stat = os.lstat(path)
+                    except OSError:
+                        continue
+
+                    if stat_.S_ISDIR(stat.st_mode):
+                        childs[dirname].append(path)
+                        next_level.append(path)
+                    else:
+                        self.account(stat, own, dirname)
+
+            level = next_level
+
+        return own, childs, level
+
+    def account(self, stat, own, dirname):
+        '''add the size of the entry with *stat* to directory *dirname* and to
+        its owners'''
+        if first_link(self.seen, stat):
+            size = entry_size(stat, self.apparent)
+        else:
+            size = 0
+
+        add_to(own, dirname, size)
+        add_to(self.users, stat.st_uid, size)
+        add_to(self.groups, stat.st_gid, size)
+        self.count += 1
+
+    def directories(self):
+        '''yield (path, total size) for every directory, the directories of
+        each work unit are yielded as soon as the unit is finished and the
+        expanded top directories at the end, deepest first'''
+        own, childs, units = self.split()
+        totals = {}
+
+        if units:
+            if self.processes:
+                pool = multiprocessing.Pool(self.workers)
+            else:
+                pool = ThreadPool(self.workers)
+
+            try:
+                seen = None if self.processes else self.seen
+                jobs = [(unit, self.apparent, seen) for unit in units]
+
+                for sizes, users, groups, count in pool.imap_unordered(
+                        walk_sizes, jobs):
+                    merge_sums(self.users, users)
+                    merge_sums(self.groups, groups)
+                    self.count += count
+
+                    for path, size in sizes.iteritems():
+                        yield path, size
+
+                        if os.path.dirname(path) in childs:
+                            totals[path] = size
+            finally:
+                pool.close()
+                pool.join()
+
+        # expanded directories, a child path is longer than its parent's
+        for dirname in sorted(childs, key=len, reverse=True):
+            total = own.get(dirname, 0)
+            total += sum(totals.get(child, 0) for child in childs[dirname])
+            totals[dirname] = total
+
+            yield dirname, total
+
+def hash_edges(args):
+    '''return (path, hex digest) of the first and last *edge* bytes of the
+    file at path, the digest is None if the file can't be read'''
+    path, size, edge = args
+    digest = hashlib.sha1()
+
+    try:
+        with open(path, "rb") as handle:
+            digest.update(handle.read(edge))
+
+            if size > edge:
+                handle.seek(max(edge, size - edge))
+                digest.update(handle.read(edge))
+    except (IOError, OSError):
+        return path, None
+
+    return path, digest.hexdigest()
+
+def hash_full(path):
+    '''return (path, hex digest) of the whole content of the file at path,
+    the digest is None if the file can't be read'''
+    digest = hashlib.sha1()
+
+    try:
+        with open(path, "rb") as handle:
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+            try:
+                digest.update(mapped)
+            finally:
+                mapped.close()
+    except (IOError, OSError, ValueError, mmap.error):
+        return path, None
+
+    return path, digest.hexdigest()
+
+class Duplicates(object):
+    '''find files with the same content in some trees
+
+    files are grouped by size, then candidates are grouped by a hash of their
+    first and last bytes and only the files still colliding are hashed
+    completely in a process pool'''
+
+    def __init__(self, roots, min_size=1, workers=None, edge=EDGE_SIZE):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.min_size = max(1, min_size)
+        self.edge = edge
+
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+
+        self.workers = max(1, workers)
+
+    def by_size(self):
+        '''return a dict of size to the list of regular files of that size,
+        hard links to an already seen file are ignored'''
+        sizes = {}
+        seen = set()
+        pending = list(reversed(self.roots))
+
+        while pending:
+            current = pending.pop()
+
+            try:
+                stat = os.lstat(current)
+            except OSError:
+                continue
+
+            if stat_.S_ISDIR(stat.st_mode):
+                try:
+                    names = os.listdir(current)
+                except OSError:
+                    continue
+
+                names.sort(reverse=True)
+                pending.extend(os.path.join(current, name) for name in names)
+            elif (stat_.S_ISREG(stat.st_mode) and
+                    stat.st_size >= self.min_size):
+                key = (stat.st_dev, stat.st_ino)
+
+                if key in seen:
+                    continue
+
+                seen.add(key)
+
+                if stat.st_size in sizes:
+                    sizes[stat.st_size].append(current)
+                else:
+                    sizes[stat.st_size] = [current]
+
+        return sizes
+
+    def groups(self):
+        '''yield a dict with size, hash and paths for each group of
+        duplicated files, biggest files first'''
+        sizes = self.by_size()
+        size_of = dict((path, size) for size, paths in sizes.iteritems()
+                if len(paths) > 1 for path in paths)
+
+        if not size_of:
+            return
+
+        jobs = [(path, size, self.edge) for path, size in size_of.iteritems()]
+        edge_pool = ThreadPool(self.workers)
+
+        try:
+            edges = group_by_digest(with_size(size_of,
+                edge_pool.imap_unordered(hash_edges, jobs)))
+        finally:
+            edge_pool.close()
+            edge_pool.join()
+
+        groups = []
+        full = []
+
+        for (size, digest), same in edges:
+            if size <= self.edge * 2:
+                # the edges covered the whole content
+                groups.append((size, digest, same))
+            else:
+                full.extend(same)
+
+        if full:
+            # all the candidates in one batch so small groups run together
+            full_pool = multiprocessing.Pool(self.workers)
+
+            try:
+                for (size, digest), same in group_by_digest(with_size(
+                        size_of, full_pool.imap_unordered(hash_full, full))):
+                    groups.append((size, digest, same))
+            finally:
+                full_pool.close()
+                full_pool.join()
+
+        groups.sort(key=lambda group: (-group[0], group[1]))
+
+        for size, digest, paths in groups:
+            yield dict(size=size, hash=digest, paths=sorted(paths))
+
+def with_size(size_of, results):
+    '''yield the (path, digest) *results* with the digest as a (size,
+    digest) tuple so files of different sizes are never grouped'''
+    for path, digest in results:
+        if digest is None:
+            yield path, None
+        else:
+            yield path, (size_of[path], digest)
+
+def group_by_digest(results):
+    '''return a list of (digest, paths) with more than one path from an
+    iterable of (path, digest), unreadable files are skipped'''
+    groups = {}
+
+    for path, digest in results:
+        if digest is None:
+            continue
+
+        if digest in groups:
+            groups[digest].append(path)
+        else:
+            groups[digest] = [path]
+
+    return sorted((digest, paths) for digest, paths in groups.iteritems()
+            if len(paths) > 1)
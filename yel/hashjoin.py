@@ -0,0 +1,235 @@
+'''relational hash join of two json datasets'''
+import os
+import json
+import shutil
+import tempfile
+
+import util
+import jsonpath
+
+INNER = "inner"
+LEFT = "left"
+ANTI = "anti"
+
+HOWS = (INNER, LEFT, ANTI)
+
+# bytes of the smaller input file up to which it's joined in memory
+DEFAULT_MAX_BUILD_SIZE = 256 * 1024 * 1024
+PARTITIONS = 64
+
+def merge(left, right):
+    '''return the joined record for *left* and *right*, objects are merged
+    with the right fields winning, other values are returned as a pair'''
+    if isinstance(left, dict) and isinstance(right, dict):
+        result = dict(left)
+        result.update(right)
+        return result
+    else:
+        return [left, right]
+
+class Side(object):
+    '''one of the inputs of a join, a path to a json file or a stream'''
+
+    def __init__(self, path=None, stream=None):
+        self.path = path
+        self.stream = stream
+
+    @property
+    def size(self):
+        '''return the size in bytes of the input, None if unknown'''
+        if self.path is None:
+            return None
+        else:
+            return os.path.getsize(self.path)
+
+    def items(self):
+        '''iterate over the items of the input'''
+        if self.path is None:
+            return util.iter_json(self.stream)
+        else:
+            return util.iter_json_file(self.path)
+
+class HashJoin(object):
+    '''join two inputs on some fields building a hash table on the smaller
+    one and streaming the other through it
+
+    if the file of the side to build is bigger than max_build_size bytes both
+    sides are partitioned on disk by the hash of the key and joined partition
+    by partition, the threshold is on the input size and not on the memory
+    the table uses, which is a few times bigger'''
+
+    def __init__(self, on, how=INNER, max_build_size=DEFAULT_MAX_BUILD_SIZE,
+            partitions=PARTITIONS):
+        if how not in HOWS:
+            raise ValueError("expected how to be one of %s, got: %s" % (
+                ", ".join(HOWS), how))
+
+        self.getters = [jsonpath.field_getter(field) for field in on]
+        self.how = how
+        self.max_build_size = max_build_size
+        self.partitions = partitions
+
+    def key_of(self, item):
+        '''return the hashable join key of *item*, None if any field is
+        missing so it doesn't match anything'''
+        values = [getter(item) for getter in self.getters]
+
+        if any(value is None for value in values):
+            return None
+
+        return tuple(util.hashable(value) for value in values)
+
+    def join(self, left, right):
+        '''yield the joined records of the *left* and *right* Side objects'''
+        left_size = left.size
+        right_size = right.size
+
+        # a side without a known size is a stream that can only be probed
+        build_left = (right_size is None or
+                (left_size is not None and left_size < right_size))
+        build_size = left_size if build_left else right_size
+
+        if build_size is None:
+            raise ValueError("at most one side of the join can be a stream")
+
+        if build_size <= self.max_build_size:
+            if build_left:
+                return self.join_build_left(left.items(), right.items())
+            else:
+                return self.join_build_right(left.items(), right.items())
+        else:
+            return self.join_partitioned(left, right, build_left)
+
+    def build(self, items):
+        '''return a dict of key to the list of items with that key'''
+        table = {}
+
+        for item in items:
+            key = self.key_of(item)
+
+            if key is None:
+                continue
+
+            rows = table.get(key)
+
+            if rows is None:
+                table[key] = [item]
+            else:
+                rows.append(item)
+
+        return table
+
+    def join_build_right(self, left_items, right_items):
+        '''join streaming the left side through a table of the right one'''
+        table = self.build(right_items)
+        how = self.how
+
+        for left in left_items:
+            key = self.key_of(left)
+            matches = table.get(key) if key is not None else None
+
+            if how == ANTI:
+                if not matches:
+                    yield left
+            elif matches:
+                for right in matches:
+                    yield merge(left, right)
+            elif how == LEFT:
+                yield left
+
+    def join_build_left(self, left_items, right_items):
+        '''join streaming the right side through a table of the left one, the
+        left rows without a match are yielded at the end for left and anti
+        joins'''
+        how = self.how
+        unmatched = []
+        table = {}
+
+        for left in left_items:
+            key = self.key_of(left)
+
+            if key is None:
+                unmatched.append(left)
+            elif key in table:
+                table[key].append(left)
+            else:
+                table[key] = [left]
+
+        matched = set()
+
+        for right in right_items:
+            key = self.key_of(right)
+            matches = table.get(key) if key is not None else None
+
+            if not matches:
+                continue
+
+            matched.add(key)
+
+            if how != ANTI:
+                for left in matches:
+                    yield merge(left, right)
+
+        if how == INNER:
+            return
+
+        for left in unmatched:
+            yield left
+
+        for key, lefts in table.iteritems():
+            if key not in matched:
+                for left in lefts:
+                    yield left
+
+    def join_partitioned(self, left, right, build_left):
+        '''grace hash join, partition both sides to disk and join each pair
+        of partitions in memory'''
+        tmp_dir = tempfile.mkdtemp(prefix="yel-hjoin-")
+
+        try:
+            left_paths = self.partition(left.items(), tmp_dir, "left")
+            right_paths = self.partition(right.items(), tmp_dir, "right")
+
+            for left_path, right_path in zip(left_paths, right_paths):
+                left_items = util.iter_json_file(left_path)
+                right_items = util.iter_json_file(right_path)
+
+                if build_left:
+                    joined = self.join_build_left(left_items, right_items)
+                else:
+                    joined = self.join_build_right(left_items, right_items)
+
+                for record in joined:
+                    yield record
+        finally:
+            shutil.rmtree(tmp_dir, True)
+
+    def partition(self, items, tmp_dir, name):
+        '''write *items* to json list partition files by the hash of their
+        key, return the list of partition paths'''
+        paths = [os.path.join(tmp_dir, "%s-%d.json" % (name, i))
+                for i in xrange(self.partitions)]
+        handles = [open(path, "w") for path in paths]
+        empty = [True] * self.partitions
+
+        try:
+            for handle in handles:
+                handle.write("[")
+
+            for item in items:
+                # rows without key don't match, any partition will do
+                index = hash(self.key_of(item)) % self.partitions
+                handle = handles[index]
+
+                if empty[index]:
+                    empty[index] = False
+                else:
+                    handle.write(",\n")
+
+                handle.write(json.dumps(item))
+        finally:
+            for handle in handles:
+                handle.write("]")
+                handle.close()
+
+        return paths
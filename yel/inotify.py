@@ -0,0 +1,274 @@
+'''linux inotify bindings using ctypes'''
+import os
+import time
+import errno
+import struct
+import select
+import ctypes
+import ctypes.util
+
+from collections import OrderedDict
+
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+
+IN_CLOEXEC = 0x00080000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+        IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_DONT_FOLLOW)
+
+CREATE = "create"
+MODIFY = "modify"
+DELETE = "delete"
+
+EVENT_HEADER = struct.Struct("iIII")
+
+READ_SIZE = 64 * 1024
+
+_LIBC = []
+
+def libc():
+    '''return the loaded libc, raise OSError if inotify is not available'''
+    if not _LIBC:
+        lib = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                use_errno=True)
+
+        if not hasattr(lib, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify not available")
+
+        _LIBC.append(lib)
+
+    return _LIBC[0]
+
+def _check(result):
+    '''raise OSError with errno if *result* is -1'''
+    if result == -1:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+    return result
+
+class Inotify(object):
+    '''an inotify instance, keeps the mapping between watch descriptors and
+    watched paths'''
+
+    def __init__(self):
+        self.fd = _check(libc().inotify_init1(IN_CLOEXEC))
+        self.paths = {}
+        self.wds = {}
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        '''watch *path* for the events in *mask*, return the watch
+        descriptor'''
+        wd = _check(libc().inotify_add_watch(self.fd, path, mask))
+        self.paths[wd] = path
+        self.wds[path] = wd
+
+        return wd
+
+    def forget(self, wd):
+        '''forget about watch descriptor *wd*'''
+        path = self.paths.pop(wd, None)
+
+        if path is not None and self.wds.get(path) == wd:
+            del self.wds[path]
+
+    def read(self, timeout=None):
+        '''wait up to *timeout* seconds for events and return a list of
+        (path, mask, cookie) tuples, path is None for queue overflows'''
+        try:
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+        except select.error as error:
+            if error.args[0] == errno.EINTR:
+                return []
+
+            raise
+
+        if not ready:
+            return []
+
+        data = os.read(self.fd, READ_SIZE)
+        events = []
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip('\0')
+            offset += length
+
+            dirname = self.paths.get(wd)
+
+            if mask & IN_IGNORED:
+                self.forget(wd)
+                continue
+            elif mask & IN_Q_OVERFLOW:
+                events.append((None, mask, cookie))
+                continue
+            elif dirname is None:
+                continue
+
+            if name:
+                path = os.path.join(dirname, name)
+            else:
+                path = dirname
+
+            events.append((path, mask, cookie))
+
+        return events
+
+    def close(self):
+        '''close the inotify file descriptor'''
+        os.close(self.fd)
+
+class Watcher(object):
+    '''watch a tree and return debounced batches of coalesced changes'''
+
+    def __init__(self, path, recursive=True, debounce=0.2, max_wait=None):
+        self.path = os.path.abspath(path)
+        self.recursive = recursive
+        self.debounce = debounce
+
+        if max_wait is None:
+            max_wait = debounce * 10
+
+        self.max_wait = max_wait
+        self.inotify = Inotify()
+
+        try:
+            self.watch(self.path, False)
+        except OSError:
+            self.inotify.close()
+            raise
+
+    def watch(self, path, report):
+        '''add watches for path and its subdirectories, if *report* is True
+        return the paths found below it as they may have been created before
+        the watch was set, otherwise path is the root and OSError is raised
+        if it can't be watched, subdirectories that vanish are skipped'''
+        found = []
+        pending = [path]
+
+        while pending:
+            current = pending.pop()
+
+            try:
+                self.inotify.add_watch(current)
+            except OSError:
+                if current == path and not report:
+                    raise
+
+                continue
+
+            if not self.recursive or not os.path.isdir(current):
+                continue
+
+            try:
+                names = os.listdir(current)
+            except OSError:
+                continue
+
+            for name in names:
+                child = os.path.join(current, name)
+
+                if report:
+                    found.append(child)
+
+                if os.path.isdir(child) and not os.path.islink(child):
+                    pending.append(child)
+
+        return found
+
+    def watching(self):
+        '''return True while the root is watched, its watch is removed when
+        it's deleted or its file system is unmounted'''
+        return self.path in self.inotify.wds
+
+    def batches(self, timeout=None):
+        '''yield lists of (event, path) tuples, stop after *timeout* seconds
+        without events if timeout is not None or after the batch where the
+        root was deleted'''
+        while self.watching():
+            events = self.inotify.read(timeout)
+
+            if not events:
+                if timeout is not None:
+                    return
+
+                continue
+
+            changes = OrderedDict()
+            self.coalesce(changes, events)
+            deadline = time.time() + self.max_wait
+
+            while time.time() < deadline:
+                events = self.inotify.read(self.debounce)
+
+                if not events:
+                    break
+
+                self.coalesce(changes, events)
+
+            if changes:
+                yield [(event, path) for path, event in changes.iteritems()]
+
+    def coalesce(self, changes, events):
+        '''merge *events* into the *changes* ordered dict of path to event'''
+        for path, mask, _cookie in events:
+            if path is None:
+                # queue overflow, we don't know what changed below the root
+                self.merge(changes, self.path, MODIFY)
+                continue
+
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self.merge(changes, path, CREATE)
+
+                if mask & IN_ISDIR and self.recursive:
+                    for child in self.watch(path, True):
+                        self.merge(changes, child, CREATE)
+
+            elif mask & (IN_DELETE | IN_MOVED_FROM | IN_DELETE_SELF |
+                    IN_MOVE_SELF):
+                if (mask & (IN_DELETE_SELF | IN_MOVE_SELF) and
+                        path != self.path):
+                    # already reported by the parent directory watch
+                    continue
+
+                self.merge(changes, path, DELETE)
+            else:
+                self.merge(changes, path, MODIFY)
+
+    @staticmethod
+    def merge(changes, path, event):
+        '''merge *event* for *path* with the previous one in the batch'''
+        previous = changes.get(path)
+
+        if previous is None:
+            changes[path] = event
+        elif previous == CREATE and event == DELETE:
+            del changes[path]
+        elif previous == CREATE:
+            pass
+        elif previous == DELETE and event == CREATE:
+            changes[path] = MODIFY
+        else:
+            changes[path] = event
+
+    def close(self):
+        '''stop watching'''
+        self.inotify.close()
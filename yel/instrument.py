@@ -0,0 +1,377 @@
+'''per phase timing of a command run and optional profiler dumps
+
+enabled with environment variables, when they are not set nothing is
+measured:
+
+    YEL_PROFILE=1 (or stderr) write a json record per command to stderr
+    YEL_PROFILE=path append a json record per command to path
+    YEL_PROFILE_CPROFILE=dir dump cProfile stats to dir/name-pid.prof
+    YEL_PROFILE_SAMPLE=dir dump sampled stacks to dir/name-pid.folded
+    YEL_PROFILE_INTERVAL=seconds time between samples, default 0.005
+    YEL_MEMTRACE=1 (or stderr) write a json memory record to stderr
+    YEL_MEMTRACE=path append a json memory record per command to path
+    YEL_MAX_MEMORY=size limit the address space of the command to size
+        bytes (k, m and g suffixes allowed), allocations over it fail with
+        an error result instead of the process being killed
+
+the phases are startup (interpreter and standard library imports), import
+(yel modules), parse_args, input (decoding the input), run (the command
+without input decoding) and output (encoding the result, for streamed
+results it includes producing the items)
+
+the memory record has the rss before and after each phase, the peak rss
+reached during it if it went over the previous peak and, when the
+tracemalloc module is available, the peak of traced memory and the top
+allocation sites'''
+import os
+import sys
+import json
+import time
+import signal
+import resource
+
+from collections import OrderedDict
+
+import util
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+LOADED = time.time()
+
+PROFILE = os.environ.get("YEL_PROFILE")
+CPROFILE_DIR = os.environ.get("YEL_PROFILE_CPROFILE")
+SAMPLE_DIR = os.environ.get("YEL_PROFILE_SAMPLE")
+MEMTRACE = os.environ.get("YEL_MEMTRACE")
+MAX_MEMORY = os.environ.get("YEL_MAX_MEMORY")
+
+ENABLED = bool(PROFILE or CPROFILE_DIR or SAMPLE_DIR or MEMTRACE)
+
+TOP_SITES = 10
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# the profile of the running command, None when profiling is disabled
+ACTIVE = None
+
+def sample_interval():
+    '''return the seconds between samples from YEL_PROFILE_INTERVAL'''
+    value = os.environ.get("YEL_PROFILE_INTERVAL")
+
+    if not value:
+        return DEFAULT_SAMPLE_INTERVAL
+
+    try:
+        interval = float(value)
+    except ValueError:
+        interval = None
+
+    if interval is None or interval <= 0:
+        raise ValueError("expected a positive number of seconds, got: %s" %
+                value)
+
+    return interval
+
+def process_start_time():
+    '''return the time the current process started, None if unknown'''
+    try:
+        with open("/proc/self/stat") as handle:
+            # the command name can contain spaces, fields start after it
+            fields = handle.read().rsplit(")", 1)[1].split()
+
+        with open("/proc/uptime") as handle:
+            uptime = float(handle.read().split()[0])
+
+        ticks = os.sysconf("SC_CLK_TCK")
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+    age = uptime - float(fields[19]) / ticks
+
+    return time.time() - age
+
+def limit_memory(size):
+    '''limit the address space of the process to *size* bytes'''
+    limit = util.parse_size(size)
+    _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+    return limit
+
+def memory_limit():
+    '''return the address space limit of the process, None if there is
+    none'''
+    soft, _hard = resource.getrlimit(resource.RLIMIT_AS)
+
+    return None if soft == resource.RLIM_INFINITY else soft
+
+def memory_error_reason():
+    '''return the reason for a MemoryError result'''
+    limit = memory_limit()
+
+    if limit is None:
+        return "out of memory"
+    else:
+        return "memory limit of %d bytes exceeded" % limit
+
+def current_rss():
+    '''return the resident set size of the process in bytes, None if
+    unknown'''
+    try:
+        with open("/proc/self/status") as handle:
+            for line in handle:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, ValueError):
+        pass
+
+    return None
+
+def peak_rss():
+    '''return the peak resident set size of the process in bytes'''
+    # linux reports kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class MemoryTrace(object):
+    '''memory use of each phase of a command run'''
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.tracing = tracemalloc is not None
+
+        if self.tracing:
+            tracemalloc.start()
+
+    def begin(self):
+        '''return the state at the start of a phase'''
+        if self.tracing and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+        return (current_rss(), peak_rss())
+
+    def end(self, phase, state):
+        '''record the memory of *phase* started with *state*'''
+        rss_before, peak_before = state
+        peak = peak_rss()
+        record = OrderedDict([
+            ("rss_before", rss_before),
+            ("rss_after", current_rss()),
+            ("peak_rss", peak if peak > peak_before else None)
+        ])
+
+        if self.tracing:
+            record["traced_peak"] = tracemalloc.get_traced_memory()[1]
+            record["top"] = self.top_sites()
+
+        self.phases[phase] = record
+
+    @staticmethod
+    def top_sites(limit=TOP_SITES):
+        '''return the allocation sites with more memory'''
+        stats = tracemalloc.take_snapshot().statistics("lineno")
+
+        return [OrderedDict([
+            ("site", "%s:%d" % (stat.traceback[0].filename,
+                stat.traceback[0].lineno)),
+            ("size", stat.size),
+            ("count", stat.count)]) for stat in stats[:limit]]
+
+    def to_json(self):
+        '''return the memory of each phase'''
+        return OrderedDict([
+            ("phases", self.phases),
+            ("peak_rss", peak_rss()),
+            ("limit", memory_limit()),
+            ("tracemalloc", self.tracing)
+        ])
+
+def write_record(destination, record):
+    '''write *record* to stderr if *destination* is 1 or stderr, append it
+    to the file *destination* otherwise'''
+    line = json.dumps(record)
+
+    if destination in ("1", "stderr"):
+        sys.stderr.write(line + "\n")
+        sys.stderr.flush()
+    else:
+        with open(destination, "a") as handle:
+            handle.write(line + "\n")
+
+class Sampler(object):
+    '''statistical profiler that counts the stacks seen on SIGPROF'''
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = {}
+
+    def start(self):
+        '''start sampling'''
+        signal.signal(signal.SIGPROF, self.sample)
+        # restart system calls so reads and writes aren't interrupted
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        '''stop sampling'''
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def sample(self, _signum, frame):
+        '''count the stack of *frame*'''
+        names = []
+
+        while frame is not None:
+            code = frame.f_code
+            names.append("%s:%s:%d" % (os.path.basename(code.co_filename),
+                code.co_name, code.co_firstlineno))
+            frame = frame.f_back
+
+        stack = ";".join(reversed(names))
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def dump(self, path):
+        '''write the stacks in the folded format used by flame graph
+        tools'''
+        with open(path, "w") as handle:
+            for stack, count in sorted(self.stacks.iteritems()):
+                handle.write("%s %d\n" % (stack, count))
+
+class Profile(object):
+    '''accumulated time of each phase of a command run'''
+
+    def __init__(self, name, argv=None):
+        self.name = name
+        self.argv = argv
+        self.started = time.time()
+        self.phases = OrderedDict()
+        # time of phases measured inside others, like decoding the input
+        # while the result is streamed, by enclosing phase
+        self.nested = {}
+        self.current = None
+        self.profiler = None
+        self.sampler = None
+        self.memory = MemoryTrace() if MEMTRACE else None
+
+        process_start = process_start_time()
+
+        if process_start is not None:
+            self.add("startup", max(LOADED - process_start, 0.0))
+
+        self.add("import", self.started - LOADED)
+
+    def add(self, phase, seconds):
+        '''add *seconds* to *phase*'''
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+        if self.current is not None and self.current != phase:
+            self.nested[self.current] = (self.nested.get(self.current, 0.0) +
+                    seconds)
+
+    def measure(self, phase, function, *args):
+        '''call *function* with *args* adding the time it takes to *phase*'''
+        enclosing = self.current
+        memory = self.memory.begin() if self.memory is not None else None
+        start = time.time()
+
+        self.current = phase
+
+        try:
+            return function(*args)
+        finally:
+            self.current = enclosing
+            self.add(phase, time.time() - start)
+
+            if memory is not None:
+                self.memory.end(phase, memory)
+
+    def measure_iter(self, phase, items):
+        '''yield the *items* adding the time to get each one to *phase*'''
+        iterator = iter(items)
+
+        while True:
+            start = time.time()
+
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(phase, time.time() - start)
+                return
+
+            self.add(phase, time.time() - start)
+            yield item
+
+    def start_profilers(self):
+        '''start the profilers enabled in the environment'''
+        if CPROFILE_DIR:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        if SAMPLE_DIR:
+            self.sampler = Sampler(sample_interval())
+            self.sampler.start()
+
+    def stop_profilers(self):
+        '''stop the profilers and dump their results'''
+        base = "%s-%d" % (self.name, os.getpid())
+        sampler, self.sampler = self.sampler, None
+
+        try:
+            if self.profiler is not None:
+                self.profiler.disable()
+                self.profiler.dump_stats(os.path.join(CPROFILE_DIR,
+                    base + ".prof"))
+                self.profiler = None
+        finally:
+            # the timer must not keep firing if a dump fails
+            if sampler is not None:
+                sampler.stop()
+
+        if sampler is not None:
+            sampler.dump(os.path.join(SAMPLE_DIR, base + ".folded"))
+
+    def header(self, status):
+        '''return the fields that identify the record'''
+        return [
+            ("command", self.name),
+            ("argv", self.argv),
+            ("pid", os.getpid()),
+            ("status", status)
+        ]
+
+    def to_json(self, status=None):
+        '''return the profile record, the time of nested phases is only
+        counted in the nested phase'''
+        phases = OrderedDict((phase, seconds - self.nested.get(phase, 0.0))
+                for phase, seconds in self.phases.iteritems())
+
+        return OrderedDict(self.header(status) + [
+            ("phases", phases),
+            ("total", sum(phases.values()))
+        ])
+
+    def write(self, status=None):
+        '''write the profile record and the memory record to their
+        destinations'''
+        self.stop_profilers()
+
+        if PROFILE:
+            write_record(PROFILE, self.to_json(status))
+
+        if self.memory is not None:
+            write_record(MEMTRACE, OrderedDict(self.header(status) +
+                self.memory.to_json().items()))
+
+def start(name, argv=None):
+    '''start profiling command *name*, return the Profile'''
+    global ACTIVE
+    ACTIVE = Profile(name, argv)
+    ACTIVE.start_profilers()
+
+    return ACTIVE
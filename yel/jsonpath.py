@@ -0,0 +1,97 @@
+'''compiled path expressions to reach nested json values'''
+import re
+import json
+
+import util
+
+CACHE = util.LruCache(256)
+
+TOKEN = re.compile(r'''
+    \.?(?P<key>[^.\[\]]+) |
+    \[(?P<index>-?\d+)\] |
+    \[(?P<quoted>"(?:[^"\\]|\\.)*")\] |
+    \['(?P<single>[^']*)'\]
+    ''', re.VERBOSE)
+
+class Path(object):
+    '''a parsed path like a.b[3].c or ["key.with.dots"][0], keys get object
+    fields and indexes get list items
+
+    expression can also be an already parsed list of steps or a single
+    index'''
+
+    def __init__(self, expression):
+        self.expression = expression
+
+        if isinstance(expression, basestring):
+            self.steps = parse(expression)
+        else:
+            if isinstance(expression, list):
+                self.steps = list(expression)
+            else:
+                self.steps = [expression]
+
+            for step in self.steps:
+                util.expect_type(step, "path step", (basestring, int))
+
+    def __repr__(self):
+        return "Path(%r)" % self.expression
+
+    def get(self, value, default=None):
+        '''return the value at the path in *value*, *default* if any step is
+        missing'''
+        for step in self.steps:
+            if isinstance(step, int):
+                if not isinstance(value, list):
+                    return default
+
+                try:
+                    value = value[step]
+                except IndexError:
+                    return default
+            else:
+                if not isinstance(value, dict) or step not in value:
+                    return default
+
+                value = value[step]
+
+        return value
+
+def parse(expression):
+    '''return the list of steps in the path *expression*, keys as strings and
+    list indexes as ints'''
+    steps = []
+    pos = 0
+
+    while pos < len(expression):
+        match = TOKEN.match(expression, pos)
+
+        if match is None:
+            raise ValueError("invalid path %s at position %d" % (expression,
+                pos))
+
+        if match.group("key") is not None:
+            steps.append(match.group("key"))
+        elif match.group("index") is not None:
+            steps.append(int(match.group("index")))
+        elif match.group("quoted") is not None:
+            steps.append(json.loads(match.group("quoted")))
+        else:
+            steps.append(match.group("single"))
+
+        pos = match.end()
+
+    return steps
+
+def compile(expression):
+    '''return a Path for *expression* reusing the most recently compiled
+    ones'''
+    return CACHE.get(util.hashable(expression), lambda: Path(expression))
+
+def field_getter(field):
+    '''return a function that gets the *field* path from an item, None if
+    it's missing, the item itself if field is None'''
+    if field is None:
+        return lambda item: item
+
+    return compile(field).get
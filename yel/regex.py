@@ -0,0 +1,81 @@
+'''compiled regular expressions with a process wide LRU cache'''
+import re
+import sre_parse
+import sre_constants
+
+import util
+
+CACHE = util.LruCache(256)
+
+class Pattern(object):
+    '''compiled regular expression that checks its literal prefix with a
+    plain substring search before running the regex engine'''
+
+    def __init__(self, pattern, flags=0):
+        self.regex = re.compile(pattern, flags)
+        self.prefix = literal_prefix(pattern, flags)
+
+    def match(self, text):
+        '''return the match at the beginning of *text* or None'''
+        if self.prefix and not text.startswith(self.prefix):
+            return None
+
+        return self.regex.match(text)
+
+    def search(self, text):
+        '''return the first match in *text* or None'''
+        if self.prefix and self.prefix not in text:
+            return None
+
+        return self.regex.search(text)
+
+    def sub(self, repl, text, count=0):
+        '''return *text* with the matches replaced by *repl*'''
+        if self.prefix and self.prefix not in text:
+            return text
+
+        return self.regex.sub(repl, text, count)
+
+    def findall(self, text):
+        '''return a list with all the matches in *text*'''
+        if self.prefix and self.prefix not in text:
+            return []
+
+        return self.regex.findall(text)
+
+def literal_prefix(pattern, flags=0):
+    '''return the literal text every match of *pattern* starts with, an empty
+    string if there is none or it can't be used for a plain search'''
+    if flags & (re.IGNORECASE | re.LOCALE | re.VERBOSE):
+        return ""
+
+    parsed = sre_parse.parse(pattern, flags)
+
+    if parsed.pattern.flags & (re.IGNORECASE | re.LOCALE | re.VERBOSE):
+        return ""
+
+    chars = []
+
+    for op, value in parsed:
+        if op == sre_constants.LITERAL:
+            chars.append(unichr(value))
+        elif op == sre_constants.AT and value == sre_constants.AT_BEGINNING:
+            continue
+        else:
+            break
+
+    prefix = u"".join(chars)
+
+    if isinstance(pattern, str):
+        try:
+            prefix = str(prefix)
+        except UnicodeEncodeError:
+            return ""
+
+    return prefix
+
+def compile(pattern, flags=0):
+    '''return a Pattern for *pattern* reusing the most recently compiled
+    ones'''
+    return CACHE.get((type(pattern), pattern, flags),
+            lambda: Pattern(pattern, flags))
@@ -0,0 +1,150 @@
+'''set algebra between lists of json values'''
+import json
+import heapq
+
+import util
+
+UNION = "union"
+INTERSECT = "intersect"
+DIFFERENCE = "difference"
+
+END = object()
+
+class NotSorted(ValueError):
+    '''raised when an input that should be sorted isn't'''
+
+def check_sorted(items, index):
+    '''yield the *items* of input number *index*, raise NotSorted if one is
+    smaller than the previous one'''
+    previous = END
+
+    for item in items:
+        if previous is not END and item < previous:
+            raise NotSorted("input %d is not sorted at item: %s" % (index,
+                json.dumps(item)))
+
+        previous = item
+        yield item
+
+def drain(results, inputs):
+    '''yield the *results* and then read what's left of the *inputs*, so
+    the items the operation didn't need are checked too'''
+    for item in results:
+        yield item
+
+    for items in inputs:
+        for _ in items:
+            pass
+
+def unique(items):
+    '''yield the items that were not seen before'''
+    seen = set()
+
+    for item in items:
+        key = util.hashable(item)
+
+        if key not in seen:
+            seen.add(key)
+            yield item
+
+def unique_sorted(items):
+    '''yield the items of a sorted iterable skipping consecutive repeats'''
+    previous = END
+
+    for item in items:
+        if previous is END or item != previous:
+            previous = item
+            yield item
+
+def hash_union(inputs):
+    '''yield the unique items of all inputs in order of appearance'''
+    return unique(item for items in inputs for item in items)
+
+def hash_intersect(inputs):
+    '''yield the unique items of the first input that are in all the
+    others'''
+    inputs = list(inputs)
+    keys = None
+
+    for items in inputs[1:]:
+        current = set(util.hashable(item) for item in items)
+
+        if keys is None:
+            keys = current
+        else:
+            keys &= current
+
+    for item in unique(inputs[0]):
+        if keys is None or util.hashable(item) in keys:
+            yield item
+
+def hash_difference(inputs):
+    '''yield the unique items of the first input that are in none of the
+    others'''
+    inputs = list(inputs)
+    keys = set()
+
+    for items in inputs[1:]:
+        keys.update(util.hashable(item) for item in items)
+
+    for item in unique(inputs[0]):
+        if util.hashable(item) not in keys:
+            yield item
+
+def sorted_union(inputs):
+    '''yield the union of sorted inputs in order using constant memory'''
+    return unique_sorted(heapq.merge(*inputs))
+
+def sorted_intersect(inputs):
+    '''yield the intersection of sorted inputs in order using constant
+    memory'''
+    iterators = [iter(items) for items in inputs]
+    heads = [next(iterator, END) for iterator in iterators]
+    previous = END
+
+    while all(head is not END for head in heads):
+        highest = max(heads)
+
+        if all(head == highest for head in heads):
+            if previous is END or highest != previous:
+                previous = highest
+                yield highest
+
+            heads = [next(iterator, END) for iterator in iterators]
+        else:
+            for i, iterator in enumerate(iterators):
+                while heads[i] is not END and heads[i] < highest:
+                    heads[i] = next(iterator, END)
+
+def sorted_difference(inputs):
+    '''yield the items of the first sorted input that are in none of the
+    others in order using constant memory'''
+    inputs = list(inputs)
+    others = heapq.merge(*inputs[1:])
+    other = next(others, END)
+
+    for item in unique_sorted(inputs[0]):
+        while other is not END and other < item:
+            other = next(others, END)
+
+        if other is END or other != item:
+            yield item
+
+OPERATIONS = {
+    UNION: (hash_union, sorted_union),
+    INTERSECT: (hash_intersect, sorted_intersect),
+    DIFFERENCE: (hash_difference, sorted_difference)
+}
+
+def apply(operation, inputs, is_sorted=False):
+    '''return an iterator with the result of *operation* between the
+    iterables in *inputs*, if is_sorted is True the inputs must be sorted
+    and are merged instead of hashed'''
+    hashed, merged = OPERATIONS[operation]
+
+    if is_sorted:
+        checked = [check_sorted(items, index)
+            for index, items in enumerate(inputs)]
+        return drain(merged(checked), checked)
+    else:
+        return hashed(inputs)
@@ -0,0 +1,316 @@
+'''handoff of large numeric lists between commands through shared memory
+
+enabled setting YEL_SHM to 1 or to the directory to use, /dev/shm by
+default, YEL_SHM_MIN sets the minimum number of items to use it (default
+65536)
+
+a command whose result is a list of ints or floats with at least that many
+items writes them as binary to a file in the shared memory directory and
+outputs a descriptor like
+
+    {"$yel-shm": {"path": "/dev/shm/yel-12-13-x1b2", "type": "l",
+        "length": 3}}
+
+instead of the json, a command that reads a descriptor as its input loads
+the numbers from the file without decoding json and removes it, the numbers
+are copied from the file into a list, not mapped
+
+the descriptor is only written when stdout is a pipe and every other
+process that has it open for reading is a yel command that reads its input,
+so it never goes to a file, a terminal or another program, the consumer only
+loads files from its own shared memory directory
+
+the file name has the pids of the command that wrote it and of its readers,
+the file is removed if writing the descriptor fails and the files of
+commands that are all gone are removed the next time a command exports, so
+a reader that dies or never reads its input doesn't leave them there'''
+import os
+import stat
+import errno
+import array
+import tempfile
+
+SHM = os.environ.get("YEL_SHM")
+ENABLED = bool(SHM)
+
+DEFAULT_DIR = "/dev/shm"
+
+SHM_DIR = DEFAULT_DIR if SHM in (None, "", "1") else SHM
+
+DEFAULT_MIN_ITEMS = 65536
+
+PREFIX = "yel-"
+
+KEY = "$yel-shm"
+
+# the script every yel entry point links to
+ENTRY_POINT = os.path.realpath(os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "commands.py"))
+
+# bits of the open flags with the access mode
+ACCESS_MODE = 3
+
+INT = "l"
+FLOAT = "d"
+
+def type_code(items):
+    '''return the array type code to store *items*, None if they are not
+    all ints or all floats'''
+    if not items:
+        return None
+
+    first = type(items[0])
+
+    if first is int:
+        code = INT
+    elif first is float:
+        code = FLOAT
+    else:
+        return None
+
+    # bools and longs don't round trip
+    if all(type(item) is first for item in items):
+        return code
+
+    return None
+
+def min_items():
+    '''return the minimum number of items to use shared memory'''
+    count = os.environ.get("YEL_SHM_MIN")
+
+    if count:
+        try:
+            return max(1, int(count))
+        except ValueError:
+            raise ValueError("expected a number of items, got: %s" % count)
+
+    return DEFAULT_MIN_ITEMS
+
+def export(value, fd, reads_input, minimum=None, directory=SHM_DIR):
+    '''write *value* to shared memory if it's a large enough numeric list and
+    it's going to be written to a pipe that only yel reads from on *fd*,
+    return its descriptor, otherwise return value as it is, *reads_input* is
+    called with the args of each reader and returns True if it reads its
+    input'''
+    if minimum is None:
+        minimum = min_items()
+
+    if not isinstance(value, list) or len(value) < minimum:
+        return value
+
+    code = type_code(value)
+
+    if code is None:
+        return value
+
+    readers = exportable_readers(fd, reads_input)
+
+    if not readers:
+        return value
+
+    sweep(directory)
+
+    pids = [os.getpid()] + sorted(readers)
+    prefix = "%s%s-" % (PREFIX, "-".join(str(pid) for pid in pids))
+    fd, path = tempfile.mkstemp(prefix=prefix, dir=directory)
+
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            array.array(code, value).tofile(handle)
+    except:
+        os.remove(path)
+        raise
+
+    return {KEY: {"path": path, "type": code, "length": len(value)}}
+
+def pipe_readers(fd):
+    '''return the pids of the other processes that have the pipe *fd* open
+    for reading, None if fd isn't a pipe or they can't be known'''
+    try:
+        if not stat.S_ISFIFO(os.fstat(fd).st_mode):
+            return None
+
+        target = os.readlink("/proc/self/fd/%d" % fd)
+        pids = [name for name in os.listdir("/proc") if name.isdigit()]
+    except OSError:
+        return None
+
+    own = str(os.getpid())
+    readers = set()
+
+    for pid in pids:
+        if pid == own:
+            continue
+
+        fd_dir = "/proc/%s/fd" % pid
+
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+
+        for name in fds:
+            try:
+                if os.readlink(os.path.join(fd_dir, name)) != target:
+                    continue
+
+                with open("/proc/%s/fdinfo/%s" % (pid, name)) as handle:
+                    flags = dict(line.split(":", 1) for line in handle
+                            if ":" in line).get("flags", "1")
+            except (IOError, OSError):
+                continue
+
+            if int(flags, 8) & ACCESS_MODE == os.O_RDONLY:
+                readers.add(int(pid))
+
+    return readers
+
+def yel_args(pid):
+    '''return the args of the yel entry point process *pid* runs, directly
+    or as the script of the interpreter, starting with the entry point, None
+    if it doesn't run one'''
+    try:
+        with open("/proc/%d/cmdline" % pid) as handle:
+            args = handle.read().split("\0")
+
+        cwd = os.readlink("/proc/%d/cwd" % pid)
+    except (IOError, OSError):
+        return None
+
+    # the last item is the empty string after the final separator
+    args = args[:-1]
+
+    for index, arg in enumerate(args[:2]):
+        if arg and os.path.realpath(os.path.join(cwd, arg)) == ENTRY_POINT:
+            return args[index:]
+
+    return None
+
+def is_yel(pid):
+    '''return True if process *pid* runs a yel entry point'''
+    return yel_args(pid) is not None
+
+def exportable_readers(fd, reads_input):
+    '''return the pids of the readers of *fd* if a descriptor can be written
+    to it, it must be a pipe read only by yel commands that read their input
+    according to *reads_input*, an empty set otherwise'''
+    readers = pipe_readers(fd)
+
+    if not readers:
+        return set()
+
+    for pid in readers:
+        args = yel_args(pid)
+
+        if args is None or not reads_input(args):
+            return set()
+
+    return readers
+
+def can_export(fd, reads_input):
+    '''return True if a descriptor can be written to *fd*'''
+    return bool(exportable_readers(fd, reads_input))
+
+def is_alive(pid):
+    '''return True if process *pid* exists'''
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno == errno.EPERM
+
+    return True
+
+def file_pids(name):
+    '''return the pids in the shared memory file *name*, None if it's not
+    one'''
+    if not name.startswith(PREFIX):
+        return None
+
+    # the last part is the random suffix of the file
+    parts = name[len(PREFIX):].split("-")[:-1]
+
+    if not parts or not all(part.isdigit() for part in parts):
+        return None
+
+    return [int(part) for part in parts]
+
+def sweep(directory=SHM_DIR):
+    '''remove the shared memory files in *directory* whose writer and
+    readers are all gone'''
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+
+    for name in names:
+        pids = file_pids(name)
+
+        if pids is None or any(is_alive(pid) for pid in pids):
+            continue
+
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+def release(descriptor):
+    '''remove the shared memory file of *descriptor* if it's there, for a
+    descriptor that couldn't be written'''
+    try:
+        os.remove(descriptor[KEY]["path"])
+    except OSError:
+        pass
+
+def is_descriptor(value):
+    '''return True if *value* is a shared memory descriptor'''
+    return isinstance(value, dict) and len(value) == 1 and KEY in value
+
+def attach(descriptor):
+    '''return the list in the shared memory of *descriptor* and remove it'''
+    info = descriptor[KEY]
+    path = info["path"]
+
+    if (os.path.dirname(os.path.abspath(path)) != os.path.abspath(SHM_DIR)
+            or not os.path.basename(path).startswith(PREFIX)):
+        raise ValueError("shared memory outside of %s: %s" % (SHM_DIR, path))
+
+    if info["type"] not in (INT, FLOAT):
+        raise ValueError("invalid shared memory type: %s" % info["type"])
+
+    items = array.array(str(info["type"]))
+
+    try:
+        with open(path, "rb") as handle:
+            items.fromfile(handle, info["length"])
+    except EOFError:
+        raise ValueError("truncated shared memory: %s" % path)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    return items.tolist()
+
+def load(value):
+    '''return the list of *value* if it's a descriptor, value otherwise'''
+    if is_descriptor(value):
+        return attach(value)
+
+    return value
+
+def expand(items):
+    '''yield *items*, the numbers of a descriptor if it's the only one'''
+    items = iter(items)
+
+    for item in items:
+        if is_descriptor(item):
+            for number in attach(item):
+                yield number
+        else:
+            yield item
+
+        break
+
+    for item in items:
+        yield item
@@ -0,0 +1,118 @@
+'''persistent variable store shared by commands
+
+enabled setting YEL_STORE to a file path, env set and Command.set write
+variables to it and env get and Command.get read them from it before
+looking in the environment, so a value set in a pipeline stage is seen by
+the stages and pipelines that run after it
+
+values are stored already decoded in marshal format, a process decodes
+the file once and uses it again while it doesn't change, get returns a
+copy of the value so changing it doesn't change the loaded ones, writers
+hold a lock on path.lock and replace the file with a rename so readers
+never see a partial write and don't need to lock'''
+import os
+import copy
+import fcntl
+import marshal
+import tempfile
+
+PATH = os.environ.get("YEL_STORE")
+ENABLED = bool(PATH)
+
+# returned by get when the variable isn't set
+MISSING = object()
+
+def file_key(stat):
+    '''return the key that identifies a version of a file from its *stat*'''
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime
+
+class Store(object):
+    '''variables in a file'''
+
+    def __init__(self, path=PATH):
+        self.path = os.path.expanduser(path)
+        self.lock_path = self.path + ".lock"
+        # (device, inode, size, modification time) of the loaded file
+        self.loaded = None
+        self.values = {}
+
+    def stat_key(self):
+        '''return the key that identifies the current file, None if it
+        doesn't exist'''
+        try:
+            return file_key(os.stat(self.path))
+        except OSError:
+            return None
+
+    def load(self):
+        '''return the variables, decoding the file only if it changed'''
+        key = self.stat_key()
+
+        if key is None:
+            self.loaded, self.values = None, {}
+        elif key != self.loaded:
+            try:
+                with open(self.path, "rb") as handle:
+                    self.values = marshal.load(handle)
+            except IOError:
+                self.values = {}
+            except (EOFError, ValueError, TypeError):
+                raise ValueError("invalid store file: %s" % self.path)
+
+            self.loaded = key
+
+        return self.values
+
+    def get(self, name, default=MISSING):
+        '''return a copy of the value of *name*, default if it isn't set'''
+        value = self.load().get(name, MISSING)
+
+        if value is MISSING:
+            return default
+
+        return copy.deepcopy(value)
+
+    def set(self, name, value):
+        '''set *name* to *value*'''
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            try:
+                values = dict(self.load())
+                values[name] = value
+                self.write(values)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def write(self, values):
+        '''replace the file with *values*'''
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                marshal.dump(values, handle)
+                handle.flush()
+                key = file_key(os.fstat(handle.fileno()))
+
+            os.rename(tmp_path, self.path)
+        except ValueError:
+            os.remove(tmp_path)
+            raise ValueError("can't store the value, unsupported type")
+        except:
+            os.remove(tmp_path)
+            raise
+
+        self.values = values
+        self.loaded = key
+
+STORE = None
+
+def default_store():
+    '''return the store at YEL_STORE'''
+    global STORE
+
+    if STORE is None:
+        STORE = Store()
+
+    return STORE
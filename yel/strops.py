@@ -0,0 +1,53 @@
+'''batched string operations used by the string commands'''
+
+def string_method(type_, op):
+    '''return the unbound method *op* of string type *type_*, None if type_
+    isn't a string type'''
+    if issubclass(type_, basestring):
+        return getattr(type_, op)
+    else:
+        return None
+
+def apply(op, items, args=(), expand=True):
+    '''apply the string method *op* to every string in *items* with *args*,
+    items that are not strings are returned untouched
+
+    the method is resolved once per type instead of once per item, if expand
+    is False args is passed as a single argument'''
+    if expand:
+        args = tuple(args)
+    else:
+        args = (args,)
+
+    types = set(type(item) for item in items)
+
+    if len(types) == 1:
+        method = string_method(types.pop(), op)
+
+        if method is None:
+            return list(items)
+        else:
+            return apply_method(method, items, args)
+
+    methods = dict((type_, string_method(type_, op)) for type_ in types)
+    result = []
+
+    for item in items:
+        method = methods[type(item)]
+
+        if method is None:
+            result.append(item)
+        else:
+            result.append(method(item, *args))
+
+    return result
+
+def apply_method(method, items, args):
+    '''apply *method* with *args* to every item'''
+    if len(args) == 0:
+        return map(method, items)
+    elif len(args) == 1:
+        arg = args[0]
+        return [method(item, arg) for item in items]
+    else:
+        return [method(item, *args) for item in items]
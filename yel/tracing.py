@@ -0,0 +1,305 @@
+'''trace spans of command runs across the processes of a pipeline
+
+enabled setting YEL_TRACE to the path of a file where a json line is
+appended per span, the trace and parent span ids are read from and passed
+to nested commands in the YEL_TRACE_ID and YEL_SPAN_ID vars, if there is
+no trace id the processes started by the same parent process (the stages
+of a shell pipeline) share one
+
+stages are linked by the pipe their stdout and stdin are connected to'''
+import os
+import sys
+import json
+import time
+import binascii
+
+from collections import OrderedDict
+
+TRACE_FILE = os.environ.get("YEL_TRACE")
+ENABLED = bool(TRACE_FILE)
+
+TRACE_ID = "YEL_TRACE_ID"
+SPAN_ID = "YEL_SPAN_ID"
+
+# counting wrapper of stdin, created when a traced command reads its input
+STDIN = []
+
+def new_id():
+    '''return a random span id'''
+    return binascii.hexlify(os.urandom(8))
+
+def process_start(pid):
+    '''return the start time of process *pid* in clock ticks since boot, None
+    if unknown'''
+    try:
+        with open("/proc/%d/stat" % pid) as handle:
+            return handle.read().rsplit(")", 1)[1].split()[19]
+    except (IOError, IndexError):
+        return None
+
+def default_trace_id():
+    '''return a trace id shared by the processes with the same parent'''
+    parent = os.getppid()
+
+    return "%d-%s" % (parent, process_start(parent) or "0")
+
+def fd_target(fd):
+    '''return what file descriptor *fd* points to, like pipe:[1234] or a
+    path, None if unknown'''
+    try:
+        return os.readlink("/proc/self/fd/%d" % fd)
+    except OSError:
+        return None
+
+class CountingReader(object):
+    '''file like object that counts the bytes read from *stream*'''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def read(self, size=-1):
+        '''read up to *size* bytes'''
+        data = self.stream.read(size)
+        self.count += len(data)
+        return data
+
+    def readline(self, size=-1):
+        '''read a line'''
+        data = self.stream.readline(size)
+        self.count += len(data)
+        return data
+
+    def __iter__(self):
+        for line in self.stream:
+            self.count += len(line)
+            yield line
+
+class CountingWriter(object):
+    '''file like object that counts the bytes written to *stream*'''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def write(self, data):
+        '''write *data*'''
+        self.count += len(data)
+        self.stream.write(data)
+
+    def flush(self):
+        '''flush the stream'''
+        self.stream.flush()
+
+def stdin(stream=None):
+    '''return the counting wrapper of the input, *stream* or stdin'''
+    if not STDIN:
+        STDIN.append(CountingReader(sys.stdin if stream is None else stream))
+
+    return STDIN[0]
+
+def input_bytes():
+    '''return the bytes read from stdin'''
+    return STDIN[0].count if STDIN else 0
+
+class Span(object):
+    '''the run of a command'''
+
+    def __init__(self, name, vars_, args, root=False):
+        self.name = name
+        self.trace_id = vars_.get(TRACE_ID) or default_trace_id()
+        self.parent_id = vars_.get(SPAN_ID)
+        self.span_id = new_id()
+        self.args_size = len(json.dumps(args))
+        self.root = root
+        self.start = time.time()
+
+    def propagate(self, vars_):
+        '''return a copy of *vars_* with the ids for nested commands'''
+        result = dict(vars_)
+        result[TRACE_ID] = self.trace_id
+        result[SPAN_ID] = self.span_id
+
+        return result
+
+    def end(self, status, input_bytes=None, output_bytes=None):
+        '''write the span to the trace file'''
+        end = time.time()
+        record = OrderedDict([
+            ("trace_id", self.trace_id),
+            ("span_id", self.span_id),
+            ("parent_id", self.parent_id),
+            ("command", self.name),
+            ("pid", os.getpid()),
+            ("start", self.start),
+            ("end", end),
+            ("duration", end - self.start),
+            ("status", status),
+            ("args_bytes", self.args_size),
+            ("input_bytes", input_bytes),
+            ("output_bytes", output_bytes)
+        ])
+
+        if self.root:
+            record["stdin"] = fd_target(0)
+            record["stdout"] = fd_target(1)
+
+        write(record)
+
+def write(record):
+    '''append *record* to the trace file with a single write so lines of
+    concurrent processes don't mix'''
+    fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+
+    try:
+        os.write(fd, json.dumps(record) + "\n")
+    finally:
+        os.close(fd)
+
+def load(path):
+    '''return the list of spans in the trace file *path*'''
+    spans = []
+
+    with open(path) as handle:
+        for line in handle:
+            line = line.strip()
+
+            if line:
+                spans.append(json.loads(line))
+
+    return spans
+
+def chains(spans):
+    '''return the lists of root spans connected by pipes, each in pipeline
+    order'''
+    by_stdout = {}
+
+    for span in spans:
+        target = span.get("stdout") or ""
+
+        if target.startswith("pipe:"):
+            by_stdout[target] = span
+
+    upstream = {}
+    downstream = {}
+
+    for span in spans:
+        source = by_stdout.get(span.get("stdin"))
+
+        if source is not None and source is not span:
+            upstream[span["span_id"]] = source
+            downstream[source["span_id"]] = span
+
+    result = []
+
+    for span in sorted(spans, key=lambda span: span["start"]):
+        if span["span_id"] in upstream:
+            continue
+
+        chain = [span]
+
+        while chain[-1]["span_id"] in downstream:
+            chain.append(downstream[chain[-1]["span_id"]])
+
+        result.append(chain)
+
+    return result
+
+def critical_path(chain):
+    '''return the (stage, seconds) of *chain* that determined its end with
+    the time each one added, going back from the last stage while a stage
+    started before its upstream ended, so it was waiting for its input'''
+    path = []
+    index = len(chain) - 1
+
+    while index >= 0:
+        stage = chain[index]
+        upstream = chain[index - 1] if index > 0 else None
+
+        if upstream is not None and upstream["end"] > stage["start"]:
+            path.append((stage, stage["end"] - upstream["end"]))
+            index -= 1
+        else:
+            path.append((stage, stage["end"] - stage["start"]))
+            break
+
+    path.reverse()
+
+    return path
+
+def throughput(size, seconds):
+    '''return *size* per second, None if unknown'''
+    if size is None or seconds <= 0:
+        return None
+
+    return size / seconds
+
+def stage_report(span, origin):
+    '''return the report of a single stage'''
+    return OrderedDict([
+        ("command", span["command"]),
+        ("span_id", span["span_id"]),
+        ("status", span["status"]),
+        ("start", span["start"] - origin),
+        ("duration", span["duration"]),
+        ("input_bytes", span["input_bytes"]),
+        ("output_bytes", span["output_bytes"]),
+        ("input_throughput", throughput(span["input_bytes"],
+            span["duration"])),
+        ("output_throughput", throughput(span["output_bytes"],
+            span["duration"])),
+        ("nested", span.get("nested", 0))
+    ])
+
+def report(spans, trace_id=None):
+    '''return a report per trace with its pipelines, the stages of each with
+    their throughput and the critical path'''
+    traces = OrderedDict()
+
+    for span in sorted(spans, key=lambda span: span["start"]):
+        if trace_id is None or span["trace_id"] == trace_id:
+            traces.setdefault(span["trace_id"], []).append(span)
+
+    result = []
+
+    for current_id, trace_spans in traces.iteritems():
+        ids = set(span["span_id"] for span in trace_spans)
+        roots = []
+        nested = {}
+
+        for span in trace_spans:
+            parent_id = span.get("parent_id")
+
+            if parent_id in ids:
+                nested[parent_id] = nested.get(parent_id, 0) + 1
+            else:
+                roots.append(span)
+
+        for span in roots:
+            span["nested"] = nested.get(span["span_id"], 0)
+
+        origin = min(span["start"] for span in trace_spans)
+        pipelines = []
+
+        for chain in chains(roots):
+            path = critical_path(chain)
+            wall = chain[-1]["end"] - min(stage["start"] for stage in chain)
+
+            pipelines.append(OrderedDict([
+                ("wall", wall),
+                ("stages", [stage_report(stage, origin) for stage in chain]),
+                ("critical_path", [OrderedDict([
+                    ("command", stage["command"]),
+                    ("span_id", stage["span_id"]),
+                    ("seconds", seconds)]) for stage, seconds in path]),
+                ("bottleneck", max(path,
+                    key=lambda step: step[1])[0]["command"])
+            ]))
+
+        result.append(OrderedDict([
+            ("trace_id", current_id),
+            ("spans", len(trace_spans)),
+            ("pipelines", pipelines)
+        ]))
+
+    return result
@@ -1,4 +1,9 @@
 '''utility functions for commands'''
+import re
+import json
+import thread
+
+from collections import OrderedDict, Iterator
 
 TYPE_CHECKS = {
     "integer": lambda x: isinstance(x, int) and not isinstance(x, bool),
@@ -16,6 +21,11 @@ TYPE_CHECKS = {
     "truthy": lambda x: not (x == False or x == 0 or x == 0.0 or x == None)
 }
 
+def is_iterator(value):
+    '''return True if *value* is an iterator, like the streamed output of
+    another command'''
+    return isinstance(value, Iterator)
+
 def listify(item):
     '''return the item as a list'''
     if isinstance(item, list):
@@ -46,7 +56,12 @@ def expect_int(item, name="value"):
 def expect_type(item, name, type_, msg="expected %s for %s, got: %s"):
     '''raise ValueError if item is not an instance of type_'''
     if not isinstance(item, type_):
-        raise ValueError(msg % (type_.__name__, name, str(item)))
+        if isinstance(type_, tuple):
+            type_name = " or ".join(type_item.__name__ for type_item in type_)
+        else:
+            type_name = type_.__name__
+
+        raise ValueError(msg % (type_name, name, str(item)))
 
     return item
 
@@ -76,3 +91,268 @@ def expect_arg_type(args, key, type_, default=None, name=None):
         result = default
 
     return result
+
+SIZE_SUFFIXES = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+def parse_size(size):
+    '''return the number of bytes in *size*, an int or a string with an
+    optional k, m or g suffix'''
+    if isinstance(size, (int, long)):
+        return size
+
+    text = str(size).strip().lower()
+    multiplier = SIZE_SUFFIXES.get(text[-1:], None)
+
+    if multiplier is None:
+        return int(text)
+    else:
+        return int(float(text[:-1]) * multiplier)
+
+def canonical(value):
+    '''return a string that is equal for equal json values'''
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+HASHABLE_TYPES = (str, unicode, int, long, float, type(None))
+
+def hashable(value):
+    '''return a hashable value that is equal for equal json values, lists and
+    objects are encoded, booleans are tagged so they don't match 0 and 1'''
+    if isinstance(value, bool):
+        return (bool, value)
+    elif isinstance(value, HASHABLE_TYPES):
+        return value
+    else:
+        return (list, canonical(value))
+
+class LruCache(object):
+    '''mapping that keeps only the *size* most recently used items, it can
+    be used from many threads'''
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        # threading.Lock without importing threading in every command
+        self.lock = thread.allocate_lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, factory):
+        '''return the item for *key*, if it's not cached create it calling
+        factory() and cache it, factory is called without holding the lock'''
+        with self.lock:
+            item = self.items.pop(key, None)
+
+            if item is not None:
+                self.items[key] = item
+                return item
+
+        item = factory()
+
+        with self.lock:
+            self.items.pop(key, None)
+
+            if len(self.items) >= self.size:
+                self.items.popitem(last=False)
+
+            self.items[key] = item
+
+        return item
+
+JSON_DECODER = json.JSONDecoder()
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+READ_SIZE = 64 * 1024
+
+class ChunkReader(object):
+    '''file like object that reads from an iterator of strings'''
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buf = ""
+        self.pos = 0
+        self.done = False
+
+    def fill(self):
+        '''add the next chunk to the buffer, return False at the end'''
+        if self.done:
+            return False
+
+        for chunk in self.chunks:
+            self.buf = self.buf[self.pos:] + chunk
+            self.pos = 0
+            return True
+
+        self.done = True
+        return False
+
+    def read(self, size=-1):
+        '''read up to *size* bytes, all of them if size is negative'''
+        if size < 0:
+            data = self.buf[self.pos:] + "".join(self.chunks)
+            self.buf, self.pos, self.done = "", 0, True
+
+            return data
+
+        while len(self.buf) - self.pos < size and self.fill():
+            pass
+
+        end = self.pos + size
+        data = self.buf[self.pos:end]
+        self.pos += len(data)
+
+        return data
+
+    def readline(self):
+        '''read a line including the new line'''
+        end = self.buf.find("\n", self.pos) + 1
+
+        if end:
+            line = self.buf[self.pos:end]
+            self.pos = end
+
+            return line
+
+        # join the parts of long lines once
+        parts = [self.buf[self.pos:]]
+        self.buf, self.pos = "", 0
+
+        for chunk in self.chunks:
+            end = chunk.find("\n") + 1
+
+            if end:
+                parts.append(chunk[:end])
+                self.buf, self.pos = chunk, end
+
+                return "".join(parts)
+
+            parts.append(chunk)
+
+        self.done = True
+
+        return "".join(parts)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        '''return the next line'''
+        line = self.readline()
+
+        if not line:
+            raise StopIteration()
+
+        return line
+
+class JsonItems(object):
+    '''iterate over the json values in a stream decoding one at a time
+
+    top level lists are not decoded as a whole, their items are returned one
+    by one, any other top level value (like the lines of newline delimited
+    json) is returned as is, a malformed list raises ValueError when it's
+    reached, after its previous items were returned'''
+
+    def __init__(self, stream, read_size=READ_SIZE):
+        self.stream = stream
+        self.read_size = read_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def __iter__(self):
+        in_list = False
+        # in a list, True if the last thing read was an item
+        after_item = False
+        # in a list, True if the last thing read was the opening or a comma
+        # and a value must follow, the opening may be followed by the end
+        expect_item = False
+
+        while True:
+            self.skip_whitespace()
+
+            if self.pos >= len(self.buf):
+                if in_list:
+                    raise ValueError("unterminated list in input")
+
+                return
+
+            char = self.buf[self.pos]
+
+            if not in_list:
+                if char == "[":
+                    self.pos += 1
+                    in_list = True
+                    after_item = expect_item = False
+                else:
+                    yield self.decode()
+            elif char == "]" and not expect_item:
+                self.pos += 1
+                in_list = False
+            elif char == "," and after_item:
+                self.pos += 1
+                after_item, expect_item = False, True
+            elif after_item:
+                raise ValueError("expected ',' or ']' in list at: %s" %
+                        self.near())
+            elif char in ",]":
+                raise ValueError("expected an item in list at: %s" %
+                        self.near())
+            else:
+                yield self.decode()
+                after_item, expect_item = True, False
+
+    def near(self, size=20):
+        '''return the text at the current position to show in errors'''
+        return self.buf[self.pos:self.pos + size].split("\n")[0]
+
+    def read(self, size=None):
+        '''read more data into the buffer, return False at end of file'''
+        if self.eof:
+            return False
+
+        if self.pos > self.read_size and self.pos * 2 > len(self.buf):
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+
+        data = self.stream.read(size or self.read_size)
+
+        if not data:
+            self.eof = True
+            return False
+
+        self.buf += data
+        return True
+
+    def skip_whitespace(self):
+        '''move to the next non whitespace character reading if needed'''
+        while True:
+            self.pos = JSON_WHITESPACE.match(self.buf, self.pos).end()
+
+            if self.pos < len(self.buf) or not self.read():
+                return
+
+    def decode(self):
+        '''decode the value at the current position'''
+        while True:
+            try:
+                value, end = JSON_DECODER.raw_decode(self.buf, self.pos)
+            except ValueError:
+                # incomplete value, read at least as much as we have
+                size = max(self.read_size, len(self.buf) - self.pos)
+
+                if not self.read(size):
+                    raise
+            else:
+                # a number at the end of the buffer may continue after it
+                if end < len(self.buf) or not self.read():
+                    self.pos = end
+                    return value
+
+def iter_json(stream, read_size=READ_SIZE):
+    '''return an iterator over the json values in *stream*, see JsonItems'''
+    return iter(JsonItems(stream, read_size))
+
+def iter_json_file(path, read_size=READ_SIZE):
+    '''yield the json values in the file at *path*, see JsonItems'''
+    with open(path) as handle:
+        for item in JsonItems(handle, read_size):
+            yield item
@@ -0,0 +1,484 @@
+'''run a DAG of commands described in json
+
+    {
+        "stages": [
+            {"id": "rows", "command": "from-csv", "args": ["-i"],
+                "input": "$stdin"},
+            {"id": "groups", "command": "groupby", "from": "rows",
+                "args": ["-k", "g"]},
+            {"id": "unique", "command": "set", "from": "rows"},
+            {"id": "report", "command": "echo", "from": ["groups", "unique"]}
+        ],
+        "output": "report"
+    }
+
+a stage with "input" set to "$stdin" reads the raw workflow input as if it
+was its stdin, with other "input" it gets that value and without "from" or
+"input" it gets an empty input, a stage with a list in "from" gets a list
+with the output of each upstream stage. output can be a stage id or a list
+of them, by default the stages no other stage reads from are the output
+
+the workflow input is only read once a stage reads it, and not after all
+the stages that take it are done, so a workflow that doesn't use it doesn't
+wait for it
+
+every stage runs in its own thread, streamed outputs are passed in batches
+of items through bounded queues so a slow consumer makes its producer wait,
+the same items are passed to all the consumers without copying them, only
+commands that modify their input in place get a shallow copy'''
+import copy
+import threading
+
+from cStringIO import StringIO
+from collections import deque
+
+import util
+
+from command import Result, Stream, TextStream
+
+# maximum messages waiting in an edge
+DEFAULT_QUEUE_SIZE = 16
+
+# items sent in a message
+BATCH_SIZE = 256
+
+# bytes of the workflow input sent at a time
+CHUNK_SIZE = 64 * 1024
+
+# input of the stages that read the workflow input
+STDIN = "$stdin"
+
+VALUE = "value"
+ITEM = "item"
+END = "end"
+
+class Stage(object):
+    '''a command invocation in a workflow'''
+
+    def __init__(self, data):
+        if not isinstance(data, dict):
+            raise ValueError("expected object for stage, got: %s" % data)
+
+        self.id = data.get("id")
+        self.command = data.get("command")
+
+        if not self.id or not self.command:
+            raise ValueError("expected id and command in stage: %s" % data)
+
+        self.args = data.get("args", {})
+        sources = data.get("from")
+
+        if sources is None:
+            self.sources = []
+            self.fan_in = False
+        elif isinstance(sources, list):
+            self.sources = sources
+            self.fan_in = True
+        else:
+            self.sources = [sources]
+            self.fan_in = False
+
+        self.input = data.get("input")
+        self.reads_stdin = self.input == STDIN
+        self.has_input = "input" in data and not self.reads_stdin
+
+class Edge(object):
+    '''bounded channel from a stage to one of its consumers, items are sent
+    in batches to reduce the locking'''
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, shared=False):
+        self.messages = deque()
+        self.queue_size = queue_size
+        self.cond = threading.Condition()
+        self.closed = False
+        # True if the producer output goes to more than one consumer
+        self.shared = shared
+
+    def put(self, message):
+        '''put *message* waiting for room, drop it if the consumer is done'''
+        with self.cond:
+            while len(self.messages) >= self.queue_size and not self.closed:
+                self.cond.wait()
+
+            if not self.closed:
+                self.messages.append(message)
+                self.cond.notify_all()
+
+    def get(self):
+        '''wait for a message and return it'''
+        with self.cond:
+            while not self.messages:
+                self.cond.wait()
+
+            message = self.messages.popleft()
+            self.cond.notify_all()
+
+            return message
+
+    def close(self):
+        '''mark that the consumer won't read anymore'''
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def abort(self):
+        '''close the edge and end it for the consumer, on errors'''
+        with self.cond:
+            self.closed = True
+            self.messages.append((END, None))
+            self.cond.notify_all()
+
+    def items(self):
+        '''yield the streamed items until the end'''
+        while True:
+            kind, payload = self.get()
+
+            if kind == END:
+                return
+
+            for item in payload:
+                yield item
+
+    def get_input(self, mutates=False):
+        '''wait for the producer and return its value or an iterator over its
+        items, a shallow copy of a shared value if *mutates* is True'''
+        kind, payload = self.get()
+
+        if kind == VALUE:
+            if mutates and self.shared:
+                return copy.copy(payload)
+
+            return payload
+        elif kind == END:
+            return iter([])
+        else:
+            return self.chain(payload)
+
+    def reader(self):
+        '''return a file like object to read the streamed chunks'''
+        return util.ChunkReader(self.items())
+
+    def chain(self, batch):
+        '''yield the items of *batch* and then the rest of the items'''
+        for item in batch:
+            yield item
+
+        for item in self.items():
+            yield item
+
+def collect(value):
+    '''return *value* as a plain value, consuming iterators'''
+    if util.is_iterator(value):
+        return list(value)
+
+    return value
+
+def gather(edges, mutates=False):
+    '''return the list of values sent to *edges*, they are collected at the
+    same time since they may come from the same producer'''
+    values = [None] * len(edges)
+
+    def collect_edge(index):
+        '''collect the value sent to one edge'''
+        values[index] = collect(edges[index].get_input(mutates))
+
+    threads = [threading.Thread(target=collect_edge, args=(index,))
+            for index in range(len(edges))]
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return values
+
+def send_chunks(edges, stream):
+    '''send the raw content of *stream* to the consumers'''
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+
+        if not chunk:
+            break
+
+        for edge in edges:
+            edge.put((ITEM, [chunk]))
+
+        # stop reading once every stage that takes the input is done
+        if all(edge.closed for edge in edges):
+            return
+
+    for edge in edges:
+        edge.put((END, None))
+
+class InputReader(object):
+    '''file like object for a stage that reads the workflow input from
+    *edge*, *start* is called the first time it's read to start sending the
+    input'''
+
+    def __init__(self, edge, start):
+        self.edge = edge
+        self.start = start
+        self.reader = None
+
+    def open(self):
+        '''return the reader of the edge, starting the input'''
+        if self.reader is None:
+            self.start()
+            self.reader = self.edge.reader()
+
+        return self.reader
+
+    def read(self, size=-1):
+        '''read up to *size* bytes'''
+        return self.open().read(size)
+
+    def readline(self):
+        '''read a line'''
+        return self.open().readline()
+
+    def __iter__(self):
+        return iter(self.open())
+
+def send(edges, value):
+    '''send a command result to the consumers'''
+    if isinstance(value, TextStream):
+        value = "".join(value)
+
+    if isinstance(value, Stream):
+        batch = []
+
+        for item in value:
+            batch.append(item)
+
+            if len(batch) == BATCH_SIZE:
+                for edge in edges:
+                    edge.put((ITEM, batch))
+
+                batch = []
+
+                # stop producing if no consumer reads anymore
+                if all(edge.closed for edge in edges):
+                    return
+
+        for edge in edges:
+            if batch:
+                edge.put((ITEM, batch))
+
+            edge.put((END, None))
+    else:
+        for edge in edges:
+            edge.put((VALUE, value))
+
+class Workflow(object):
+    '''a validated DAG of stages'''
+
+    def __init__(self, data, lookup, vars_=None,
+            queue_size=DEFAULT_QUEUE_SIZE):
+        if not isinstance(data, dict):
+            raise ValueError("expected workflow object, got: %s" % data)
+
+        stages = data.get("stages")
+
+        if not isinstance(stages, list) or not stages:
+            raise ValueError("expected a list of stages")
+
+        self.stages = [Stage(stage) for stage in stages]
+        self.by_id = {}
+        self.lookup = lookup
+        self.vars = vars_ if vars_ is not None else {}
+        self.queue_size = queue_size
+
+        for stage in self.stages:
+            if stage.id in self.by_id:
+                raise ValueError("duplicated stage id: %s" % stage.id)
+
+            if lookup(stage.command) is None:
+                raise ValueError("command %s not found in stage %s" % (
+                    stage.command, stage.id))
+
+            self.by_id[stage.id] = stage
+
+        for stage in self.stages:
+            for source in stage.sources:
+                if source not in self.by_id:
+                    raise ValueError("stage %s reads from unknown stage %s" %
+                            (stage.id, source))
+
+        self.check_acyclic()
+        self.outputs = self.get_outputs(data.get("output"))
+
+    def check_acyclic(self):
+        '''raise ValueError if the stages have a cycle'''
+        state = {}
+
+        def visit(stage_id, path):
+            '''depth first search from *stage_id*'''
+            if state.get(stage_id) == "done":
+                return
+            elif state.get(stage_id) == "visiting":
+                raise ValueError("cycle in stages: %s" % " -> ".join(
+                    path + [stage_id]))
+
+            state[stage_id] = "visiting"
+
+            for source in self.by_id[stage_id].sources:
+                visit(source, path + [stage_id])
+
+            state[stage_id] = "done"
+
+        for stage in self.stages:
+            visit(stage.id, [])
+
+    def get_outputs(self, output):
+        '''return the list of output stage ids and if the result is a single
+        value'''
+        if output is None:
+            read = set(source for stage in self.stages
+                    for source in stage.sources)
+            ids = [stage.id for stage in self.stages if stage.id not in read]
+            return ids, len(ids) == 1
+        elif isinstance(output, list):
+            ids, single = output, False
+        else:
+            ids, single = [output], True
+
+        for stage_id in ids:
+            if stage_id not in self.by_id:
+                raise ValueError("unknown output stage %s" % stage_id)
+
+        return ids, single
+
+    @property
+    def reads_input(self):
+        '''True if some stage gets the workflow input'''
+        return any(stage.reads_stdin for stage in self.stages)
+
+    def connect(self):
+        '''return the edges into each stage by source and the edges out of
+        each stage, the workflow input is the None source'''
+        consumers = {}
+
+        for stage in self.stages:
+            if stage.sources:
+                for source in stage.sources:
+                    consumers.setdefault(source, []).append(stage.id)
+            elif stage.reads_stdin:
+                consumers.setdefault(None, []).append(stage.id)
+
+        output_ids, _ = self.outputs
+
+        for stage_id in output_ids:
+            consumers.setdefault(stage_id, []).append(None)
+
+        inputs = {}
+        outputs = {}
+
+        for source, targets in consumers.iteritems():
+            for target in targets:
+                edge = Edge(self.queue_size, len(targets) > 1)
+                inputs.setdefault(target, {})[source] = edge
+                outputs.setdefault(source, []).append(edge)
+
+        return inputs, outputs
+
+    def run(self, open_input=None):
+        '''run the workflow and return a Result with the output, the raw
+        input is read from the file like object open_input() returns, it's
+        only called if a stage reads the input'''
+        inputs, outputs = self.connect()
+        errors = []
+        threads = []
+        pumping = []
+        lock = threading.Lock()
+
+        def fail(stage_id, reason, status=Result.ERROR):
+            '''record the error and unblock every stage'''
+            errors.append((stage_id, status, reason))
+
+            for edges in outputs.values():
+                for edge in edges:
+                    edge.abort()
+
+        def stage_input(stage):
+            '''return the input of *stage*'''
+            cls = self.lookup(stage.command)
+            edges = inputs.get(stage.id, {})
+
+            if stage.has_input:
+                return dict(input=stage.input)
+            elif stage.reads_stdin:
+                return dict(stream=InputReader(edges[None], start_pump))
+            elif not stage.sources:
+                return dict(stream=StringIO(""))
+            elif not stage.fan_in:
+                source = stage.sources[0]
+                return dict(input=edges[source].get_input(cls.MUTATES_INPUT))
+
+            return dict(input=gather([edges[source]
+                for source in stage.sources], cls.MUTATES_INPUT))
+
+        def run_stage(stage):
+            '''run a stage and send its output to its consumers'''
+            cls = self.lookup(stage.command)
+
+            try:
+                args = stage.args
+
+                if isinstance(args, list):
+                    args = cls.parse_args([unicode(arg) for arg in args])
+
+                data = stage_input(stage)
+                data.update(name=stage.command, args=args, vars=self.vars)
+                result = cls.invoke(data)
+
+                if result.status != Result.OK:
+                    fail(stage.id, result.reason, result.status)
+                    return
+
+                send(outputs.get(stage.id, []), result.result)
+            except Exception as error:
+                fail(stage.id, str(error))
+            finally:
+                for edge in inputs.get(stage.id, {}).values():
+                    edge.close()
+
+        def pump():
+            '''send the workflow input to the stages that read it'''
+            try:
+                send_chunks(outputs[None], open_input())
+            except Exception as error:
+                fail("input", str(error))
+
+        def start_pump():
+            '''start sending the input the first time a stage reads it, it
+            isn't joined since it may wait for input no stage needs'''
+            with lock:
+                if not pumping:
+                    thread = threading.Thread(target=pump)
+                    thread.daemon = True
+                    thread.start()
+                    pumping.append(thread)
+
+        for stage in self.stages:
+            threads.append(threading.Thread(target=run_stage, args=(stage,)))
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        output_ids, single = self.outputs
+        results = gather([inputs[None][stage_id] for stage_id in output_ids])
+
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            stage_id, status, reason = errors[0]
+            return Result(None, status, "stage %s: %s" % (stage_id, reason))
+
+        if single:
+            return Result.ok(results[0])
+        else:
+            return Result.ok(dict(zip(output_ids, results)))